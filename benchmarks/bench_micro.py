@@ -0,0 +1,222 @@
+"""
+Микробенчмарки функций, которые вызываются на каждую статью или на каждый символ
+текста: is_js_stub, extract_date, get_domain_rating, analyze_title_sentiment,
+разметка карточки (colorize_rating, ai_preview), clean_text_for_pdf, clean_markdown.
+
+    python benchmarks/bench_micro.py                 # сравнить с сохраненными базовыми значениями
+    python benchmarks/bench_micro.py --update        # записать новые случаи и ускорения
+    python benchmarks/bench_micro.py --only is_js_stub --tolerance 0.5
+    python benchmarks/bench_micro.py --accept-slower "analyze_title_sentiment[x1000]"
+
+Работает офлайн: фикстуры (большая кириллическая страница новости, длинные
+ответы AI, списки URL и заголовков) собираются детерминированно в памяти.
+
+Базовые значения хранятся не в микросекундах, а в долях от калибровочного
+цикла на чистом Python, который прогоняется до и после каждого замера: так они
+переносимы между машинами. Код выхода 1, если какая-то функция медленнее
+базы больше чем на --tolerance (по умолчанию 50%; на общих CI-машинах
+разброс между прогонами доходит до 20%).
+
+--update базу только ужесточает: добавляет новые случаи и снижает значения
+тех, что стали быстрее, а замедление по-прежнему дает код выхода 1. Поднять
+базу можно только явно, --accept-slower с именами случаев, — и с объяснением
+причины в коммите.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bs4 import BeautifulSoup
+from loguru import logger
+
+from page_utils import (
+    is_js_stub, extract_date, get_domain_rating, analyze_title_sentiment, colorize_rating, ai_preview
+)
+from report_generator import clean_text_for_pdf, clean_markdown
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "micro_baselines.json")
+WORDS = (
+    "правительство заявило новые меры поддержки регионов после заседания комиссии министр "
+    "сообщил журналистам что решение вступит силу течение месяца эксперты оценили последствия "
+    "для экономики рынка труда данным статистики отчете говорится росте расходов бюджета "
+    "інфраструктуру транспорт представники опозиції розкритикували законопроект"
+).split()
+DOMAINS = (
+    "bbc.com", "www.reuters.com", "edition.cnn.com", "ria.ru", "m.ria.ru", "pravda.com.ua",
+    "news.example.org", "t.me", "youtube.com", "myblog.blogspot.com", "www.nv.ua", "lenta.ru",
+)
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def news_page(rng: random.Random, date_in_meta_only: bool = False) -> str:
+    """~300 КБ: меню, скрипты, статья на 60 абзацев, комментарии; дата в <time> или только в meta."""
+    nav = "".join(f'<li><a href="/rubric/{i}">{rng.choice(WORDS).capitalize()}</a></li>' for i in range(300))
+    scripts = "".join(f"<script>window.__data{i} = {json.dumps({'k': sentence(rng, 20)})};</script>" for i in range(40))
+    body = "".join(f"<p>{sentence(rng, rng.randint(40, 90))}</p>\n" for _ in range(60))
+    comments = "".join(f'<div class="comment"><b>Гость {i}</b><p>{sentence(rng, 25)}</p></div>' for i in range(150))
+    time_tag = "" if date_in_meta_only else '<time datetime="2025-03-14T09:30:00+02:00">14 марта</time>'
+    meta = '<meta property="og:published_time" content="2025-03-14T09:30:00+02:00">' if date_in_meta_only else ""
+    return (
+        f"<!DOCTYPE html><html lang=\"ru\"><head><meta charset=\"utf-8\"><title>{sentence(rng, 10)}</title>"
+        f"{scripts}</head><body><header><ul>{nav}</ul></header>"
+        f"<article><h1>{sentence(rng, 10)}</h1>{time_tag}{body}</article>"
+        f"<section id=\"comments\">{comments}</section>{meta}</body></html>"
+    )
+
+
+def ai_output(rng: random.Random, sections: int = 30) -> str:
+    """Длинный ответ Gemini в Markdown: заголовки, жирный, списки, эмодзи и кавычки-«елочки»."""
+    parts = ["```markdown", f"SCORE: {rng.randint(10, 95)}%"]
+    for i in range(sections):
+        parts.append(f"### {i + 1}. {sentence(rng, 5)} 🔍")
+        for _ in range(4):
+            parts.append(f"- **{rng.choice(WORDS)}**: «{sentence(rng, 20)}» — {sentence(rng, 15)}…")
+    parts.append("```")
+    return "\n".join(parts)
+
+
+def build_fixtures() -> dict:
+    rng = random.Random(42)
+    titles = [sentence(rng, 10) for _ in range(850)]
+    titles += ["ШОК! " + sentence(rng, 8) for _ in range(50)]
+    titles += [f"Вы не поверите: {sentence(rng, 6)} — все подробности" for _ in range(50)]
+    titles += [sentence(rng, 8).upper() for _ in range(50)]
+    rng.shuffle(titles)
+    page = news_page(rng)
+    meta_page = news_page(rng, date_in_meta_only=True)
+    stub = "<html><head><title>Проверка браузера</title></head><body>" + \
+        "<noscript>Please enable JavaScript to continue. Включите JavaScript.</noscript>" * 8 + "</body></html>"
+    ai_texts = [ai_output(rng) for _ in range(5)]
+    return {
+        'page': page,
+        'article_text': BeautifulSoup(page, 'lxml').article.get_text("\n"),
+        'stub': stub,
+        'soup_time': BeautifulSoup(page, 'lxml'),
+        'soup_meta': BeautifulSoup(meta_page, 'lxml'),
+        'urls': [f"https://{rng.choice(DOMAINS)}/news/{i}?utm_source=x" for i in range(1000)],
+        'titles': titles,
+        'ratings': [
+            f"Рейтинг: {rng.choice(['Высокое доверие', 'Неизвестен', 'Низкое доверие / Пропаганда'])}"
+            f"{rng.choice(['', ' (Кликбейт: Пунктуация)'])} | AI: {rng.randint(0, 100)}%"
+            for _ in range(1000)
+        ],
+        'ai_texts': ai_texts,
+        'ai_text': ai_texts[0],
+    }
+
+
+def build_cases(fx: dict) -> dict:
+    """Имя -> функция без аргументов. Списочные случаи меряют проход по 1000 элементам."""
+    return {
+        'is_js_stub[page 300KB]': lambda: is_js_stub(fx['page']),
+        'is_js_stub[stub]': lambda: is_js_stub(fx['stub']),
+        'extract_date[time tag]': lambda: extract_date(fx['soup_time']),
+        'extract_date[meta only]': lambda: extract_date(fx['soup_meta']),
+        'get_domain_rating[x1000]': lambda: [get_domain_rating(u) for u in fx['urls']],
+        'analyze_title_sentiment[x1000]': lambda: [analyze_title_sentiment(t) for t in fx['titles']],
+        'analyze_title_sentiment[article]': lambda: analyze_title_sentiment(fx['titles'][0], fx['article_text']),
+        'colorize_rating[x1000]': lambda: [colorize_rating(r) for r in fx['ratings']],
+        'ai_preview[x5]': lambda: [ai_preview(t) for t in fx['ai_texts']],
+        'clean_text_for_pdf[ai output]': lambda: clean_text_for_pdf(fx['ai_text']),
+        'clean_markdown[ai output]': lambda: clean_markdown(fx['ai_text']),
+    }
+
+
+def calibrate() -> float:
+    """Эталонная нагрузка на строках и словарях: знаменатель для базовых значений."""
+    rng = random.Random(0)
+    words = [rng.choice(WORDS) for _ in range(2000)]
+
+    def work():
+        counts = {}
+        for w in words:
+            key = w.lower().replace("а", "a")
+            counts[key] = counts.get(key, 0) + 1
+        return " ".join(sorted(counts))
+
+    return measure(work)
+
+
+def measure(func, repeat: int = 5) -> float:
+    """Лучшее время одного вызова (секунды) из repeat серий по ~0.2 сек."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def load_baselines() -> dict:
+    if not os.path.exists(BASELINES_PATH):
+        return {}
+    with open(BASELINES_PATH, encoding="utf-8") as f:
+        return json.load(f).get('cases', {})
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Микробенчмарки горячих функций разбора и отчета")
+    arg_parser.add_argument('--update', action='store_true', help="Записать новые случаи и ускорения в базу")
+    arg_parser.add_argument('--accept-slower', nargs='+', default=[], metavar='CASE',
+                            help="Поднять базу для этих случаев до текущих значений (замедление принято)")
+    arg_parser.add_argument('--tolerance', type=float, default=0.5, help="Допустимое замедление (0.5 = 50%%)")
+    arg_parser.add_argument('--only', type=str, help="Мерить только случаи, содержащие подстроку")
+    args = arg_parser.parse_args()
+
+    # Меряем сами функции, а не вывод debug-логов в терминал
+    logger.remove()
+
+    cases = build_cases(build_fixtures())
+    if args.only:
+        cases = {name: func for name, func in cases.items() if args.only in name}
+    baselines = load_baselines()
+
+    print(f"{'случай':<32} {'µs/вызов':>12} {'норм.':>9} {'база':>9} {'Δ':>8}")
+    current, regressions = {}, []
+    for name, func in cases.items():
+        # Калибровка рядом с каждым замером: соседи по машине и частота CPU
+        # влияют на оба числа одинаково и сокращаются в отношении
+        unit = calibrate()
+        seconds = measure(func)
+        normalized = seconds / min(unit, calibrate())
+        current[name] = round(normalized, 4)
+        base = baselines.get(name)
+        if base:
+            delta = normalized / base - 1
+            flag = "  ❌" if delta > args.tolerance else ""
+            if flag:
+                regressions.append(name)
+            print(f"{name:<32} {seconds * 1e6:>12.1f} {normalized:>9.3f} {base:>9.3f} {delta:>+7.0%}{flag}")
+        else:
+            print(f"{name:<32} {seconds * 1e6:>12.1f} {normalized:>9.3f} {'—':>9}")
+
+    unknown = [name for name in args.accept_slower if name not in current]
+    if unknown:
+        print(f"\nНет таких случаев среди измеренных: {', '.join(unknown)}")
+        sys.exit(2)
+    if args.update or args.accept_slower:
+        merged = dict(baselines)
+        for name, value in current.items():
+            if name not in merged or value < merged[name] or name in args.accept_slower:
+                merged[name] = value
+        regressions = [name for name in regressions if name not in args.accept_slower]
+        with open(BASELINES_PATH, "w", encoding="utf-8") as f:
+            json.dump({'unit': "время вызова / калибровочный цикл", 'cases': merged}, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"\nБазовые значения сохранены: {BASELINES_PATH}")
+
+    if regressions:
+        print(f"\nЗамедление больше {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    if not baselines:
+        print("\nБазовых значений нет: запустите с --update")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Бенчмарк генерации PDF-отчета на 100 статей.
+
+    python benchmarks/bench_pdf.py --articles 100 --runs 5
+
+Первый прогон включает разбор TTF (холодный кеш шрифтов), остальные — повторное
+использование метрик и подмножеств глифов внутри процесса.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report_generator import create_pdf
+
+AI_TEXT = (
+    "SCORE: 72%\n"
+    "### Причины оценки\n"
+    "1. **Источник** ссылается на официальные данные Минфина и НБУ — «курс доллара» вырос на 1,2%.\n"
+    "2. Признаки манипуляций: эмоциональные эпитеты, ссылки на анонимных экспертов…\n"
+    "3. Вердикт: материал в целом достоверен, но заголовок преувеличивает масштаб события.\n"
+)
+
+
+def make_articles(count: int) -> list[dict]:
+    ratings = [
+        "Рейтинг: Высокое доверие | AI: 85%",
+        "Рейтинг: Низкое доверие / Пропаганда (Кликбейт: Триггер-слово) | AI: 20%",
+        "Рейтинг: Платформа (Не СМИ) | AI: 55%",
+        "Рейтинг: Неизвестен",
+    ]
+    return [
+        {
+            'url': f"https://www.news-{i % 17}.example.com/2025/12/{i}/article-about-economy",
+            'title': f"Новость №{i}: правительство обсуждает бюджет — «главное за день»",
+            'rating': ratings[i % len(ratings)],
+            'ai_analysis': AI_TEXT,
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк create_pdf")
+    arg_parser.add_argument('--articles', type=int, default=100)
+    arg_parser.add_argument('--runs', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    articles = make_articles(args.articles)
+    cross_check = "## Сводка\n" + "**Источники** расходятся в цифрах. " * 40
+
+    timings = []
+    size = 0
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        size = len(create_pdf("Бюджет Украины 2026", articles, cross_check))
+        timings.append(time.perf_counter() - t0)
+
+    print(f"Статей:        {args.articles}, размер PDF: {size / 1024:.0f} КБ")
+    print(f"Холодный:      {timings[0] * 1000:.0f} мс")
+    if len(timings) > 1:
+        print(f"Теплый (медиана): {statistics.median(timings[1:]) * 1000:.0f} мс")
+
+
+if __name__ == "__main__":
+    main()
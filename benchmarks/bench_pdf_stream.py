@@ -0,0 +1,80 @@
+"""
+Бенчмарк больших отчетов: create_pdf (весь документ в памяти) против
+create_pdf_stream (постраничная запись в файл), плюс очистка текста для PDF.
+
+    python benchmarks/bench_pdf_stream.py --articles 5000
+
+Каждый режим запускается в отдельном процессе, чтобы пиковый RSS не смешивался.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pdf import make_articles
+
+
+def iter_articles(count: int):
+    # Генератор, как при чтении архива из базы порциями
+    for chunk_start in range(0, count, 1000):
+        yield from make_articles(min(1000, count - chunk_start))
+
+
+def run_mode(mode: str, count: int):
+    from report_generator import create_pdf, create_pdf_stream
+
+    t0 = time.perf_counter()
+    if mode == "memory":
+        size = len(create_pdf("Архив", make_articles(count)))
+    else:
+        with tempfile.TemporaryFile() as f:
+            create_pdf_stream("Архив", iter_articles(count), f)
+            size = f.tell()
+    elapsed = time.perf_counter() - t0
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode:<8} {elapsed:8.1f} с  {size / 1024 / 1024:7.1f} МБ  пик RSS {peak_mb:7.0f} МБ")
+
+
+def bench_cleaning():
+    from report_generator import clean_text_for_pdf
+
+    def legacy(text):
+        cleaned = "".join(c for c in text if ord(c) < 65536)
+        for old, new in {"–": "-", "—": "-", "“": '"', "”": '"', "«": '"', "»": '"', "…": "..."}.items():
+            cleaned = cleaned.replace(old, new)
+        return cleaned
+
+    text = ("Правительство — «главное» за день… 🔥 Экономика “растет” – эксперты. " * 200)
+    assert legacy(text) == clean_text_for_pdf(text)
+    n = 200
+    old_t = timeit.timeit(lambda: legacy(text), number=n) / n
+    new_t = timeit.timeit(lambda: clean_text_for_pdf(text), number=n) / n
+    print(f"clean_text_for_pdf ({len(text)} символов): было {old_t * 1e6:.0f} мкс, стало {new_t * 1e6:.0f} мкс")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк потокового PDF")
+    arg_parser.add_argument('--articles', type=int, default=5000)
+    arg_parser.add_argument('--mode', choices=["memory", "stream"], help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.articles)
+        return
+
+    bench_cleaning()
+    print(f"Статей: {args.articles}")
+    for mode in ("stream", "memory"):
+        subprocess.run([sys.executable, __file__, "--articles", str(args.articles), "--mode", mode], check=True)
+
+
+if __name__ == "__main__":
+    main()
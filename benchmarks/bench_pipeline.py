@@ -0,0 +1,358 @@
+"""
+Офлайн-бенчмарк конвейера поиск -> run_parser без Google, живых сайтов и Gemini.
+
+    python benchmarks/bench_pipeline.py                           # 10, 100 и 1000 URL
+    python benchmarks/bench_pipeline.py --sizes 10 100 --gemini-latency 1.5 --gemini-429 0.05
+    python benchmarks/bench_pipeline.py --corpus saved_pages/      # свои сохраненные .html вместо синтетики
+
+Скрипт поднимает локально:
+  * корпус новостных страниц (синтетический или из --corpus) со смесью случаев:
+    обычные страницы, медленные ответы, JS-заглушки (первый запрос получает
+    заглушку, повторный — полную страницу, как после JS-проверки), 5xx и
+    HTTPS с самоподписанным сертификатом на чужое имя;
+  * фейковый Custom Search (SEARCH_API_URL), выдающий ссылки на корпус;
+  * фейковый Gemini (GEMINI_API_URL) с задержкой и долей ответов 429.
+
+Каждый размер прогоняется в отдельном процессе с чистой рабочей папкой (своя
+SQLite-база и chroma_db): процесс делает тот же путь, что main.py -q,
+и возвращает время по этапам (telemetry), RSS и CPU. Время загрузки моделей
+(импорт page_parser) считается отдельно и в wall time не входит.
+
+Внимание: на 429 код ждет 20+ секунд перед повтором, поэтому --gemini-429
+заметно растягивает прогон — это и есть то, что меряется.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Доли случаев в корпусе, в процентах
+MIX = (("ok", 70), ("slow", 10), ("tls", 10), ("js", 5), ("error", 5))
+WORDS = (
+    "правительство заявило новые меры поддержки регионов после заседания комиссии "
+    "министр сообщил журналистам что решение вступит в силу в течение месяца "
+    "эксперты оценили последствия для экономики и рынка труда по данным статистики "
+    "в отчете говорится о росте расходов бюджета на инфраструктуру и транспорт "
+    "представители оппозиции раскритиковали законопроект назвав его поспешным"
+).split()
+JS_STUB = "<html><head><title>Проверка</title></head><body>Please enable JavaScript to continue.</body></html>"
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def page_kind(index: int) -> str:
+    bucket = zlib.crc32(str(index).encode()) % 100
+    for kind, share in MIX:
+        if bucket < share:
+            return kind
+        bucket -= share
+    return "ok"
+
+
+def synthetic_page(index: int) -> str:
+    rng = random.Random(index)
+    title = " ".join(rng.choice(WORDS) for _ in range(8)).capitalize()
+    paragraphs = "".join(
+        "<p>" + " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 80))).capitalize() + ".</p>\n"
+        for _ in range(rng.randint(5, 10))
+    )
+    day = 1 + index % 28
+    return f"""<!DOCTYPE html>
+<html lang="ru"><head><meta charset="utf-8"><title>{title}</title>
+<meta property="article:published_time" content="2025-03-{day:02d}T10:00:00+00:00"></head>
+<body><header><nav><a href="/">Главная</a> <a href="/news">Новости</a></nav></header>
+<article><h1>{title}</h1><time datetime="2025-03-{day:02d}T10:00:00+00:00">{day} марта 2025</time>
+{paragraphs}</article><footer>© Bench News</footer></body></html>"""
+
+
+class NewsCorpus:
+    """Страницы корпуса и их поведение; поведение зависит только от номера страницы."""
+
+    def __init__(self, corpus_dir: str | None, slow_delay: float):
+        self.slow_delay = slow_delay
+        self.recorded = []
+        if corpus_dir:
+            names = sorted(n for n in os.listdir(corpus_dir) if n.endswith((".html", ".htm")))
+            for name in names:
+                with open(os.path.join(corpus_dir, name), encoding="utf-8", errors="replace") as f:
+                    self.recorded.append(f.read())
+            if not self.recorded:
+                raise SystemExit(f"В {corpus_dir} нет .html файлов")
+        self.requests: dict[int, int] = {}
+        self.calls: dict[str, int] = {}
+
+    def page(self, index: int) -> str:
+        if self.recorded:
+            return self.recorded[index % len(self.recorded)]
+        return synthetic_page(index)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        index = int(request.match_info['index'])
+        kind = page_kind(index)
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+        seen = self.requests.get(index, 0)
+        self.requests[index] = seen + 1
+
+        if kind == "slow":
+            await asyncio.sleep(self.slow_delay * random.uniform(0.5, 1.5))
+        elif kind == "error":
+            return web.Response(status=(500, 502, 503)[index % 3], text="upstream error")
+        elif kind == "js" and seen == 0:
+            return web.Response(text=JS_STUB, content_type="text/html")
+        return web.Response(text=self.page(index), content_type="text/html")
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/news/{index:\\d+}", self.handle)
+        return app
+
+
+class FakeSearch:
+    """Отвечает в формате Custom Search JSON API ссылками на корпус."""
+
+    def __init__(self, http_base: str, https_base: str | None, latency: float):
+        self.http_base = http_base
+        self.https_base = https_base
+        self.latency = latency
+
+    async def handle(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency)
+        num = int(request.query.get('num', 10))
+        offset = zlib.crc32(request.query.get('q', '').encode()) % 100000 * 10
+        items = []
+        for index in range(offset, offset + num):
+            https = page_kind(index) == "tls" and self.https_base
+            base = self.https_base if https else self.http_base
+            items.append({"link": f"{base}/news/{index}", "title": f"Новость {index}", "snippet": ""})
+        return web.json_response({"kind": "customsearch#search", "items": items})
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/customsearch/v1", self.handle)
+        return app
+
+
+class FakeGemini:
+    """Минимальный generativelanguage API: generateContent и streamGenerateContent (SSE)."""
+
+    def __init__(self, latency: float, rate_429: float):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.calls = 0
+        self.rejected = 0
+        self.active = 0
+        self.max_active = 0
+
+    @staticmethod
+    def _answer(text: str) -> dict:
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": 1000, "candidatesTokenCount": len(text) // 4},
+        }
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.calls += 1
+        if random.random() < self.rate_429:
+            self.rejected += 1
+            return web.json_response(
+                {"error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}},
+                status=429
+            )
+        await request.read()
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.latency * random.uniform(0.7, 1.3))
+        finally:
+            self.active -= 1
+
+        text = f"SCORE: {random.randint(20, 95)}%\n1. Причины оценки: тестовый ответ.\n2. Манипуляций нет.\n3. Вердикт: нейтрально."
+        if request.match_info['target'].endswith(":streamGenerateContent"):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            for line in text.split("\n"):
+                await response.write(f"data: {json.dumps(self._answer(line + chr(10)))}\r\n\r\n".encode())
+            await response.write_eof()
+            return response
+        return web.json_response(self._answer(text))
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=20 * 1024 * 1024)
+        app.router.add_post("/{version}/models/{target}", self.handle)
+        return app
+
+
+def make_certificate(workdir: str):
+    """Самоподписанный сертификат на чужое имя: curl_cffi и httpx в парсере работают с verify=False."""
+    if not shutil.which("openssl"):
+        return None
+    cert, key = os.path.join(workdir, "cert.pem"), os.path.join(workdir, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", key, "-out", cert, "-subj", "/CN=bench.invalid"],
+        check=True, capture_output=True
+    )
+    import ssl
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+async def start_app(app: web.Application, port: int, ssl_context=None) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port, ssl_context=ssl_context).start()
+    return runner
+
+
+def run_child(size: int, query: str, out_path: str):
+    """Выполняется в отдельном процессе: тот же путь, что у main.py -q <query> -n <size>."""
+    sys.path.insert(0, ROOT)
+    t0 = time.perf_counter()
+    import telemetry
+    import page_parser as parser
+    from config import API_KEY, SEARCH_ENGINE_ID
+    from search_client import SearchClient
+    import_time = time.perf_counter() - t0
+
+    started = time.perf_counter()
+    cpu_before = resource.getrusage(resource.RUSAGE_SELF)
+    with telemetry.collect_run() as run:
+        results = SearchClient(API_KEY, SEARCH_ENGINE_ID).search(query, size, False)
+        items = asyncio.run(parser.run_parser(results, query, show_logs=True)) if results else []
+    wall = time.perf_counter() - started
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({
+            'size': size,
+            'ok': sum(1 for item in items if item['status'] == 'Success'),
+            'failed': sum(1 for item in items if item['status'] != 'Success'),
+            'wall': wall,
+            'import_time': import_time,
+            'cpu': (usage.ru_utime - cpu_before.ru_utime) + (usage.ru_stime - cpu_before.ru_stime),
+            'rss_mb': usage.ru_maxrss / 1024,
+            'stages': run.summary(),
+            'counters': {
+                f"{name}{dict(labels) if labels else ''}": value
+                for (name, labels), value in telemetry.registry.counters.items()
+            },
+        }, f, ensure_ascii=False)
+
+
+async def run(args):
+    tmp_root = tempfile.mkdtemp(prefix="bench_pipeline_")
+    corpus = NewsCorpus(args.corpus, args.slow_delay)
+    gemini = FakeGemini(args.gemini_latency, args.gemini_429)
+    ssl_context = make_certificate(tmp_root)
+    https_base = f"https://127.0.0.1:{args.port + 1}" if ssl_context else None
+    if ssl_context is None:
+        print("openssl не найден: TLS-страницы отдаются по HTTP")
+    search = FakeSearch(f"http://127.0.0.1:{args.port}", https_base, args.search_latency)
+
+    runners = [
+        await start_app(corpus.build_app(), args.port),
+        await start_app(search.build_app(), args.port + 2),
+        await start_app(gemini.build_app(), args.port + 3),
+    ]
+    if ssl_context:
+        runners.append(await start_app(corpus.build_app(), args.port + 1, ssl_context))
+
+    results = []
+    try:
+        for size in args.sizes:
+            workdir = os.path.join(tmp_root, f"run_{size}")
+            os.makedirs(workdir)
+            out_path = os.path.join(workdir, "result.json")
+            env = dict(
+                os.environ,
+                API_KEY="bench", SEARCH_ENGINE_ID="bench", GEMINI_KEY="bench",
+                SEARCH_API_URL=f"http://127.0.0.1:{args.port + 2}/customsearch/v1",
+                GEMINI_API_URL=f"http://127.0.0.1:{args.port + 3}",
+                DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                PYTHONPATH=ROOT,
+            )
+            calls_before, rejected_before = gemini.calls, gemini.rejected
+            print(f"⏳ {size} URL...")
+            with open(os.path.join(workdir, "child.log"), "w") as log:
+                proc = await asyncio.create_subprocess_exec(
+                    sys.executable, os.path.abspath(__file__), "--child", str(size),
+                    "--query", f"bench {size}", "--out", out_path,
+                    cwd=workdir, env=env, stdout=log, stderr=log
+                )
+                await proc.wait()
+            if proc.returncode != 0 or not os.path.exists(out_path):
+                print(f"❌ Прогон {size} упал (код {proc.returncode}), лог: {workdir}/child.log")
+                continue
+            with open(out_path, encoding="utf-8") as f:
+                result = json.load(f)
+            result['gemini_calls'] = gemini.calls - calls_before
+            result['gemini_429'] = gemini.rejected - rejected_before
+            results.append(result)
+            report(result)
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+    if len(results) > 1:
+        print("\nURL     ok/fail   wall,s   URL/s   p50,ms   p95,ms   RSS,MB   CPU,s   CPU%")
+        for r in results:
+            article = next((s for s in r['stages'] if s['stage'] == 'article'), None) or {'p50': 0, 'p95': 0}
+            print(f"{r['size']:<7} {r['ok']:>4}/{r['failed']:<4} {r['wall']:>7.1f} {r['size'] / r['wall']:>7.1f} "
+                  f"{article['p50'] * 1000:>8.0f} {article['p95'] * 1000:>8.0f} {r['rss_mb']:>8.0f} "
+                  f"{r['cpu']:>7.1f} {r['cpu'] / r['wall'] * 100:>6.0f}")
+    print(f"\nЗапросы к корпусу по типам: {corpus.calls}; пик одновременных вызовов Gemini: {gemini.max_active}")
+    if args.keep:
+        print(f"Рабочие папки: {tmp_root}")
+    else:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+
+
+def report(result: dict):
+    print(f"  Статей: {result['ok']} ок, {result['failed']} с ошибкой; wall {result['wall']:.1f}s "
+          f"(+ загрузка моделей {result['import_time']:.1f}s), RSS {result['rss_mb']:.0f} MB, CPU {result['cpu']:.1f}s; "
+          f"Gemini: {result['gemini_calls']} вызовов, 429: {result['gemini_429']}")
+    for stage in result['stages']:
+        print(f"    {stage['stage']:<18} x{stage['count']:<5} всего {stage['total']:>8.2f}s  "
+              f"p50 {stage['p50'] * 1000:>7.0f} ms  p95 {stage['p95'] * 1000:>7.0f} ms")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Офлайн-бенчмарк run_parser на локальном корпусе")
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    arg_parser.add_argument('--corpus', type=str, help="Папка с сохраненными .html (по умолчанию — синтетика)")
+    arg_parser.add_argument('--port', type=int, default=8093, help="Первый из четырех портов фейковых сервисов")
+    arg_parser.add_argument('--slow-delay', type=float, default=3.0, help="Средняя задержка медленных страниц, сек")
+    arg_parser.add_argument('--search-latency', type=float, default=0.3)
+    arg_parser.add_argument('--gemini-latency', type=float, default=1.0)
+    arg_parser.add_argument('--gemini-429', type=float, default=0.0, help="Доля ответов Gemini с кодом 429")
+    arg_parser.add_argument('--keep', action='store_true', help="Не удалять рабочие папки (логи, базы)")
+    arg_parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    arg_parser.add_argument('--query', type=str, help=argparse.SUPPRESS)
+    arg_parser.add_argument('--out', type=str, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.query, args.out)
+    else:
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
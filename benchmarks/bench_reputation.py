@@ -0,0 +1,86 @@
+"""
+Бенчмарк индекса репутации доменов на больших списках.
+
+    python benchmarks/bench_reputation.py --domains 500000 --lookups 200000
+
+Генерирует синтетические списки (trusted/fake/platform) во временной папке,
+собирает индекс (reputation.build_index) и меряет время сборки, размер файла,
+время первой загрузки (mmap) и скорость поиска для хостов с разным числом меток,
+включая промахи.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+
+import reputation
+
+TLDS = ("com", "ru", "com.ua", "org", "net", "info", "kz", "co.uk")
+
+
+def random_domain(rng: random.Random) -> str:
+    name = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789-") for _ in range(rng.randint(4, 14)))
+    return f"{name.strip('-') or 'x'}.{rng.choice(TLDS)}"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк индекса репутации")
+    arg_parser.add_argument('--domains', type=int, default=500000)
+    arg_parser.add_argument('--lookups', type=int, default=200000)
+    args = arg_parser.parse_args()
+    logger.remove()
+
+    rng = random.Random(1)
+    workdir = tempfile.mkdtemp(prefix="bench_reputation_")
+    source_dir = os.path.join(workdir, "lists")
+    os.makedirs(source_dir)
+    domains = list({random_domain(rng) for _ in range(args.domains)})
+    shares = (("trusted.txt", 0.2), ("fake.txt", 0.5), ("platform.txt", 0.3))
+    start = 0
+    for name, share in shares:
+        count = int(len(domains) * share)
+        with open(os.path.join(source_dir, name), "w", encoding="utf-8") as f:
+            f.write("\n".join(domains[start:start + count]))
+        start += count
+
+    index_path = os.path.join(workdir, "reputation.idx")
+    try:
+        t0 = time.perf_counter()
+        count = reputation.build_index(source_dir, index_path)
+        build_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        index = reputation.ReputationIndex(source_dir, index_path)
+        load_time = time.perf_counter() - t0
+
+        hosts = []
+        for _ in range(args.lookups):
+            kind = rng.random()
+            if kind < 0.4:
+                hosts.append(f"{rng.choice(('www', 'm', 'edition', 'news.live'))}.{rng.choice(domains)}")
+            elif kind < 0.7:
+                hosts.append(rng.choice(domains))
+            else:
+                hosts.append(random_domain(rng))
+
+        t0 = time.perf_counter()
+        found = sum(1 for host in hosts if index.lookup(host))
+        lookup_time = time.perf_counter() - t0
+
+        print(f"Доменов: {count}, сборка {build_time:.2f}s, индекс {os.path.getsize(index_path) / 1024 / 1024:.1f} МБ")
+        print(f"Загрузка (mmap): {load_time * 1000:.1f} ms")
+        print(f"Поиск: {args.lookups} хостов за {lookup_time:.2f}s "
+              f"({lookup_time / args.lookups * 1e6:.2f} µs/хост), найдено {found}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
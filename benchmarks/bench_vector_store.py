@@ -0,0 +1,167 @@
+"""
+Бенчмарк хранилищ векторов памяти: Chroma против MmapVectorStore (float16,
+float32, с графом HNSW и без).
+
+    python benchmarks/bench_vector_store.py --vectors 100000 --queries 200
+
+Векторы синтетические (размерность all-MiniLM-L6-v2, 384), сгруппированы в
+сюжеты, а запросы лежат рядом с векторами базы, чтобы у них были настоящие
+близкие соседи, как у статьи о продолжении известной истории. Для каждого варианта меряются:
+
+- холодное открытие — отдельный процесс: импорт, открытие хранилища и первый
+  запрос, время от запуска интерпретатора;
+- задержка запроса (p50/p95, top-12 как в MemoryHandler) и пачка из 16 запросов;
+- полнота top-12 относительно точного перебора в float32.
+
+Chroma и hnswlib необязательны: если их нет, варианты пропускаются.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from loguru import logger
+
+from vector_store import MmapVectorStore
+
+DIM = 384
+TOP_K = 12
+BATCH = 16
+
+COLD_MMAP = """
+import sys, time, numpy as np
+sys.path.insert(0, {root!r})
+from vector_store import MmapVectorStore
+store = MmapVectorStore({path!r})
+store.query(np.ones((1, {dim}), dtype=np.float32), n_results={k})
+"""
+COLD_CHROMA = """
+import chromadb, numpy as np
+collection = chromadb.PersistentClient(path={path!r}).get_collection("news_knowledge")
+collection.query(query_embeddings=np.ones((1, {dim})).tolist(), n_results={k})
+"""
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def synthetic(n: int, seed: int = 0) -> np.ndarray:
+    """Сюжеты по ~50 статей: центр сюжета плюс шум."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(n // 50, 1), DIM)).astype(np.float32)
+    return normalize(centers[rng.integers(0, len(centers), n)] + 0.3 * rng.normal(size=(n, DIM)).astype(np.float32))
+
+
+def related_queries(vectors: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    """Запросы — новые статьи по уже известным сюжетам: шум вокруг случайных векторов базы."""
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.integers(0, len(vectors), n)]
+    return normalize(picked + 0.02 * rng.normal(size=picked.shape).astype(np.float32))
+
+
+def cold_open(script: str) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", script], check=True, capture_output=True)
+    return time.perf_counter() - started
+
+
+def latency(query, queries: np.ndarray) -> dict:
+    single = []
+    for q in queries:
+        started = time.perf_counter()
+        query(q[None, :])
+        single.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    batches = 0
+    for start in range(0, len(queries), BATCH):
+        query(queries[start:start + BATCH])
+        batches += 1
+    single.sort()
+    return {
+        'p50': statistics.median(single) * 1000,
+        'p95': single[int(len(single) * 0.95) - 1] * 1000,
+        'batch': (time.perf_counter() - started) / batches * 1000,
+    }
+
+
+def recall(found: list[list[str]], exact: list[list[str]]) -> float:
+    return statistics.mean(len(set(f) & set(e)) / len(e) for f, e in zip(found, exact))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк хранилищ векторов памяти")
+    arg_parser.add_argument('--vectors', type=int, default=100000)
+    arg_parser.add_argument('--queries', type=int, default=200)
+    args = arg_parser.parse_args()
+    logger.remove()
+
+    vectors = synthetic(args.vectors)
+    queries = related_queries(vectors, args.queries)
+    ids = [f"https://news.example/{i}" for i in range(len(vectors))]
+    exact = [[ids[i] for i in np.argsort(-(vectors @ q))[:TOP_K]] for q in queries]
+    workdir = tempfile.mkdtemp(prefix="bench_vectors_")
+    rows = []
+
+    def run(name: str, store, build_seconds: float, cold_script: str, size: int):
+        query = lambda batch: store.query(batch.tolist() if name == "chroma" else batch, n_results=TOP_K)
+        found = [query(q[None, :])['ids'][0] for q in queries]
+        rows.append({
+            'name': name, 'build': build_seconds, 'size': size / 1024 / 1024,
+            'cold': cold_open(cold_script), 'recall': recall(found, exact), **latency(query, queries),
+        })
+
+    try:
+        for dtype in ("float16", "float32"):
+            path = os.path.join(workdir, dtype)
+            started = time.perf_counter()
+            store = MmapVectorStore(path, dim=DIM, dtype=dtype)
+            for start in range(0, len(vectors), 10000):
+                store.upsert(ids[start:start + 10000], vectors[start:start + 10000])
+            build = time.perf_counter() - started
+            script = COLD_MMAP.format(root=ROOT, path=path, dim=DIM, k=TOP_K)
+            run(f"mmap {dtype}", store, build, script, os.path.getsize(store.vectors_path))
+
+            try:
+                started = time.perf_counter()
+                store.build_hnsw()
+                store.refresh()
+                hnsw_build = time.perf_counter() - started
+                size = os.path.getsize(store.vectors_path) + os.path.getsize(store.hnsw_path)
+                run(f"mmap {dtype} + hnsw", store, build + hnsw_build, script, size)
+            except ImportError:
+                print("hnswlib не установлен: вариант с HNSW пропущен")
+
+        try:
+            import chromadb
+            path = os.path.join(workdir, "chroma")
+            started = time.perf_counter()
+            collection = chromadb.PersistentClient(path=path).get_or_create_collection("news_knowledge")
+            for start in range(0, len(vectors), 5000):
+                collection.upsert(ids=ids[start:start + 5000], embeddings=vectors[start:start + 5000].tolist())
+            build = time.perf_counter() - started
+            size = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+            run("chroma", collection, build, COLD_CHROMA.format(path=path, dim=DIM, k=TOP_K), size)
+        except ImportError:
+            print("chromadb не установлен: вариант Chroma пропущен")
+
+        print(f"\n{args.vectors} векторов x {DIM}, top-{TOP_K}, {args.queries} запросов")
+        print(f"{'вариант':<22} {'сборка s':>9} {'МБ':>7} {'холодно s':>10} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'x16 ms':>8} {'полнота':>8}")
+        for row in rows:
+            print(f"{row['name']:<22} {row['build']:>9.1f} {row['size']:>7.1f} {row['cold']:>10.2f} "
+                  f"{row['p50']:>8.2f} {row['p95']:>8.2f} {row['batch']:>8.2f} {row['recall']:>8.3f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
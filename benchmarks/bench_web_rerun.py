@@ -0,0 +1,105 @@
+"""
+Задержка перезапуска скрипта дашборда (архив + графики) на большом архиве.
+
+    python benchmarks/bench_web_rerun.py --rows 100000 --reruns 20
+
+Заполняет временный SQLite-файл и сравнивает:
+  * cold  - каждый перезапуск заново читает базу и считает агрегаты (старое поведение);
+  * warm  - повторный перезапуск без записей: данные отдает VersionedCache;
+  * write - после записи одной статьи: кеш сбрасывается и пересчитывается один раз.
+Построение plotly-графиков не измеряется (plotly может быть не установлен),
+в приложении они кешируются так же, как агрегаты.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RATINGS = [
+    "Рейтинг: Высокое доверие (95%) | Заголовок: Нейтральный",
+    "Рейтинг: Низкое доверие / Пропаганда (5%) | Заголовок: Кликбейт",
+    "Рейтинг: Платформа (50%) | Заголовок: Нейтральный",
+    "Рейтинг: Неизвестен (30%) | Заголовок: Нейтральный",
+]
+
+
+def fill(db, rows: int, batch: int = 5000):
+    rnd = random.Random(42)
+    for start in range(0, rows, batch):
+        items = [
+            {
+                'url': f"https://bench.local/{i}",
+                'title': f"Статья {i}",
+                'published_date': f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+                'rating': rnd.choice(RATINGS),
+                'status': 'Success',
+                'ai_analysis': "SCORE: 50%\nТестовый анализ",
+            }
+            for i in range(start, min(start + batch, rows))
+        ]
+        db.save_articles(items, "benchmark")
+
+
+def rerun(db, cache, dashboard_data):
+    """То, что делает web_app.py при каждом перезапуске для архива и статистики."""
+    version = db.get_change_version()
+    cache.get('stats', version, db.get_stats)
+    df = cache.get('history', version, lambda: dashboard_data.load_history(db))
+    cache.get('ratings', version, lambda: dashboard_data.rating_counts(df))
+    cache.get('dates', version, lambda: dashboard_data.date_counts(df))
+
+
+def measure(fn, repeats: int) -> list[float]:
+    timings = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    return timings
+
+
+def report(label: str, timings: list[float]):
+    print(f"{label:<6} median {statistics.median(timings) * 1000:9.1f} ms   "
+          f"max {max(timings) * 1000:9.1f} ms   (n={len(timings)})")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк перезапуска дашборда")
+    arg_parser.add_argument('--rows', type=int, default=100_000)
+    arg_parser.add_argument('--reruns', type=int, default=20)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        from database import DatabaseHandler
+        import dashboard_data
+
+        db = DatabaseHandler(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+        t0 = time.perf_counter()
+        fill(db, args.rows)
+        print(f"Заполнено {args.rows} строк за {time.perf_counter() - t0:.1f}s")
+
+        cold_runs = max(1, args.reruns // 5)
+        report("cold", measure(lambda: rerun(db, dashboard_data.VersionedCache(), dashboard_data), cold_runs))
+
+        cache = dashboard_data.VersionedCache()
+        rerun(db, cache, dashboard_data)
+        report("warm", measure(lambda: rerun(db, cache, dashboard_data), args.reruns))
+
+        counter = iter(range(10 ** 9))
+
+        def write_then_rerun():
+            db.save_article({'url': f"https://bench.local/new/{next(counter)}", 'title': "Новая",
+                             'rating': RATINGS[0], 'status': 'Success'}, "benchmark")
+            rerun(db, cache, dashboard_data)
+
+        report("write", measure(write_then_rerun, cold_runs))
+        print(f"Кеш: {cache.hits} попаданий, {cache.misses} пересчетов")
+
+
+if __name__ == "__main__":
+    main()
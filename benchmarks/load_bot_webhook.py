@@ -0,0 +1,195 @@
+"""
+Нагрузочный тест вебхук-режима бота (bot_webhook.py) против фейкового Bot API.
+
+    python benchmarks/load_bot_webhook.py --updates 500 --processes 2
+    python benchmarks/load_bot_webhook.py --updates 50 --queries   # текстовые запросы (настоящий конвейер!)
+
+Скрипт поднимает локальный фейковый Telegram Bot API, запускает bot_webhook.py
+с TELEGRAM_API_URL, указывающим на него, и отправляет синтетические апдейты
+(/start и кнопку "help"; с --queries — текстовые запросы). Меряется время приема
+вебхуком, время до первого ответа бота в каждом чате и время остановки
+с дообработкой начатых апдейтов (SIGINT).
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from aiohttp import web, ClientSession
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MESSAGE_METHODS = {"sendMessage", "sendPhoto", "editMessageText"}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class FakeTelegramAPI:
+    """Отвечает на вызовы Bot API как настоящий сервер и запоминает, когда каждый чат получил ответ."""
+
+    def __init__(self):
+        self.calls: dict[str, int] = {}
+        self.first_reply: dict[int, float] = {}
+        self.message_id = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        try:
+            if request.content_type == "application/json":
+                data = await request.json()
+            else:
+                data = await request.post()
+        except ConnectionError:
+            # Клиент оборвал загрузку (например, отправку отсутствующего файла)
+            return web.Response(status=400)
+
+        chat_id = data.get('chat_id')
+        if chat_id is not None and method in MESSAGE_METHODS:
+            self.first_reply.setdefault(int(chat_id), time.perf_counter())
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        elif method in MESSAGE_METHODS:
+            self.message_id += 1
+            result = {
+                "message_id": int(data.get('message_id') or self.message_id),
+                "date": int(time.time()),
+                "chat": {"id": int(chat_id or 0), "type": "private"},
+                "text": str(data.get('text') or data.get('caption') or ""),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=20 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+
+def make_update(i: int, kind: str) -> dict:
+    chat_id = 100000 + i
+    user = {"id": chat_id, "is_bot": False, "first_name": f"Load{i}"}
+    chat = {"id": chat_id, "type": "private"}
+    if kind == "callback":
+        return {
+            "update_id": i,
+            "callback_query": {
+                "id": str(i), "from": user, "chat_instance": str(chat_id), "data": "help",
+                "message": {"message_id": 1, "date": int(time.time()), "chat": chat, "text": "menu"},
+            },
+        }
+    message = {"message_id": 1, "date": int(time.time()), "chat": chat, "from": user}
+    if kind == "query":
+        # Несколько одинаковых запросов: проверяем склейку в BotPipeline
+        message["text"] = f"Курс биткоина прогноз {i % 5}"
+    else:
+        message["text"] = "/start"
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": 6}]
+    return {"update_id": i, "message": message}
+
+
+async def wait_until_ready(url: str, timeout: float):
+    deadline = time.perf_counter() + timeout
+    async with ClientSession() as session:
+        while time.perf_counter() < deadline:
+            try:
+                async with session.get(url) as resp:
+                    if resp.status == 200:
+                        return
+            except OSError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Сервер {url} не готов за {timeout} сек")
+
+
+async def run(args):
+    fake = FakeTelegramAPI()
+    runner = web.AppRunner(fake.build_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.api_port).start()
+
+    env = dict(
+        os.environ,
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.api_port}",
+        TELEGRAM_BOT="123456:LOADTEST",
+        BOT_WEBHOOK_URL="",
+        BOT_WEBHOOK_SECRET="",
+        BOT_WEBHOOK_PATH="/telegram/webhook",
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "bot_webhook.py", "--processes", str(args.processes), "--port", str(args.port)],
+        cwd=ROOT, env=env
+    )
+    webhook_url = f"http://127.0.0.1:{args.port}/telegram/webhook"
+    try:
+        # /healthz отвечает 200, только когда все воркеры загрузились
+        await wait_until_ready(f"http://127.0.0.1:{args.port}/healthz", timeout=args.startup_timeout)
+
+        kinds = ["query"] if args.queries else ["start", "callback"]
+        updates = [make_update(i, kinds[i % len(kinds)]) for i in range(args.updates)]
+        sent_at: dict[int, float] = {}
+        accept_latency = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async with ClientSession() as session:
+            async def post(update):
+                chat_id = (update.get("message") or update["callback_query"]["message"])["chat"]["id"]
+                async with semaphore:
+                    t0 = time.perf_counter()
+                    sent_at[chat_id] = t0
+                    async with session.post(webhook_url, json=update) as resp:
+                        await resp.read()
+                    accept_latency.append(time.perf_counter() - t0)
+
+            started = time.perf_counter()
+            await asyncio.gather(*[post(u) for u in updates])
+            sent_time = time.perf_counter() - started
+
+        deadline = time.perf_counter() + args.timeout
+        while len(fake.first_reply) < len(sent_at) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+        total_time = time.perf_counter() - started
+
+        replies = [fake.first_reply[c] - sent_at[c] for c in sent_at if c in fake.first_reply]
+        print(f"Апдейтов: {len(updates)}, отправлено за {sent_time:.2f}s ({len(updates) / sent_time:.0f}/s)")
+        print(f"Прием вебхуком: p50 {percentile(accept_latency, 50) * 1000:.1f} ms, "
+              f"p95 {percentile(accept_latency, 95) * 1000:.1f} ms")
+        print(f"Первый ответ:   p50 {percentile(replies, 50) * 1000:.1f} ms, "
+              f"p95 {percentile(replies, 95) * 1000:.1f} ms, получили {len(replies)}/{len(sent_at)}")
+        print(f"Всего: {total_time:.2f}s, вызовы Bot API: {fake.calls}")
+    finally:
+        t0 = time.perf_counter()
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=120)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        print(f"Остановка с дообработкой: {time.perf_counter() - t0:.2f}s (код {proc.returncode})")
+        await runner.cleanup()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Нагрузочный тест вебхука бота")
+    arg_parser.add_argument('--updates', type=int, default=200)
+    arg_parser.add_argument('--concurrency', type=int, default=50)
+    arg_parser.add_argument('--processes', type=int, default=2)
+    arg_parser.add_argument('--port', type=int, default=8091)
+    arg_parser.add_argument('--api-port', type=int, default=8092)
+    arg_parser.add_argument('--startup-timeout', type=float, default=120.0, help="Ожидание загрузки воркеров, сек")
+    arg_parser.add_argument('--timeout', type=float, default=60.0, help="Ожидание ответов, сек")
+    arg_parser.add_argument('--queries', action='store_true', help="Слать текстовые запросы (нужны ключи API)")
+    args = arg_parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,29 @@
 import asyncio
 import logging
 import sys
+import time
 from os import getenv
-from urllib.parse import urlparse
-import re
 
 from aiogram import Bot, Dispatcher, html, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart
 from aiogram.types import Message
-from aiogram.utils.markdown import hbold, hlink
+from aiogram.utils.markdown import hbold
 from aiogram.types import FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 
-from config import TELEGRAM_TOKEN, API_KEY, SEARCH_ENGINE_ID
-from search_client import SearchClient
-import page_parser as parser
+from config import TELEGRAM_TOKEN, TELEGRAM_API_URL, METRICS_PORT, BOT_DEMO_TOPICS
 from aiogram.types import CallbackQuery
 from database import DatabaseHandler
+from bot_pipeline import BotPipeline, PipelineOverloaded, UserLimitExceeded
+from bot_replies import StreamingReply
+import telemetry
 
 dp = Dispatcher()
 db = DatabaseHandler()
+pipeline = BotPipeline()
 
 
 async def keep_typing(chat_id: int, bot: Bot):
@@ -84,7 +87,7 @@ async def demo_callback(callback: CallbackQuery, bot: Bot):
         await callback.answer("Ошибка: сообщение не найдено.")
         return
 
-    topic = "Выборы в США 2025" if callback.data == "demo_usa" else "Курс Биткоина прогнозы"
+    topic = BOT_DEMO_TOPICS.get(callback.data, BOT_DEMO_TOPICS["demo_btc"])
 
     await callback.message.answer(f"🚀 Запускаю демо-поиск по теме: <b>{topic}</b>")
     await callback.answer()
@@ -107,80 +110,38 @@ async def analyze_message(message: Message, bot: Bot) -> None:
 
     user_query = message.text
 
-    status_msg = await message.answer("🕵️ Анализирую... (15-20 сек)")
+    waiting = pipeline.queue_position
+    status_text = "🕵️ Анализирую... (15-20 сек)"
+    if waiting:
+        status_text += f"\n⏳ Перед вами в очереди: {waiting}"
+    status_msg = await message.answer(status_text)
     typing_task = asyncio.create_task(keep_typing(message.chat.id, bot))
 
-    try:
-        final_data = []
-
-        if user_query.startswith("http"):
-            fake_search_results = {"items": [{"link": user_query, "title": "Проверка ссылки"}]}
-            final_data = await parser.run_parser(fake_search_results, query="Link Check", show_logs=True)
-        else:
-            client = SearchClient(API_KEY, SEARCH_ENGINE_ID)
-            results_data = client.search(user_query, num_results=3, show_logs=True) # Можно увеличить до 5, раз мы фильтруем
-
-            if not results_data or not results_data.get('items'):
-                await status_msg.edit_text("⚠️ Ничего не найдено.")
-                return
+    reply = StreamingReply(status_msg, user_query)
 
-            final_data = await parser.run_parser(results_data, user_query, show_logs=True)
+    try:
+        try:
+            user_id = message.from_user.id if message.from_user else message.chat.id
+            final_data = await pipeline.submit(user_query, user_id, on_item=reply.add)
+        except UserLimitExceeded:
+            await status_msg.edit_text("✋ Дождитесь результата предыдущего запроса.")
+            return
+        except PipelineOverloaded:
+            await status_msg.edit_text("🚦 Сейчас слишком много запросов. Попробуйте через минуту.")
+            return
 
         if not final_data:
-            await status_msg.edit_text("❌ Ошибка чтения данных.")
+            await status_msg.edit_text("⚠️ Ничего не найдено или не удалось прочитать статьи.")
             return
 
-        success_items = []
-        failed_items = []
-
-        for item in final_data:
-            ai_text = item.get('ai_analysis')
-            if ai_text and "слишком короткий" not in ai_text and "Пропущено" not in ai_text:
-                success_items.append(item)
-            else:
-                failed_items.append(item)
-
-        response_text = f"🔎 <b>Анализ:</b> {html.quote(user_query)}\n\n"
-        if success_items:
-            for item in success_items:
-                url = item.get('url', '#')
-                domain = urlparse(url).netloc.replace('www.', '')
-                title = item.get('title')
-                if not title or title == "Без заголовка":
-                    title = f"Статья на {domain}"
-
-                rating_raw = item.get('rating') or ""
-                clean_rating = rating_raw.split('|')[0].replace("Рейтинг:", "").strip()
-
-                icon = "❓"
-                if "Высокое доверие" in clean_rating: icon = "✅"
-                elif "Пропаганда" in clean_rating or "Низкое" in clean_rating: icon = "⛔"
-                elif "Платформа" in clean_rating: icon = "⚠️"
-
-                ai_text = item.get('ai_analysis', '')
-                clean_ai = ai_text.replace("SCORE:", "").replace("###", "").replace("**", "").strip()
-                if clean_ai[:4].isdigit() or clean_ai.startswith("Оценка"):
-                     clean_ai = re.sub(r'^.*?%\s*', '', clean_ai)
-
-                summary = clean_ai[:220] + "..."
-                response_text += f"{icon} {hlink(title, url)}\n"
-                response_text += f"<b>Источник:</b> {domain} | <b>{clean_rating}</b>\n"
-                response_text += f"<blockquote>{html.quote(summary)}</blockquote>\n\n"
-        else:
-            response_text += "🤷‍♂️ <i>Детальный анализ невозможен (статьи закрыты или слишком короткие).</i>\n\n"
-
-        if failed_items:
-            response_text += "🔗 <b>Также найдено (без AI-анализа):</b>\n"
-            for item in failed_items:
-                url = item.get('url', '#')
-                domain = urlparse(url).netloc.replace('www.', '')
-                title = item.get('title') or domain
-                response_text += f"• {hlink(title, url)} ({domain})\n"
-
-        if len(response_text) > 4000:
-            response_text = response_text[:4000] + "\n(обрезано)"
-
-        await status_msg.edit_text(response_text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+        first_answer = await reply.finish(final_data)
+        pipeline.record_first_answer(first_answer)
+        total = time.monotonic() - reply.started
+        summary = pipeline.latency_summary()
+        logging.info(
+            f"Первый ответ через {first_answer:.1f}с, полный через {total:.1f}с "
+            f"(p50 {summary['p50']:.1f}с, p95 {summary['p95']:.1f}с по {summary['count']} запросам)"
+        )
 
     except Exception as e:
         logging.error(f"Error: {e}")
@@ -189,8 +150,23 @@ async def analyze_message(message: Message, bot: Bot) -> None:
     finally:
         typing_task.cancel()
 
+@dp.startup()
+async def on_startup() -> None:
+    pipeline.start()
+
+@dp.shutdown()
+async def on_shutdown() -> None:
+    await pipeline.stop()
+
+def create_bot() -> Bot:
+    session = None
+    if TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+    return Bot(token=TELEGRAM_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+
 async def main() -> None:
-    bot = Bot(token=TELEGRAM_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot = create_bot()
+    telemetry.start_metrics_server(METRICS_PORT)
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
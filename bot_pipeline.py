@@ -0,0 +1,186 @@
+import asyncio
+import statistics
+import time
+from collections import deque
+from loguru import logger
+
+from config import (
+    API_KEY, SEARCH_ENGINE_ID,
+    BOT_WORKERS, BOT_QUEUE_SIZE, BOT_USER_CONCURRENCY, BOT_RESULT_TTL, BOT_NUM_RESULTS
+)
+from job_queue import request_key
+import telemetry
+from search_client import SearchClient
+
+
+class PipelineOverloaded(Exception):
+    """Очередь анализа заполнена: новый запрос не принят."""
+
+
+class UserLimitExceeded(Exception):
+    """У пользователя уже выполняется максимум запросов."""
+
+
+async def analyze_query(query: str, on_item=None, num_results: int = BOT_NUM_RESULTS) -> list[dict]:
+    """Полный конвейер для одного запроса бота: поиск (или проверка ссылки) + run_parser."""
+    # Импорт здесь: page_parser тянет модели эмбеддингов, а процессу приема
+    # вебхуков (bot_webhook.py) нужен только bot.create_bot
+    import page_parser as parser
+
+    if query.startswith("http"):
+        fake_search_results = {"items": [{"link": query, "title": "Проверка ссылки"}]}
+        return await parser.run_parser(fake_search_results, query="Link Check", show_logs=True, on_item=on_item)
+
+    client = SearchClient(API_KEY, SEARCH_ENGINE_ID)
+    # SearchClient.search блокирующий: в потоке он не останавливает остальные чаты
+    results_data = await asyncio.to_thread(client.search, query, num_results, True)
+    if not results_data or not results_data.get('items'):
+        return []
+    return await parser.run_parser(results_data, query, show_logs=True, on_item=on_item)
+
+
+class BotPipeline:
+    """
+    Общий конвейер анализа для всех чатов бота.
+
+    * одинаковые (нормализованные) запросы, которые уже выполняются, ждут один результат;
+    * готовый результат живет BOT_RESULT_TTL секунд и отдается повторно без скрапинга;
+    * у каждого пользователя не больше BOT_USER_CONCURRENCY запросов одновременно;
+    * работу выполняют BOT_WORKERS задач из очереди на BOT_QUEUE_SIZE мест,
+      при заполненной очереди запрос сразу отклоняется (PipelineOverloaded);
+    * готовые статьи сразу рассылаются подписчикам запроса (on_item), в том числе
+      присоединившимся позже: им сначала отдается уже готовая часть.
+    """
+
+    def __init__(self, runner=analyze_query, workers: int = BOT_WORKERS, queue_size: int = BOT_QUEUE_SIZE,
+                 user_limit: int = BOT_USER_CONCURRENCY, ttl: float = BOT_RESULT_TTL):
+        self.runner = runner
+        self.workers = workers
+        self.user_limit = user_limit
+        self.ttl = ttl
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.in_flight: dict[str, asyncio.Future] = {}
+        self.cache: dict[str, tuple[float, list]] = {}
+        self.partial: dict[str, list] = {}
+        self.listeners: dict[str, list] = {}
+        self.user_active: dict[int, int] = {}
+        self.worker_tasks: list[asyncio.Task] = []
+        self.first_answer_times: deque = deque(maxlen=200)
+
+    def start(self):
+        if not self.worker_tasks:
+            self.worker_tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+            logger.info(f"Конвейер бота запущен: {self.workers} воркеров, очередь {self.queue.maxsize}.")
+
+    async def stop(self):
+        for task in self.worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+        self.worker_tasks = []
+
+    @property
+    def queue_position(self) -> int:
+        return self.queue.qsize()
+
+    def record_first_answer(self, seconds: float):
+        self.first_answer_times.append(seconds)
+        telemetry.registry.observe("bot_first_answer", seconds)
+
+    def latency_summary(self) -> dict:
+        """Время до первого полезного ответа по последним запросам (секунды)."""
+        times = sorted(self.first_answer_times)
+        if not times:
+            return {'count': 0, 'p50': 0.0, 'p95': 0.0}
+        return {
+            'count': len(times),
+            'p50': statistics.median(times),
+            'p95': times[min(len(times) - 1, int(len(times) * 0.95))],
+        }
+
+    def _publish(self, key: str, item: dict):
+        self.partial.setdefault(key, []).append(item)
+        for listener in list(self.listeners.get(key, [])):
+            try:
+                listener(item)
+            except Exception as e:
+                logger.error(f"Ошибка подписчика запроса '{key}': {e}")
+
+    def _cached(self, key: str) -> list | None:
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        expires, result = entry
+        if expires < time.monotonic():
+            del self.cache[key]
+            return None
+        return result
+
+    def _remember(self, key: str, result: list):
+        now = time.monotonic()
+        # Заодно выбрасываем просроченные записи, чтобы кеш не рос бесконечно
+        for stale in [k for k, (expires, _) in self.cache.items() if expires < now]:
+            del self.cache[stale]
+        if result:
+            self.cache[key] = (now + self.ttl, result)
+
+    async def _worker(self, worker_id: int):
+        while True:
+            key, query, future = await self.queue.get()
+            try:
+                with telemetry.span("bot_query", worker=worker_id):
+                    result = await self.runner(query, on_item=lambda item, key=key: self._publish(key, item))
+                self._remember(key, result)
+                if not future.done():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"Воркер бота {worker_id}: ошибка анализа '{query}': {e}")
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.in_flight.pop(key, None)
+                self.partial.pop(key, None)
+                self.listeners.pop(key, None)
+                self.queue.task_done()
+
+    async def submit(self, query: str, user_id: int, on_item=None) -> list[dict]:
+        key = request_key(query)
+        cached = self._cached(key)
+        telemetry.cache_hit("bot_result", cached is not None)
+        if cached is not None:
+            logger.debug(f"Ответ из кеша для '{key}'")
+            return cached
+
+        if self.user_active.get(user_id, 0) >= self.user_limit:
+            raise UserLimitExceeded()
+
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            try:
+                self.queue.put_nowait((key, query.strip(), future))
+            except asyncio.QueueFull:
+                raise PipelineOverloaded()
+            self.in_flight[key] = future
+        else:
+            telemetry.incr("coalesced_requests")
+            logger.debug(f"Запрос '{key}' присоединен к уже выполняющемуся")
+
+        if on_item:
+            for item in self.partial.get(key, []):
+                on_item(item)
+            self.listeners.setdefault(key, []).append(on_item)
+
+        self.user_active[user_id] = self.user_active.get(user_id, 0) + 1
+        try:
+            # shield: отмена одного ожидающего не должна отменять общий результат
+            return await asyncio.shield(future)
+        finally:
+            if on_item and on_item in self.listeners.get(key, []):
+                self.listeners[key].remove(on_item)
+            self.user_active[user_id] -= 1
+            if not self.user_active[user_id]:
+                del self.user_active[user_id]
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import re
+import time
+from urllib.parse import urlparse
+
+from aiogram import html
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+from aiogram.utils.markdown import hlink
+
+from config import BOT_EDIT_INTERVAL
+
+MAX_MESSAGE_LENGTH = 4000
+# Сколько раз подряд ждать RetryAfter на одной правке
+EDIT_ATTEMPTS = 3
+
+
+def is_useful(item: dict) -> bool:
+    ai_text = item.get('ai_analysis')
+    return bool(ai_text) and "слишком короткий" not in ai_text and "Пропущено" not in ai_text
+
+
+def _domain(url: str) -> str:
+    return urlparse(url).netloc.replace('www.', '')
+
+
+def format_article(item: dict) -> str:
+    url = item.get('url', '#')
+    domain = _domain(url)
+    title = item.get('title')
+    if not title or title == "Без заголовка":
+        title = f"Статья на {domain}"
+
+    rating_raw = item.get('rating') or ""
+    clean_rating = rating_raw.split('|')[0].replace("Рейтинг:", "").strip()
+
+    icon = "❓"
+    if "Высокое доверие" in clean_rating: icon = "✅"
+    elif "Пропаганда" in clean_rating or "Низкое" in clean_rating: icon = "⛔"
+    elif "Платформа" in clean_rating: icon = "⚠️"
+
+    ai_text = item.get('ai_analysis', '')
+    clean_ai = ai_text.replace("SCORE:", "").replace("###", "").replace("**", "").strip()
+    if clean_ai[:4].isdigit() or clean_ai.startswith("Оценка"):
+        clean_ai = re.sub(r'^.*?%\s*', '', clean_ai)
+
+    summary = clean_ai[:220] + "..."
+    return (
+        f"{icon} {hlink(title, url)}\n"
+        f"<b>Источник:</b> {domain} | <b>{clean_rating}</b>\n"
+        f"<blockquote>{html.quote(summary)}</blockquote>\n\n"
+    )
+
+
+def format_response(query: str, items: list[dict], finished: bool = True) -> str:
+    success_items = [item for item in items if is_useful(item)]
+    failed_items = [item for item in items if not is_useful(item)]
+
+    blocks = [f"🔎 <b>Анализ:</b> {html.quote(query)}\n\n"]
+    if success_items:
+        blocks.extend(format_article(item) for item in success_items)
+    elif finished:
+        blocks.append("🤷‍♂️ <i>Детальный анализ невозможен (статьи закрыты или слишком короткие).</i>\n\n")
+
+    if failed_items and finished:
+        blocks.append("🔗 <b>Также найдено (без AI-анализа):</b>\n")
+        for item in failed_items:
+            url = item.get('url', '#')
+            domain = _domain(url)
+            title = item.get('title') or domain
+            blocks.append(f"• {hlink(title, url)} ({domain})\n")
+
+    footer = "" if finished else f"⏳ <i>Готово статей: {len(items)}, анализирую остальные...</i>"
+
+    # Режем по целым блокам: обрезка посреди тега ломает HTML-разметку Telegram
+    response_text = ""
+    for block in blocks:
+        if len(response_text) + len(block) + len(footer) > MAX_MESSAGE_LENGTH:
+            response_text += "(обрезано)\n"
+            break
+        response_text += block
+    return response_text + footer
+
+
+class StreamingReply:
+    """
+    Ответ, который дополняется по мере готовности статей. Правки сообщения
+    идут не чаще раза в BOT_EDIT_INTERVAL секунд: Telegram ограничивает
+    частоту edit_text, а на 429 отвечает RetryAfter.
+    """
+
+    def __init__(self, status_msg: Message, query: str, min_interval: float = BOT_EDIT_INTERVAL):
+        self.status_msg = status_msg
+        self.query = query
+        self.min_interval = min_interval
+        self.items: list[dict] = []
+        self.started = time.monotonic()
+        self.first_answer: float | None = None
+        self.last_edit = 0.0
+        self.last_text: str | None = None
+        self.flush_task: asyncio.Task | None = None
+        self.lock = asyncio.Lock()
+
+    def add(self, item: dict):
+        self.items.append(item)
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+    async def _wait_turn(self):
+        delay = self.last_edit + self.min_interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _flush_later(self):
+        # Правка не прошла (Telegram раз за разом просит подождать) — пробуем
+        # снова с актуальным текстом, пока finish не отменит задачу
+        while True:
+            await self._wait_turn()
+            try:
+                if await self._edit(format_response(self.query, self.items, finished=False)):
+                    return
+            except Exception as e:
+                # Сеть и прочее: задачу не роняем молча, следующий add запланирует правку заново
+                logging.warning(f"Промежуточная правка ответа не удалась: {e}")
+                return
+
+    async def _edit(self, text: str) -> bool:
+        """Правка сообщения; False, если Telegram так и не дал ее сделать за EDIT_ATTEMPTS попыток."""
+        async with self.lock:
+            if text == self.last_text:
+                return True
+            for _ in range(EDIT_ATTEMPTS):
+                try:
+                    await self.status_msg.edit_text(text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+                    break
+                except TelegramRetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                except TelegramBadRequest as e:
+                    # "message is not modified" и подобное: следующая правка все исправит
+                    logging.debug(f"Правка сообщения пропущена: {e}")
+                    break
+            else:
+                self.last_edit = time.monotonic()
+                return False
+            self.last_edit = time.monotonic()
+            self.last_text = text
+            if self.first_answer is None and any(is_useful(item) for item in self.items):
+                self.first_answer = self.last_edit - self.started
+            return True
+
+    async def finish(self, items: list[dict]) -> float:
+        """Финальная правка полным результатом. Возвращает время до первого полезного ответа."""
+        if self.flush_task and not self.flush_task.done():
+            self.flush_task.cancel()
+            await asyncio.gather(self.flush_task, return_exceptions=True)
+        self.items = list(items)
+        await self._wait_turn()
+        await self._edit(format_response(self.query, self.items, finished=True))
+        if self.first_answer is None:
+            self.first_answer = time.monotonic() - self.started
+        return self.first_answer
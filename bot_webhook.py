@@ -0,0 +1,182 @@
+import asyncio
+import multiprocessing
+import queue
+import signal
+import zlib
+from aiohttp import web
+from loguru import logger
+
+from config import (
+    BOT_WEBHOOK_HOST, BOT_WEBHOOK_PORT, BOT_WEBHOOK_PATH, BOT_WEBHOOK_URL, BOT_WEBHOOK_SECRET,
+    BOT_PROCESSES, BOT_DRAIN_SECONDS, METRICS_PORT, BOT_DEMO_TOPICS
+)
+from job_queue import request_key
+from logger_config import setup_logger
+import telemetry
+
+UPDATE_QUEUE_SIZE = 1000
+
+
+def route_key(update: dict) -> str:
+    """
+    Одинаковые текстовые запросы и кнопки демо-поиска с тем же запросом уходят
+    в один процесс: там их склеивает BotPipeline и отдает его кеш. Остальное
+    (команды, прочие кнопки) — по чату.
+    """
+    message = update.get('message') or update.get('edited_message') or {}
+    text = message.get('text') or ""
+    if text and not text.startswith("/"):
+        return request_key(text)
+    callback = update.get('callback_query') or {}
+    if callback.get('data') in BOT_DEMO_TOPICS:
+        return request_key(BOT_DEMO_TOPICS[callback['data']])
+    callback_message = callback.get('message') or {}
+    chat = message.get('chat') or callback_message.get('chat') or {}
+    return str(chat.get('id', update.get('update_id', 0)))
+
+
+async def _handle(dp, bot, update: dict):
+    try:
+        await dp.feed_raw_update(bot, update)
+    except Exception as e:
+        logger.error(f"Ошибка обработки апдейта {update.get('update_id')}: {e}")
+
+
+async def _serve_updates(index: int, updates: multiprocessing.Queue, ready):
+    import bot as bot_module
+
+    bot = bot_module.create_bot()
+    dp = bot_module.dp
+    await dp.emit_startup(bot=bot)
+    ready.set()
+    logger.info(f"Воркер бота #{index} готов.")
+
+    tasks: set[asyncio.Task] = set()
+    while True:
+        update = await asyncio.to_thread(updates.get)
+        if update is None:
+            break
+        task = asyncio.create_task(_handle(dp, bot, update))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        logger.info(f"Воркер бота #{index}: дожидаюсь {len(tasks)} обработчиков...")
+        _, pending = await asyncio.wait(tasks, timeout=BOT_DRAIN_SECONDS)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Воркер бота #{index}: прервано обработчиков после таймаута: {len(pending)}")
+    await dp.emit_shutdown(bot=bot)
+    await bot.session.close()
+
+
+def _worker_main(index: int, updates: multiprocessing.Queue, ready):
+    # Ctrl+C получает вся группа процессов: воркер останавливается только по сигналу
+    # от родителя, успев дообработать начатые апдейты
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logger()
+    if METRICS_PORT:
+        telemetry.start_metrics_server(METRICS_PORT + 1 + index)
+    asyncio.run(_serve_updates(index, updates, ready))
+
+
+class WebhookServer:
+    """
+    Прием апдейтов Telegram через вебхук. aiohttp-процесс только принимает JSON
+    и раскладывает его по очередям воркеров; разбор HTML, эмбеддинги и Gemini
+    работают в BOT_PROCESSES отдельных процессах, каждый со своим event loop.
+    Общая база у всех процессов одна (DATABASE_URL).
+    """
+
+    def __init__(self, processes: int = BOT_PROCESSES):
+        ctx = multiprocessing.get_context("spawn")
+        self.queues = [ctx.Queue(maxsize=UPDATE_QUEUE_SIZE) for _ in range(processes)]
+        self.ready = [ctx.Event() for _ in range(processes)]
+        self.workers = [
+            ctx.Process(target=_worker_main, args=(i, q, ready), name=f"bot-worker-{i}")
+            for i, (q, ready) in enumerate(zip(self.queues, self.ready))
+        ]
+
+    async def health(self, request: web.Request) -> web.Response:
+        """200, когда все воркеры загрузились и живы (для балансировщика и нагрузочного теста)."""
+        alive = [w.is_alive() and ready.is_set() for w, ready in zip(self.workers, self.ready)]
+        return web.json_response({'workers': len(alive), 'ready': sum(alive)}, status=200 if all(alive) else 503)
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if BOT_WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != BOT_WEBHOOK_SECRET:
+            return web.Response(status=401)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        target = self.queues[zlib.crc32(route_key(update).encode("utf-8")) % len(self.queues)]
+        try:
+            target.put_nowait(update)
+        except queue.Full:
+            # Telegram повторит доставку позже
+            logger.warning("Очередь воркеров бота переполнена, апдейт отклонен.")
+            telemetry.incr("webhook_rejected")
+            return web.Response(status=503)
+        telemetry.incr("webhook_updates")
+        return web.Response()
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        """Счетчики процесса приема; у каждого воркера свой порт METRICS_PORT+1+номер."""
+        return web.Response(text=telemetry.registry.render(), content_type="text/plain")
+
+    async def on_startup(self, app: web.Application):
+        for worker in self.workers:
+            worker.start()
+        logger.info(f"Запущено воркеров бота: {len(self.workers)}")
+
+        if BOT_WEBHOOK_URL:
+            from bot import create_bot
+
+            bot = create_bot()
+            try:
+                await bot.set_webhook(
+                    BOT_WEBHOOK_URL.rstrip("/") + BOT_WEBHOOK_PATH,
+                    secret_token=BOT_WEBHOOK_SECRET,
+                    drop_pending_updates=False
+                )
+                logger.success(f"Вебхук зарегистрирован: {BOT_WEBHOOK_URL}")
+            finally:
+                await bot.session.close()
+
+    async def on_shutdown(self, app: web.Application):
+        logger.info("Останавливаю воркеров бота, дожидаюсь начатых задач...")
+        for q in self.queues:
+            await asyncio.to_thread(q.put, None)
+        for worker in self.workers:
+            await asyncio.to_thread(worker.join, BOT_DRAIN_SECONDS + 10)
+            if worker.is_alive():
+                logger.warning(f"{worker.name} не завершился вовремя, останавливаю принудительно.")
+                worker.terminate()
+        logger.info("Воркеры бота остановлены.")
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(BOT_WEBHOOK_PATH, self.handle_update)
+        app.router.add_get("/healthz", self.health)
+        app.router.add_get("/metrics", self.metrics)
+        app.on_startup.append(self.on_startup)
+        app.on_shutdown.append(self.on_shutdown)
+        return app
+
+
+def run_webhook(processes: int = BOT_PROCESSES, host: str = BOT_WEBHOOK_HOST, port: int = BOT_WEBHOOK_PORT):
+    server = WebhookServer(processes)
+    web.run_app(server.build_app(), host=host, port=port, print=None)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    setup_logger()
+    arg_parser = argparse.ArgumentParser(description="Telegram-бот в режиме вебхука с пулом процессов.")
+    arg_parser.add_argument('--processes', type=int, default=BOT_PROCESSES, help="Число процессов-обработчиков")
+    arg_parser.add_argument('--port', type=int, default=BOT_WEBHOOK_PORT)
+    args = arg_parser.parse_args()
+    run_webhook(processes=args.processes, port=args.port)
@@ -0,0 +1,206 @@
+import math
+import os
+import re
+from loguru import logger
+
+from config import CLICKBAIT_TRIGGERS, CLICKBAIT_DIR, CLICKBAIT_TEXT_CHARS, CLICKBAIT_SCALE
+
+DEFAULT_WEIGHT = 1.0
+# Старый список из config.py (то, что не нашлось в словарях): вес как у интриги
+LEGACY_CATEGORY = ("trigger", "Триггер-слово", 2.0)
+# Совпадения в тексте весят меньше, чем в заголовке, и считаются на 1000 слов
+TEXT_FACTOR = 0.3
+# Как у триггер-слова: одной пунктуации или ALL CAPS хватает на порог
+# CLICKBAIT_MIN_SCORE (28 баллов при CLICKBAIT_SCALE = 6), как и до словарей
+PUNCTUATION_WEIGHT = 2.0
+CAPS_WEIGHT = 2.0
+
+# Словари лежат рядом с модулем: путь не зависит от рабочей папки (абсолютный CLICKBAIT_DIR — как есть)
+DICTIONARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), CLICKBAIT_DIR)
+
+_WORD_RE = re.compile(r"\w+")
+_UNRESOLVED = object()
+RESOLVED_CACHE_SIZE = 65536
+_HEADER_RE = re.compile(r"#\s*(label|weight)\s*:\s*(.+)")
+
+
+def normalize(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def _token(ch: str) -> str:
+    # Пробел во фразе — любой пробельный промежуток в тексте
+    return r"\s+" if ch == " " else re.escape(ch)
+
+
+def _trie_regex(phrases: dict[str, bool]) -> str:
+    """
+    Фразы -> одно регулярное выражение с общими префиксами, вынесенными в группы
+    (шок|шокир\\w*|... превращается в шок(?:ир\\w*)?). Движок re проходит такой
+    автомат за один проход по тексту, не перебирая тысячи альтернатив на каждой позиции.
+    phrases: фраза -> True, если это основа слова (допускает окончание).
+    """
+    trie: dict = {}
+    for phrase, is_stem in phrases.items():
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node["*" if is_stem else ""] = True
+
+    def build(node: dict) -> str:
+        alternatives = [_token(ch) + build(child) for ch, child in sorted(node.items()) if len(ch) == 1 and ch != "*"]
+        if "*" in node:
+            alternatives.append(r"\w*")
+        if not alternatives:
+            return ""
+        body = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        if "" in node and "*" not in node:
+            return f"(?:{body})?" if len(alternatives) > 1 or len(body) > 1 else f"{body}?"
+        return body
+
+    return build(trie)
+
+
+class ClickbaitMatcher:
+    """
+    Многоязычный (RU/UA/EN) поиск кликбейт-фраз по заголовку и тексту статьи.
+    Фразы берутся из CLICKBAIT_DIR (файл = категория, заголовки "# label:" и
+    "# weight:") и CLICKBAIT_TRIGGERS из config.py; все они собираются в одно
+    выражение с границами слов.
+    """
+    _instance = None
+
+    def __new__(cls, source_dir: str = DICTIONARY_DIR):
+        if cls._instance is None:
+            cls._instance = super(ClickbaitMatcher, cls).__new__(cls)
+            cls._instance._initialize(source_dir)
+        return cls._instance
+
+    def _initialize(self, source_dir: str):
+        # фраза -> категория; для основ отдельно, их ищем по самому длинному префиксу
+        self.phrases: dict[str, str] = {}
+        self.stems: dict[str, str] = {}
+        self.categories: dict[str, tuple[str, float]] = {}
+        self.resolved: dict[str, str | None] = {}
+
+        if os.path.isdir(source_dir):
+            for file_name in sorted(os.listdir(source_dir)):
+                if file_name.endswith(".txt"):
+                    self._load_file(os.path.join(source_dir, file_name))
+        else:
+            logger.warning(f"Кликбейт: нет папки словарей {source_dir}, остаются только CLICKBAIT_TRIGGERS из config.py")
+        # Фразы из config.py, которых нет в словарях: "сенсация" уже покрыта
+        # основой "сенсаци*" и должна считаться по ее категории и весу
+        name, label, weight = LEGACY_CATEGORY
+        self.categories[name] = (label, weight)
+        for phrase in CLICKBAIT_TRIGGERS:
+            if self._category(" ".join(normalize(phrase).split())) is None:
+                self._add(phrase, name)
+
+        all_phrases = {**{p: False for p in self.phrases}, **{s: True for s in self.stems}}
+        self.pattern = re.compile(r"(?<!\w)" + _trie_regex(all_phrases) + r"(?!\w)")
+        logger.debug(f"Кликбейт: {len(all_phrases)} фраз в {len(self.categories)} категориях")
+
+    def _add(self, phrase: str, category: str):
+        phrase = " ".join(normalize(phrase).split())
+        if phrase.endswith("*"):
+            self.stems.setdefault(phrase[:-1], category)
+        elif phrase:
+            self.phrases.setdefault(phrase, category)
+
+    def _load_file(self, path: str):
+        category = os.path.splitext(os.path.basename(path))[0]
+        label, weight = category, DEFAULT_WEIGHT
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                header = _HEADER_RE.match(line)
+                if header:
+                    key, value = header.groups()
+                    if key == "label":
+                        label = value.strip()
+                    else:
+                        weight = float(value)
+                elif line and not line.startswith("#"):
+                    self._add(line, category)
+        self.categories[category] = (label, weight)
+
+    def _category(self, matched: str) -> str | None:
+        # Совпадения сильно повторяются (одни и те же слова в тысячах заголовков):
+        # разбор по основам запоминается
+        category = self.resolved.get(matched, _UNRESOLVED)
+        if category is not _UNRESOLVED:
+            return category
+        category = self._resolve(matched)
+        if len(self.resolved) >= RESOLVED_CACHE_SIZE:
+            self.resolved.clear()
+        self.resolved[matched] = category
+        return category
+
+    def _resolve(self, matched: str) -> str | None:
+        matched = " ".join(matched.split())
+        category = self.phrases.get(matched)
+        if category:
+            return category
+        for end in range(len(matched), 0, -1):
+            category = self.stems.get(matched[:end])
+            if category:
+                return category
+        return None
+
+    def find(self, text: str) -> list[tuple[str, str]]:
+        """Все совпадения: (фраза из текста, категория)."""
+        if not text:
+            return []
+        hits = []
+        # В выражении нет захватывающих групп: findall отдает сами совпадения
+        for matched in self.pattern.findall(normalize(text)):
+            category = self._category(matched)
+            if category:
+                hits.append((matched, category))
+        return hits
+
+    def score(self, title: str | None, text: str | None = None) -> dict:
+        """
+        Оценка 0..100: баллы заголовка (каждая фраза один раз, плюс пунктуация
+        и ALL CAPS) и плотность совпадений в тексте на 1000 слов с коэффициентом
+        TEXT_FACTOR, сжатые в 1 - exp(-баллы / CLICKBAIT_SCALE).
+        """
+        title = title or ""
+        title_hits = self.find(title)
+        punctuation = '!!!' in title or '???' in title or '!?' in title
+        caps = title.isupper() and len(title) > 10
+        if not title_hits and not punctuation and not caps and not text:
+            # Обычный заголовок без текста — подавляющее большинство вызовов
+            return {'score': 0, 'categories': []}
+
+        points: dict[str, float] = {}
+
+        def add(category: str, value: float):
+            points[category] = points.get(category, 0.0) + value
+
+        for category in dict(title_hits).values():
+            add(category, self.categories[category][1])
+        if punctuation:
+            add("punctuation", PUNCTUATION_WEIGHT)
+        if caps:
+            add("caps", CAPS_WEIGHT)
+
+        if text:
+            text = text[:CLICKBAIT_TEXT_CHARS]
+            words = max(len(_WORD_RE.findall(text)), 300)
+            for _, category in self.find(text):
+                add(category, self.categories[category][1] * TEXT_FACTOR * 1000 / words)
+
+        total = sum(points.values())
+        return {
+            'score': round(100 * (1 - math.exp(-total / CLICKBAIT_SCALE))),
+            'categories': sorted(points, key=lambda c: -points[c]),
+        }
+
+    def label(self, category: str) -> str:
+        if category == "punctuation":
+            return "Пунктуация"
+        if category == "caps":
+            return "ALL CAPS"
+        return self.categories[category][0]
@@ -0,0 +1,128 @@
+import re
+import numpy as np
+from loguru import logger
+
+from config import COMPRESS_MAX_SENTENCES, COMPRESS_DIVERSITY
+import telemetry
+
+# Кириллица в токенайзере Gemini дороже латиницы: считаем с запасом
+CHARS_PER_TOKEN = 3
+# Первое предложение новости (лид) пересказывает главное и берется всегда,
+# следующие получают прибавку к важности
+LEAD_SENTENCES = 3
+LEAD_BONUS = 0.2
+MIN_SENTENCE_CHARS = 25
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+(?=[\"«(\[A-ZА-ЯЁІЇЄҐ0-9])|\n+")
+# Служебные строки сайтов, которые не несут фактов: строка должна начинаться
+# с такой фразы (после ©, года, маркеров списка), целым словом
+BOILERPLATE = (
+    "читайте также", "читайте далее", "читати також", "подписывайтесь", "підписуйтесь",
+    "подпишитесь", "read more", "subscribe", "поделиться", "поширити",
+    "все права защищены", "всі права захищені", "all rights reserved",
+)
+# Подписи, за которыми идет двоеточие или тире: "Фото: ...", "Источник: РБК"
+CREDIT_LABELS = ("фото", "источник", "джерело")
+_BOILERPLATE_RE = re.compile(
+    r"^[\W\d_]*(?:(?:" + "|".join(re.escape(m) for m in BOILERPLATE) + r")(?!\w)"
+    r"|(?:" + "|".join(CREDIT_LABELS) + r")\s*[:\-–—])"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+def is_boilerplate(line: str) -> bool:
+    """
+    Служебная строка целиком: начинается с маркера или короткая, без цифр и без
+    точки в конце (пункт меню, подпись к фото). Предложения внутри абзацев не трогаем.
+    """
+    line = " ".join(line.split())
+    if len(line) < MIN_SENTENCE_CHARS and not any(ch.isdigit() for ch in line) and not line.endswith((".", "!", "?", "…")):
+        return True
+    return bool(_BOILERPLATE_RE.match(line.lower()))
+
+
+def split_sentences(text: str) -> list[str]:
+    sentences = []
+    for piece in _SENTENCE_RE.split(text or ""):
+        piece = " ".join(piece.split())
+        if piece:
+            sentences.append(piece)
+    return sentences
+
+
+def _select(vectors: np.ndarray, costs: list[int], budget: int, diversity: float) -> list[int]:
+    """
+    Жадный MMR: важность предложения (косинус к центроиду текста плюс бонус
+    лида) минус сходство с уже выбранными, пока помещаются в бюджет токенов.
+    """
+    centroid = vectors.mean(axis=0)
+    norm = np.linalg.norm(centroid)
+    salience = vectors @ (centroid / norm) if norm else np.zeros(len(vectors))
+    salience[1:LEAD_SENTENCES] += LEAD_BONUS
+
+    chosen: list[int] = []
+    redundancy = np.zeros(len(vectors))
+    candidates = set(range(len(vectors)))
+    used = 0
+    while candidates:
+        if not chosen and 0 in candidates:
+            best = 0
+        else:
+            best = max(candidates, key=lambda i: (1 - diversity) * salience[i] - diversity * redundancy[i])
+        candidates.discard(best)
+        if used + costs[best] > budget:
+            continue
+        chosen.append(best)
+        used += costs[best]
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+    return sorted(chosen)
+
+
+def compress(text: str, budget_tokens: int, encode=None, call: str = "analysis",
+             diversity: float = COMPRESS_DIVERSITY) -> str:
+    """
+    Экстрактивное сжатие текста под бюджет токенов. Текст, который и так
+    помещается, уходит без изменений; иначе служебные строки выбрасываются,
+    из остальных предложений выбираются самые важные и непохожие друг на друга
+    (эмбеддинги encode — SentenceTransformer.encode из MemoryHandler) и
+    склеиваются в исходном порядке. Без encode — предложения с начала текста.
+    Сколько токенов ушло и сэкономлено, пишется в счетчики prompt_tokens{call=...}.
+    """
+    original = estimate_tokens(text)
+    if original <= budget_tokens:
+        telemetry.incr("prompt_tokens", original, call=call)
+        return text
+
+    lines = [line for line in (text or "").splitlines() if line.strip() and not is_boilerplate(line)]
+    sentences = split_sentences("\n".join(lines))[:COMPRESS_MAX_SENTENCES]
+    costs = [estimate_tokens(s) for s in sentences]
+
+    if sum(costs) <= budget_tokens:
+        chosen = list(range(len(sentences)))
+    elif encode is None:
+        chosen, used = [], 0
+        for i, cost in enumerate(costs):
+            if used + cost > budget_tokens:
+                break
+            chosen.append(i)
+            used += cost
+    else:
+        with telemetry.span("compress", call=call, sentences=len(sentences)):
+            vectors = np.asarray(encode(sentences, normalize_embeddings=True))
+            chosen = _select(vectors, costs, budget_tokens, diversity)
+
+    result = "\n".join(sentences[i] for i in chosen)
+    if not result:
+        # Текст без знаков препинания или из одних служебных строк: просто обрезаем
+        result = text[:budget_tokens * CHARS_PER_TOKEN]
+    sent = estimate_tokens(result)
+    telemetry.incr("prompt_tokens", sent, call=call)
+    telemetry.incr("prompt_tokens_saved", max(original - sent, 0), call=call)
+    logger.debug(
+        f"[{telemetry.current_trace()}] Сжатие ({call}): {original} -> {sent} ток., "
+        f"{len(chosen)} из {len(sentences)} предложений"
+    )
+    return result
@@ -7,6 +7,93 @@ API_KEY = os.getenv("API_KEY")
 SEARCH_ENGINE_ID = os.getenv("SEARCH_ENGINE_ID")
 GEMINI_KEY = os.getenv("GEMINI_KEY")
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT")
+# Другой Bot API сервер (локальный telegram-bot-api или фейковый для нагрузочных тестов)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# Адреса внешних API переопределяются для офлайн-бенчмарков (benchmarks/bench_pipeline.py)
+GEMINI_API_URL = os.getenv("GEMINI_API_URL")
+SEARCH_API_URL = os.getenv("SEARCH_API_URL", "https://www.googleapis.com/customsearch/v1")
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "4"))
+
+DATABASE_URL = os.getenv("DATABASE_URL") or "sqlite:///data.db"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", "30"))
+
+MONITOR_INTERVAL_MINUTES = int(os.getenv("MONITOR_INTERVAL_MINUTES", "60"))
+MONITOR_WATCHLIST = [q.strip() for q in os.getenv("MONITOR_WATCHLIST", "").split(",") if q.strip()]
+MONITOR_TRENDS_LIMIT = int(os.getenv("MONITOR_TRENDS_LIMIT", "5"))
+MONITOR_RESULTS_PER_TOPIC = int(os.getenv("MONITOR_RESULTS_PER_TOPIC", "3"))
+MONITOR_RECHECK_HOURS = int(os.getenv("MONITOR_RECHECK_HOURS", "24"))
+
+TRENDS_FEEDS = [u.strip() for u in os.getenv(
+    "TRENDS_FEEDS",
+    "https://news.google.com/rss?hl=ru&gl=UA&ceid=UA:ru,https://news.google.com/rss?hl=uk&gl=UA&ceid=UA:uk"
+).split(",") if u.strip()]
+TRENDS_TTL = int(os.getenv("TRENDS_TTL", "600"))
+TRENDS_CLUSTER_THRESHOLD = float(os.getenv("TRENDS_CLUSTER_THRESHOLD", "0.35"))
+
+CROSSCHECK_MODE = os.getenv("CROSSCHECK_MODE", "auto")  # auto | flat | hierarchical
+CROSSCHECK_SOURCE_TOKENS = int(os.getenv("CROSSCHECK_SOURCE_TOKENS", "1500"))
+CROSSCHECK_MAX_CHUNKS = int(os.getenv("CROSSCHECK_MAX_CHUNKS", "4"))
+CROSSCHECK_REDUCE_TOKENS = int(os.getenv("CROSSCHECK_REDUCE_TOKENS", "6000"))
+CROSSCHECK_FLAT_TOKENS = int(os.getenv("CROSSCHECK_FLAT_TOKENS", "8000"))
+
+# Бюджеты токенов на текст статьи в запросах к Gemini (сжатие, compressor.py);
+# по умолчанию столько же, сколько раньше уходило обрезкой text[:3000] и [:4000]
+ANALYSIS_TEXT_TOKENS = int(os.getenv("ANALYSIS_TEXT_TOKENS", "1000"))
+CROSSCHECK_FLAT_SOURCE_TOKENS = int(os.getenv("CROSSCHECK_FLAT_SOURCE_TOKENS", "1300"))
+COMPRESS_MAX_SENTENCES = int(os.getenv("COMPRESS_MAX_SENTENCES", "300"))
+# 0 — только важность предложений, 1 — только непохожесть на уже выбранные
+COMPRESS_DIVERSITY = float(os.getenv("COMPRESS_DIVERSITY", "0.3"))
+
+DIGEST_MAX_ARTICLES = int(os.getenv("DIGEST_MAX_ARTICLES", "8"))
+DIGEST_SOURCE_CHARS = int(os.getenv("DIGEST_SOURCE_CHARS", "8000"))
+
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_STALE_MINUTES = int(os.getenv("JOB_STALE_MINUTES", "15"))
+# Воркер отмечает живую задачу не реже чем раз в JOB_HEARTBEAT_SECONDS, поэтому
+# долгий разбор не считается зависшим
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_REUSE_SECONDS = int(os.getenv("JOB_REUSE_SECONDS", "300"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+# 1 — воркеры очереди запущены снаружи (main.py --web, отдельный сервис), иначе
+# web_app.py поднимает JOB_WORKERS воркеров сам
+JOB_WORKERS_EXTERNAL = os.getenv("JOB_WORKERS_EXTERNAL", "0") == "1"
+
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", "report_cache")
+REPORT_CACHE_MAX_FILES = int(os.getenv("REPORT_CACHE_MAX_FILES", "200"))
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "3"))
+BOT_QUEUE_SIZE = int(os.getenv("BOT_QUEUE_SIZE", "20"))
+BOT_USER_CONCURRENCY = int(os.getenv("BOT_USER_CONCURRENCY", "1"))
+BOT_RESULT_TTL = int(os.getenv("BOT_RESULT_TTL", "600"))
+BOT_NUM_RESULTS = int(os.getenv("BOT_NUM_RESULTS", "3"))
+BOT_EDIT_INTERVAL = float(os.getenv("BOT_EDIT_INTERVAL", "1.5"))
+# Кнопки демо-поиска в /start: callback_data -> запрос
+BOT_DEMO_TOPICS = {
+    "demo_usa": "Выборы в США 2025",
+    "demo_btc": "Курс Биткоина прогнозы",
+}
+
+BOT_WEBHOOK_HOST = os.getenv("BOT_WEBHOOK_HOST", "0.0.0.0")
+BOT_WEBHOOK_PORT = int(os.getenv("BOT_WEBHOOK_PORT", "8081"))
+BOT_WEBHOOK_PATH = os.getenv("BOT_WEBHOOK_PATH", "/telegram/webhook")
+BOT_WEBHOOK_URL = os.getenv("BOT_WEBHOOK_URL")  # Публичный https-адрес; пусто = не регистрировать вебхук
+BOT_WEBHOOK_SECRET = os.getenv("BOT_WEBHOOK_SECRET")
+BOT_PROCESSES = int(os.getenv("BOT_PROCESSES", "2"))
+BOT_DRAIN_SECONDS = int(os.getenv("BOT_DRAIN_SECONDS", "30"))
+
+# Порты /metrics (Prometheus); 0 = не поднимать. Воркеры вебхука берут METRICS_PORT+1+номер,
+# воркеры очереди (main.py --web или web_app.py) — JOB_METRICS_PORT+номер
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+WEB_METRICS_PORT = int(os.getenv("WEB_METRICS_PORT", "0"))
+JOB_METRICS_PORT = int(os.getenv("JOB_METRICS_PORT", "0"))
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+EXPORT_PARQUET = os.getenv("EXPORT_PARQUET", "0") == "1"
 
 
 TRUSTED_DOMAINS = {
@@ -24,6 +111,53 @@ PLATFORM_DOMAINS = {
     'blogspot.com', 'livejournal.com', 'teletype.in'
 }
 
+# Внешние списки репутации (trusted*.txt, fake*.txt, platform*.txt) и собранный из них индекс
+REPUTATION_DIR = os.getenv("REPUTATION_DIR", "reputation")
+REPUTATION_INDEX = os.getenv("REPUTATION_INDEX", "reputation.idx")
+REPUTATION_RELOAD_SECONDS = float(os.getenv("REPUTATION_RELOAD_SECONDS", "5"))
+
+# Словари кликбейта (файл = категория) и параметры оценки, см. clickbait.py
+CLICKBAIT_DIR = os.getenv("CLICKBAIT_DIR", "clickbait")
+CLICKBAIT_TEXT_CHARS = int(os.getenv("CLICKBAIT_TEXT_CHARS", "20000"))
+CLICKBAIT_SCALE = float(os.getenv("CLICKBAIT_SCALE", "6"))
+# Метка в рейтинге ставится начиная с этой оценки
+CLICKBAIT_MIN_SCORE = int(os.getenv("CLICKBAIT_MIN_SCORE", "25"))
+
+# Контекст из долгосрочной памяти (memory.py): сколько статей и из скольких кандидатов,
+# минимальное косинусное сходство, затухание по дате публикации (период полураспада
+# в днях и доля оценки, которая от него зависит), вес разнообразия в MMR и окно,
+# за которое параллельные запросы собираются в одну пачку
+MEMORY_RESULTS = int(os.getenv("MEMORY_RESULTS", "3"))
+MEMORY_CANDIDATES = int(os.getenv("MEMORY_CANDIDATES", "12"))
+MEMORY_MIN_SIMILARITY = float(os.getenv("MEMORY_MIN_SIMILARITY", "0.45"))
+MEMORY_HALF_LIFE_DAYS = float(os.getenv("MEMORY_HALF_LIFE_DAYS", "30"))
+MEMORY_RECENCY_WEIGHT = float(os.getenv("MEMORY_RECENCY_WEIGHT", "0.3"))
+MEMORY_DIVERSITY = float(os.getenv("MEMORY_DIVERSITY", "0.3"))
+MEMORY_BATCH_WINDOW = float(os.getenv("MEMORY_BATCH_WINDOW", "0.02"))
+# Где лежат векторы памяти: chroma (chroma_db) или mmap — vector_store.py, папка
+# MEMORY_STORE_PATH; перенос: python vector_store.py --migrate chroma_db [--hnsw]
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "chroma").lower()
+MEMORY_STORE_PATH = os.getenv("MEMORY_STORE_PATH", "memory_store")
+MEMORY_STORE_DTYPE = os.getenv("MEMORY_STORE_DTYPE", "float16")
+# Помесячные партиции памяти (memory_partitions.py): month или none (одна коллекция).
+# Поиск идет по последним MEMORY_WINDOW_MONTHS месяцам; месяцы старше
+# MEMORY_COMPACT_AFTER_MONTHS сжимаются до центроидов сюжетов, старше
+# MEMORY_RETENTION_MONTHS удаляются (0 — хранить всегда). Уплотнение запускает
+# планировщик (main.py --daemon) не чаще раза в MEMORY_COMPACT_INTERVAL_HOURS
+MEMORY_PARTITIONS = os.getenv("MEMORY_PARTITIONS", "month").lower()
+MEMORY_WINDOW_MONTHS = int(os.getenv("MEMORY_WINDOW_MONTHS", "12"))
+MEMORY_COMPACT_AFTER_MONTHS = int(os.getenv("MEMORY_COMPACT_AFTER_MONTHS", "3"))
+MEMORY_RETENTION_MONTHS = int(os.getenv("MEMORY_RETENTION_MONTHS", "36"))
+MEMORY_COMPACT_SIMILARITY = float(os.getenv("MEMORY_COMPACT_SIMILARITY", "0.8"))
+MEMORY_COMPACT_INTERVAL_HOURS = float(os.getenv("MEMORY_COMPACT_INTERVAL_HOURS", "6"))
+
+# Локальный триаж перед Gemini (triage.py): off — без прогноза, shadow — только сравнивать
+# прогноз с ответом Gemini, on — не отправлять статьи с вероятностью пользы ниже порога.
+# Образцы для обучения собираются при каждом вызове Gemini в любом режиме
+TRIAGE_MODE = os.getenv("TRIAGE_MODE", "off").lower()
+TRIAGE_THRESHOLD = float(os.getenv("TRIAGE_THRESHOLD", "0.3"))
+TRIAGE_MODEL_PATH = os.getenv("TRIAGE_MODEL_PATH", "triage_model.json")
+
 CLICKBAIT_TRIGGERS = {
     # Триггер-слова
     'шок',
@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import json
+import re
+from urllib.parse import urlparse
+from loguru import logger
+
+from config import (
+    CROSSCHECK_SOURCE_TOKENS, CROSSCHECK_MAX_CHUNKS, CROSSCHECK_REDUCE_TOKENS, CROSSCHECK_FLAT_TOKENS
+)
+from database import DatabaseHandler
+from compressor import compress, estimate_tokens, CHARS_PER_TOKEN
+from gemini_client import generate_text
+from trends_client import title_tokens
+import telemetry
+
+TOKENS_PER_CLAIM = 40
+# Постоянное число фактов с фрагмента: от него зависит ключ кеша, поэтому оно
+# не должно меняться при добавлении новых статей
+CLAIMS_PER_CHUNK = 10
+EXTRACT_PROMPT_VERSION = "1"
+CLAIM_SIMILARITY = 0.45
+FLAT_SNIPPET_CHARS = 4000
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+
+
+def split_text(text: str, max_chars: int) -> list[str]:
+    """Режет текст на куски до max_chars по границам абзацев (длинный абзац — по предложениям)."""
+    chunks, current = [], ""
+    for paragraph in _PARAGRAPH_RE.split(text.strip()):
+        pieces = [paragraph]
+        if len(paragraph) > max_chars:
+            pieces = re.split(r"(?<=[.!?])\s+", paragraph)
+        for piece in pieces:
+            if current and len(current) + len(piece) + 2 > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+            while len(current) > max_chars:
+                chunks.append(current[:max_chars])
+                current = current[max_chars:]
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def plan_budget(articles: list, source_tokens: int = CROSSCHECK_SOURCE_TOKENS,
+                max_chunks: int = CROSSCHECK_MAX_CHUNKS, reduce_tokens: int = CROSSCHECK_REDUCE_TOKENS,
+                encode=None) -> dict:
+    """
+    Бюджет токенов кросс-анализа. Каждый источник режется на куски по source_tokens
+    (не больше max_chunks на источник), с каждого куска извлекается до CLAIMS_PER_CHUNK
+    фактов. Источник длиннее max_chunks кусков сначала сжимается (compressor.compress),
+    чтобы важное из конца текста не отрезалось. Если все факты не помещаются в
+    reduce_tokens, в финальный запрос идут сначала группы, подтвержденные
+    несколькими источниками (format_clusters).
+    """
+    sources = []
+    for i, art in enumerate(articles):
+        text = art['text_content']
+        chunks = split_text(text, source_tokens * CHARS_PER_TOKEN)
+        if len(chunks) > max_chunks:
+            logger.warning(
+                f"Источник {i + 1}: текст длиннее бюджета ({len(chunks)} фрагментов), сжимаю до {max_chunks}"
+            )
+            # Запас на переносы между кусками: split_text режет по абзацам, а не по токенам
+            compressed = compress(text, int(max_chunks * source_tokens * 0.9), encode, call="crosscheck")
+            chunks = split_text(compressed, source_tokens * CHARS_PER_TOKEN)
+        sources.append({
+            'index': i + 1,
+            'url': art.get('url', ''),
+            'domain': urlparse(art.get('url', '')).netloc.replace('www.', ''),
+            'chunks': chunks[:max_chunks],
+            'tokens': estimate_tokens(text),
+        })
+
+    total_chunks = sum(len(src['chunks']) for src in sources)
+    return {
+        'sources': sources,
+        'claims_per_chunk': CLAIMS_PER_CHUNK,
+        'claims_tokens': total_chunks * CLAIMS_PER_CHUNK * TOKENS_PER_CLAIM,
+        'map_tokens': sum(estimate_tokens(chunk) for src in sources for chunk in src['chunks']),
+        'reduce_tokens': reduce_tokens,
+        'total_tokens': sum(src['tokens'] for src in sources),
+    }
+
+
+def fits_flat(articles: list, budget: int = CROSSCHECK_FLAT_TOKENS) -> bool:
+    """Старый однопроходный режим дешевле, пока тексты короткие и ничего не обрезается."""
+    return all(len(a['text_content']) <= FLAT_SNIPPET_CHARS for a in articles) and \
+        sum(estimate_tokens(a['text_content']) for a in articles) <= budget
+
+
+def _extraction_key(chunk: str, claims_limit: int) -> str:
+    payload = f"{EXTRACT_PROMPT_VERSION}|{claims_limit}|{chunk}"
+    return "claims:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _parse_claims(raw: str) -> list[dict]:
+    raw = (raw or "").strip()
+    raw = re.sub(r"^```(?:json)?|```$", "", raw, flags=re.MULTILINE).strip()
+    try:
+        data = json.loads(raw)
+        if isinstance(data, dict):
+            data = data.get('claims', [])
+        claims = []
+        for entry in data:
+            if isinstance(entry, str):
+                entry = {'claim': entry}
+            if isinstance(entry, dict) and entry.get('claim'):
+                claims.append({'claim': str(entry['claim']).strip(), 'kind': str(entry.get('kind') or 'fact')})
+        return claims
+    except (ValueError, TypeError):
+        # Модель ответила списком вместо JSON: берем строки-буллиты
+        return [
+            {'claim': line.lstrip("-•* ").strip(), 'kind': 'fact'}
+            for line in raw.splitlines() if line.strip().startswith(("-", "•", "*"))
+        ]
+
+
+async def _extract_chunk(chunk: str, domain: str, claims_limit: int) -> list[dict]:
+    prompt = f"""
+    Ты — фактчекер. Выпиши из фрагмента статьи ({domain}) не больше {claims_limit} ключевых утверждений.
+    Каждое утверждение — одно короткое самостоятельное предложение с конкретикой
+    (кто, что, где, когда, цифры). Оценочные суждения автора помечай kind = "opinion",
+    цифры и даты — kind = "number", прямые цитаты — kind = "quote", остальное — kind = "fact".
+
+    Ответь строго JSON-массивом: [{{"claim": "...", "kind": "fact"}}]
+
+    Фрагмент:
+    "{chunk}"
+    """
+    return _parse_claims(await generate_text(prompt, json_output=True))
+
+
+async def extract_claims(plan: dict, db: DatabaseHandler | None = None) -> list[dict]:
+    """
+    Map-шаг: факты из каждого фрагмента каждого источника, параллельно (с лимитом
+    GEMINI_CONCURRENCY). Уже извлеченные фрагменты берутся из ai_cache, так что
+    повтор кросс-анализа с одной новой статьей стоит одного нового извлечения.
+    """
+    db = db or DatabaseHandler()
+    limit = plan['claims_per_chunk']
+    jobs = [(src, chunk, _extraction_key(chunk, limit)) for src in plan['sources'] for chunk in src['chunks']]
+    cached = await asyncio.to_thread(db.get_ai_cache, [key for _, _, key in jobs])
+
+    missing = [(src, chunk, key) for src, chunk, key in jobs if key not in cached]
+    telemetry.incr("cache_hits", len(jobs) - len(missing), cache="claims")
+    telemetry.incr("cache_misses", len(missing), cache="claims")
+    logger.info(f"Кросс-анализ: фрагментов {len(jobs)}, из кеша {len(jobs) - len(missing)}")
+
+    results = await asyncio.gather(*[
+        _extract_chunk(chunk, src['domain'], limit) for src, chunk, _ in missing
+    ], return_exceptions=True)
+
+    fresh = {}
+    for (src, _, key), claims in zip(missing, results):
+        if isinstance(claims, Exception):
+            logger.error(f"Не удалось извлечь факты из источника {src['index']}: {claims}")
+            continue
+        fresh[key] = json.dumps(claims, ensure_ascii=False)
+    await asyncio.to_thread(db.save_ai_cache, 'claims', fresh)
+    cached.update(fresh)
+
+    all_claims = []
+    for src, _, key in jobs:
+        for claim in json.loads(cached.get(key, "[]")):
+            all_claims.append({**claim, 'source': src['index']})
+    return all_claims
+
+
+def cluster_claims(claims: list[dict], encode=None, threshold: float = CLAIM_SIMILARITY) -> list[list[dict]]:
+    """
+    Группирует утверждения об одном и том же. С encode (SentenceTransformer.encode)
+    сравнение по косинусу эмбеддингов, без него — по пересечению слов.
+    Кластеры, подтвержденные большим числом источников, идут первыми.
+    """
+    if not claims:
+        return []
+    if encode is not None:
+        vectors = encode([c['claim'] for c in claims], normalize_embeddings=True)
+
+        def similarity(i, j):
+            return float(vectors[i] @ vectors[j])
+    else:
+        tokens = [title_tokens(c['claim']) for c in claims]
+
+        def similarity(i, j):
+            union = tokens[i] | tokens[j]
+            return len(tokens[i] & tokens[j]) / len(union) if union else 0.0
+
+    clusters: list[list[int]] = []
+    for i in range(len(claims)):
+        best, best_score = None, threshold
+        for cluster in clusters:
+            score = similarity(i, cluster[0])
+            if score >= best_score:
+                best, best_score = cluster, score
+        if best is None:
+            clusters.append([i])
+        else:
+            best.append(i)
+
+    grouped = [[claims[i] for i in cluster] for cluster in clusters]
+    grouped.sort(key=lambda group: -len({c['source'] for c in group}))
+    return grouped
+
+
+def format_clusters(clusters: list[list[dict]], max_tokens: int) -> str:
+    lines, used = [], 0
+    for group in clusters:
+        sources = sorted({c['source'] for c in group})
+        label = ", ".join(f"И{s}" for s in sources)
+        variants = list(dict.fromkeys(f"[И{c['source']}] {c['claim']}" for c in group))
+        if len(variants) == 1:
+            block = f"- ({label}) {group[0]['claim']}"
+        else:
+            block = f"- ({label}) " + "\n    ".join(variants)
+        cost = estimate_tokens(block)
+        if used + cost > max_tokens:
+            lines.append(f"- ... (еще {len(clusters) - len(lines)} групп не вошли в бюджет)")
+            break
+        lines.append(block)
+        used += cost
+    return "\n".join(lines)
+
+
+async def hierarchical_cross_check(articles: list, encode=None) -> str:
+    """Кросс-анализ в три шага: извлечение фактов по источникам -> кластеры -> одно сравнение."""
+    plan = plan_budget(articles, encode=encode)
+    claims = await extract_claims(plan)
+    if not claims:
+        return "❌ Не удалось извлечь факты ни из одного источника."
+
+    clusters = cluster_claims(claims, encode)
+    sources_list = "\n".join(f"И{src['index']} — {src['domain']}" for src in plan['sources'])
+    claims_text = format_clusters(clusters, plan['reduce_tokens'])
+    logger.info(
+        f"Кросс-анализ: {len(claims)} утверждений -> {len(clusters)} групп, "
+        f"текста источников ~{plan['total_tokens']} ток., в сравнение ~{estimate_tokens(claims_text)} ток."
+    )
+
+    prompt = f"""
+    Ты — профессиональный аналитик медиа и OSINT-специалист.
+    Твоя задача: провести перекрестный анализ (Cross-Check) статей об одном или схожих событиях.
+    Статьи уже разобраны на утверждения. Утверждения об одном и том же сгруппированы;
+    в скобках указано, какие источники (И1, И2, ...) их содержат. Если в группе несколько
+    формулировок, сравни их: расхождения в цифрах, датах и виновниках — главное, что нужно найти.
+
+    ИСТОЧНИКИ:
+    {sources_list}
+
+    УТВЕРЖДЕНИЯ:
+    {claims_text}
+
+    ЗАДАЧА:
+    Напиши сводный отчет в формате Markdown.
+
+    СТРУКТУРА ОТЧЕТА:
+    1. 📝 **Краткая суть события**: (О чем вообще речь, 2-3 предложения, факты, подтвержденные всеми).
+    2. ⚖️ **Сравнение нарративов**:
+       - Как разные источники подают информацию?
+       - Есть ли эмоциональная окраска (кто обвиняет, кто защищает)?
+    3. 🔍 **Противоречия и Умолчания**:
+       - В чем источники расходятся (цифры, даты, виновники)?
+       - Есть ли факты, которые один источник выпячивает, а другой скрывает?
+    4. 🏆 **Вердикт**:
+       - Какой источник выглядит наиболее нейтральным и фактологическим?
+       - Есть ли признаки скоординированной пропаганды?
+
+    Пиши четко, используй буллиты. Не лей воду.
+    """
+    text = await generate_text(prompt)
+    return text or "❌ Ошибка: AI не вернул текст"
@@ -0,0 +1,74 @@
+import threading
+import pandas as pd
+
+from database import DatabaseHandler
+import telemetry
+
+
+class VersionedCache:
+    """
+    Кеш данных дашборда, привязанный к счетчику изменений базы.
+    Пока версия не изменилась, датафреймы и графики отдаются из памяти;
+    любая запись в articles увеличивает версию и сбрасывает весь кеш.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.values = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name: str, version: int, compute):
+        with self.lock:
+            if version != self.version:
+                self.values.clear()
+                self.version = version
+            if name in self.values:
+                self.hits += 1
+                telemetry.cache_hit("dashboard")
+                return self.values[name]
+
+        # Считаем вне блокировки: параллельные сессии не ждут друг друга,
+        # в худшем случае одно и то же значение посчитается дважды
+        value = compute()
+        telemetry.cache_hit("dashboard", hit=False)
+        with self.lock:
+            self.misses += 1
+            if version == self.version:
+                self.values[name] = value
+        return value
+
+
+def clean_ratings(ratings: pd.Series) -> pd.Series:
+    """'Рейтинг: Высокое доверие (95%) | ...' -> 'Высокое доверие'."""
+    return (
+        ratings.astype(str)
+        .str.split('|', n=1).str[0]
+        .str.replace('Рейтинг:', '', regex=False)
+        .str.split('(', n=1).str[0]
+        .str.strip()
+    )
+
+
+def load_history(db: DatabaseHandler) -> pd.DataFrame:
+    df = db.get_all_articles_df()
+    if df.empty:
+        return df
+    df['clean_rating'] = clean_ratings(df['rating'])
+    df['published_date'] = pd.to_datetime(df['published_date'], errors='coerce', utc=True)
+    df['date_parsed'] = df['published_date'].dt.date
+    return df
+
+
+def rating_counts(df: pd.DataFrame) -> pd.DataFrame:
+    counts = df['clean_rating'].value_counts().reset_index()
+    counts.columns = ['Источник', 'Кол-во']
+    return counts
+
+
+def date_counts(df: pd.DataFrame) -> pd.DataFrame:
+    valid_dates = df['date_parsed'].dropna()
+    counts = valid_dates.value_counts().reset_index()
+    counts.columns = ['Дата', 'Статей']
+    return counts.sort_values('Дата')
@@ -1,10 +1,17 @@
+import asyncio
 import datetime
-from sqlalchemy import create_engine, Column, String, Text, Integer
+import os
+from sqlalchemy import create_engine, event, select, update, Column, String, Text, Integer
 from sqlalchemy.orm import sessionmaker, declarative_base, scoped_session, Mapped, mapped_column
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from loguru import logger
 import pandas as pd
 
+import telemetry
+from config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_BUSY_TIMEOUT
+
 Base = declarative_base()
 
 class ArticleModel(Base):
@@ -20,50 +27,191 @@ class ArticleModel(Base):
     ai_analysis: Mapped[str | None] = mapped_column(Text, nullable=True)
 
 
+class CrawlStateModel(Base):
+    """Валидаторы HTTP-кеша по URL для инкрементального обхода (scheduler.py)."""
+    __tablename__ = 'crawl_state'
+
+    url: Mapped[str] = mapped_column(String, primary_key=True)
+    etag: Mapped[str | None] = mapped_column(String, nullable=True)
+    last_modified: Mapped[str | None] = mapped_column(String, nullable=True)
+    last_checked: Mapped[str | None] = mapped_column(String, nullable=True)
+
+
+class ChangeCounterModel(Base):
+    """Монотонный счетчик изменений таблиц: по нему веб-интерфейс сбрасывает кеши."""
+    __tablename__ = 'change_counters'
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class AICacheModel(Base):
+    """Кеш промежуточных ответов AI (извлеченные факты и т.п.) по хешу входа."""
+    __tablename__ = 'ai_cache'
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    kind: Mapped[str] = mapped_column(String, index=True)
+    value: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[str] = mapped_column(String)
+
+
+class JobModel(Base):
+    """Очередь задач веб-интерфейса (job_queue.py)."""
+    __tablename__ = 'jobs'
+
+    id: Mapped[str] = mapped_column(String, primary_key=True)
+    kind: Mapped[str] = mapped_column(String)
+    query: Mapped[str | None] = mapped_column(String, nullable=True)
+    num_results: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    dedupe_key: Mapped[str] = mapped_column(String, index=True)
+    status: Mapped[str] = mapped_column(String, index=True)
+    progress: Mapped[str | None] = mapped_column(String, nullable=True)
+    progress_value: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    result: Mapped[str | None] = mapped_column(Text, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[str | None] = mapped_column(String, nullable=True)
+    updated_at: Mapped[str | None] = mapped_column(String, nullable=True)
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT * 1000}")
+    cursor.close()
+
+
+def build_engine(db_url: str):
+    """
+    SQLite (по умолчанию) работает в WAL-режиме с busy_timeout, чтобы бот, Streamlit и CLI
+    могли писать одновременно. Для PostgreSQL и других серверных БД создается пул соединений.
+    """
+    if db_url.startswith("sqlite"):
+        engine = create_engine(
+            db_url,
+            connect_args={"check_same_thread": False, "timeout": DB_BUSY_TIMEOUT}
+        )
+        event.listen(engine, "connect", _sqlite_pragmas)
+        return engine
+
+    return create_engine(
+        db_url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=1800
+    )
+
+
 class DatabaseHandler:
     _instance = None
 
-    def __new__(cls, db_path="sqlite:///data.db"):
+    def __new__(cls, db_path=None):
         if cls._instance is None:
             cls._instance = super(DatabaseHandler, cls).__new__(cls)
-            cls._instance._initialize(db_path)
+            cls._instance._initialize(db_path or DATABASE_URL)
         return cls._instance
 
     def _initialize(self, db_path):
-        self.engine = create_engine(db_path, connect_args={"check_same_thread": False})
+        self.db_url = db_path
+        self.engine = build_engine(db_path)
+        self._pid = os.getpid()
         Base.metadata.create_all(self.engine)
         self.Session = scoped_session(sessionmaker(bind=self.engine))
-        logger.info("DatabaseHandler инициализирован (Singleton).")
+        logger.info(f"DatabaseHandler инициализирован (Singleton, {self.engine.dialect.name}).")
 
     def get_session(self):
+        # Соединения пула нельзя переиспользовать в дочернем процессе после fork
+        if os.getpid() != self._pid:
+            self.engine.dispose(close=False)
+            self._pid = os.getpid()
         return self.Session()
 
-    def save_article(self, data: dict, query: str):
+    def _upsert_statement(self, rows: list[dict], model=ArticleModel, key: str = 'url'):
+        insert = pg_insert if self.engine.dialect.name == "postgresql" else sqlite_insert
+        stmt = insert(model).values(rows)
+        update_cols = {c: stmt.excluded[c] for c in rows[0] if c != key}
+        return stmt.on_conflict_do_update(index_elements=[key], set_=update_cols)
+
+    def _bump_version(self, session, name: str):
+        """
+        Увеличивает счетчик изменений в той же транзакции, что и сама запись.
+        Первая запись счетчика — тоже upsert: два процесса, одновременно пишущие
+        в пустую базу, не должны упасть на конфликте ключа и откатить статьи.
+        """
+        if self.engine.dialect.name in ("sqlite", "postgresql"):
+            insert = pg_insert if self.engine.dialect.name == "postgresql" else sqlite_insert
+            session.execute(
+                insert(ChangeCounterModel).values(name=name, version=1)
+                .on_conflict_do_update(index_elements=['name'], set_={'version': ChangeCounterModel.version + 1})
+            )
+            return
+        updated = session.execute(
+            update(ChangeCounterModel)
+            .where(ChangeCounterModel.name == name)
+            .values(version=ChangeCounterModel.version + 1)
+        )
+        if updated.rowcount == 0:
+            session.add(ChangeCounterModel(name=name, version=1))
+
+    def get_change_version(self, name: str = 'articles') -> int:
         session = self.get_session()
         try:
-            article = session.query(ArticleModel).filter_by(url=data['url']).first()
-            if not article:
-                article = ArticleModel(url=data['url'])
-                session.add(article)
-
-            article.title = data.get('title')
-            article.published_date = data.get('published_date')
-            article.rating = data.get('rating')
-            article.status = data.get('status')
-            article.search_query = query
-            article.retrieved_at = datetime.datetime.now().isoformat()
-            article.ai_analysis = data.get('ai_analysis')
+            version = session.execute(
+                select(ChangeCounterModel.version).where(ChangeCounterModel.name == name)
+            ).scalar()
+            return version or 0
+        except Exception as e:
+            logger.error(f"Ошибка чтения счетчика изменений: {e}")
+            return -1
+        finally:
+            session.close()
 
-            session.commit()
-            return True
+    def _article_row(self, data: dict, query: str) -> dict:
+        return {
+            'url': data['url'],
+            'title': data.get('title'),
+            'published_date': data.get('published_date'),
+            'rating': data.get('rating'),
+            'status': data.get('status'),
+            'search_query': query,
+            'retrieved_at': datetime.datetime.now().isoformat(),
+            'ai_analysis': data.get('ai_analysis'),
+        }
+
+    def save_article(self, data: dict, query: str):
+        return self.save_articles([data], query) == 1
+
+    def save_articles(self, items: list[dict], query: str) -> int:
+        """Сохраняет пачку статей одной транзакцией (upsert по url)."""
+        rows = [self._article_row(item, query) for item in items if item and item.get('url')]
+        if not rows:
+            return 0
+
+        session = self.get_session()
+        try:
+            with telemetry.span("db_write", rows=len(rows)):
+                if self.engine.dialect.name in ("sqlite", "postgresql"):
+                    session.execute(self._upsert_statement(rows))
+                else:
+                    for row in rows:
+                        session.merge(ArticleModel(**row))
+                self._bump_version(session, 'articles')
+                session.commit()
+            return len(rows)
 
         except Exception as e:
             session.rollback()
             logger.error(f"Ошибка ORM при сохранении: {e}")
-            return False
+            return 0
         finally:
             session.close()
 
+    async def asave_articles(self, items: list[dict], query: str) -> int:
+        return await asyncio.to_thread(self.save_articles, items, query)
+
+    async def aget_stats(self) -> dict:
+        return await asyncio.to_thread(self.get_stats)
 
     def get_all_articles_df(self):
         try:
@@ -73,6 +221,134 @@ class DatabaseHandler:
             logger.error(f"Ошибка чтения DataFrame: {e}")
             return pd.DataFrame()
 
+    def iter_articles(self, chunk_size: int = 1000, month: str | None = None):
+        """
+        Отдает таблицу articles порциями (keyset-пагинация по url), не загружая ее целиком.
+        month в формате YYYY-MM ограничивает выборку по дате проверки (retrieved_at).
+        """
+        columns = [c.name for c in ArticleModel.__table__.columns]
+        last_url = None
+        while True:
+            session = self.get_session()
+            try:
+                q = session.query(ArticleModel).order_by(ArticleModel.url)
+                if month:
+                    q = q.filter(ArticleModel.retrieved_at.like(f"{month}%"))
+                if last_url is not None:
+                    q = q.filter(ArticleModel.url > last_url)
+                rows = q.limit(chunk_size).all()
+                chunk = [{c: getattr(row, c) for c in columns} for row in rows]
+            finally:
+                session.close()
+
+            if not chunk:
+                return
+            yield chunk
+            last_url = chunk[-1]['url']
+
+    def get_crawl_states(self, urls: list[str]) -> dict[str, dict]:
+        """
+        Что известно о URL с прошлых обходов. Статьи из архива без записи в crawl_state
+        считаются проверенными в момент retrieved_at.
+        """
+        if not urls:
+            return {}
+        session = self.get_session()
+        try:
+            states = {
+                row.url: {'etag': row.etag, 'last_modified': row.last_modified, 'last_checked': row.last_checked}
+                for row in session.query(CrawlStateModel).filter(CrawlStateModel.url.in_(urls))
+            }
+            missing = [url for url in urls if url not in states]
+            if missing:
+                archived = session.query(ArticleModel.url, ArticleModel.retrieved_at).filter(
+                    ArticleModel.url.in_(missing)
+                )
+                for url, retrieved_at in archived:
+                    states[url] = {'etag': None, 'last_modified': None, 'last_checked': retrieved_at}
+            return states
+        except Exception as e:
+            logger.error(f"Ошибка чтения crawl_state: {e}")
+            return {}
+        finally:
+            session.close()
+
+    def save_crawl_states(self, states: list[dict]) -> int:
+        if not states:
+            return 0
+        session = self.get_session()
+        try:
+            if self.engine.dialect.name in ("sqlite", "postgresql"):
+                session.execute(self._upsert_statement(states, CrawlStateModel))
+            else:
+                for state in states:
+                    session.merge(CrawlStateModel(**state))
+            session.commit()
+            return len(states)
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Ошибка сохранения crawl_state: {e}")
+            return 0
+        finally:
+            session.close()
+
+    def get_ai_cache(self, keys: list[str]) -> dict[str, str]:
+        if not keys:
+            return {}
+        session = self.get_session()
+        try:
+            found = {}
+            for start in range(0, len(keys), 500):
+                rows = session.query(AICacheModel.key, AICacheModel.value) \
+                    .filter(AICacheModel.key.in_(keys[start:start + 500])).all()
+                found.update(dict(rows))
+            return found
+        except Exception as e:
+            logger.error(f"Ошибка чтения ai_cache: {e}")
+            return {}
+        finally:
+            session.close()
+
+    def iter_ai_cache(self, kind: str, chunk_size: int = 1000):
+        """Все записи ai_cache одного вида порциями (key, value), keyset-пагинация по key."""
+        last_key = None
+        while True:
+            session = self.get_session()
+            try:
+                q = session.query(AICacheModel.key, AICacheModel.value) \
+                    .filter(AICacheModel.kind == kind).order_by(AICacheModel.key)
+                if last_key is not None:
+                    q = q.filter(AICacheModel.key > last_key)
+                chunk = [tuple(row) for row in q.limit(chunk_size).all()]
+            finally:
+                session.close()
+
+            if not chunk:
+                return
+            yield chunk
+            last_key = chunk[-1][0]
+
+    def save_ai_cache(self, kind: str, values: dict[str, str]) -> int:
+        if not values:
+            return 0
+        now = datetime.datetime.now().isoformat()
+        rows = [{'key': k, 'kind': kind, 'value': v, 'created_at': now} for k, v in values.items()]
+        session = self.get_session()
+        try:
+            if self.engine.dialect.name in ("sqlite", "postgresql"):
+                session.execute(self._upsert_statement(rows, AICacheModel, key='key'))
+            else:
+                for row in rows:
+                    session.merge(AICacheModel(**row))
+            session.commit()
+            return len(rows)
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Ошибка сохранения ai_cache: {e}")
+            return 0
+        finally:
+            session.close()
+
     def get_stats(self):
         session = self.get_session()
         try:
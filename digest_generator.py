@@ -1,61 +1,143 @@
-import os
 import asyncio
-from google import genai
+import hashlib
 from loguru import logger
 
-async def generate_cynical_digest(articles_data: list, cynicism_level: int):
-    valid_articles = [ a for a in articles_data if a.get('text_content')]
-    if not valid_articles:
-        return "⚠️ Нет данных для генерации дайджеста."
+from config import DIGEST_MAX_ARTICLES, DIGEST_SOURCE_CHARS
+from database import DatabaseHandler
+from gemini_client import generate_text, stream_text
+import telemetry
 
-    context_text = ""
-    for i, art in enumerate(valid_articles[:5]):
-        context_text += f"\n=== ИСТОЧНИК {i+1}: {art.get('title')} ===\n{art['text_content'][:2000]}\n"
-
-        style_instuction = ""
-
-        if cynicism_level < 30:
-            style_instruction = """
-            Тон: Повествовательный, мягкий, контекстный.
-            Задача: Расскажи историю. Объясни, почему это важно, какие эмоции это вызывает у сторон, дай бэкграунд.
-            Можно использовать прилагательные и объяснять мнения аналитиков.
-            """
-        elif cynicism_level < 70:
-            style_instruction = """
-            Тон: Деловой, нейтральный, информационный.
-            Задача: Напиши классическую новостную заметку (Who, What, Where, When, Why).
-            Сбалансируй факты и контекст. Убери явную пропаганду, но оставь суть заявлений.
-            """
-        else:
-            style_instruction = """
-            Тон: ЭКСТРЕМАЛЬНО СУХОЙ, РОБОТИЗИРОВАННЫЙ, ФАКТОЛОГИЧЕСКИЙ.
-            ЗАПРЕЩЕНО: Использовать прилагательные (ошеломляющий, страшный, великий), вводные слова, мнения, эмоции.
-            ОСТАВИТЬ ТОЛЬКО: Даты, цифры, имена, конкретные действия (глаголы), геолокации.
-            Формат: Маркированный список сухих фактов. Если факт не подтвержден цифрой или документом — пометь как "Заявление".
-            Игнорируй "воду" и пиар-шум.
-            """
-
-        prompt = f"""
-        Ты — редактор новостной ленты. Твоя задача — синтезировать одну сводку из нескольких источников.
-
-        ВХОДНЫЕ ДАННЫЕ:
-        {context_text}
-
-        НАСТРОЙКИ ГЕНЕРАЦИИ:
-        Уровень фильтрации "шума": {cynicism_level}/100.
-        {style_instruction}
-
-        Напиши сводку на русском языке. Используй Markdown.
+SUMMARY_PROMPT_VERSION = "1"
+
+
+def _summary_key(text: str) -> str:
+    payload = f"{SUMMARY_PROMPT_VERSION}|{text}"
+    return "digest:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def style_instruction(cynicism_level: int) -> str:
+    if cynicism_level < 30:
+        return """
+        Тон: Повествовательный, мягкий, контекстный.
+        Задача: Расскажи историю. Объясни, почему это важно, какие эмоции это вызывает у сторон, дай бэкграунд.
+        Можно использовать прилагательные и объяснять мнения аналитиков.
+        """
+    if cynicism_level < 70:
+        return """
+        Тон: Деловой, нейтральный, информационный.
+        Задача: Напиши классическую новостную заметку (Who, What, Where, When, Why).
+        Сбалансируй факты и контекст. Убери явную пропаганду, но оставь суть заявлений.
+        """
+    return """
+        Тон: ЭКСТРЕМАЛЬНО СУХОЙ, РОБОТИЗИРОВАННЫЙ, ФАКТОЛОГИЧЕСКИЙ.
+        ЗАПРЕЩЕНО: Использовать прилагательные (ошеломляющий, страшный, великий), вводные слова, мнения, эмоции.
+        ОСТАВИТЬ ТОЛЬКО: Даты, цифры, имена, конкретные действия (глаголы), геолокации.
+        Формат: Маркированный список сухих фактов. Если факт не подтвержден цифрой или документом — пометь как "Заявление".
+        Игнорируй "воду" и пиар-шум.
         """
 
-        try:
-            client = genai.Client(api_key=os.getenv("GEMINI_KEY"))
-            response = await client.aio.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
-            )
-            if response.text:
-                return response.text
-        except Exception as e:
-            logger.error(f"Ошибка генерации дайджеста: {e}")
-            return f"Ошибка AI: {e}"
+
+async def _summarize(art: dict, text: str) -> str:
+    prompt = f"""
+    Сделай нейтральную фактическую выжимку статьи "{art.get('title')}" (до 200 слов).
+    Включи: что произошло, где и когда, цифры, имена, заявления сторон с указанием,
+    кто именно это утверждает, и важный контекст. Оценочные слова автора
+    не пересказывай как факты, а отметь отдельной строкой "Тон:".
+
+    Текст статьи:
+    "{text}"
+    """
+    return await generate_text(prompt)
+
+
+async def get_fact_summaries(articles_data: list, db: DatabaseHandler | None = None) -> list[dict]:
+    """
+    Этап 1: фактическая выжимка каждой статьи. Считается один раз на текст и
+    хранится в ai_cache, поэтому смена уровня цинизма и повтор из другой сессии
+    не пересылают в Gemini сырые тексты.
+    """
+    db = db or DatabaseHandler()
+    valid_articles = [a for a in articles_data if a.get('text_content')][:DIGEST_MAX_ARTICLES]
+    texts = [a['text_content'][:DIGEST_SOURCE_CHARS] for a in valid_articles]
+    keys = [_summary_key(text) for text in texts]
+    cached = await asyncio.to_thread(db.get_ai_cache, keys)
+
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    telemetry.incr("cache_hits", len(keys) - len(missing), cache="digest")
+    telemetry.incr("cache_misses", len(missing), cache="digest")
+    if missing:
+        logger.info(f"Дайджест: новых выжимок {len(missing)}, из кеша {len(keys) - len(missing)}")
+        results = await asyncio.gather(*[
+            _summarize(valid_articles[i], texts[i]) for i in missing
+        ], return_exceptions=True)
+        fresh = {}
+        for i, summary in zip(missing, results):
+            if isinstance(summary, Exception) or not summary:
+                logger.error(f"Не удалось сделать выжимку '{valid_articles[i].get('title')}': {summary}")
+                continue
+            fresh[keys[i]] = summary
+        await asyncio.to_thread(db.save_ai_cache, 'digest', fresh)
+        cached.update(fresh)
+
+    return [
+        {'title': art.get('title'), 'summary': cached[key]}
+        for art, key in zip(valid_articles, keys) if key in cached
+    ]
+
+
+def _digest_prompt(summaries: list[dict], cynicism_level: int) -> str:
+    context_text = ""
+    for i, item in enumerate(summaries):
+        context_text += f"\n=== ИСТОЧНИК {i+1}: {item['title']} ===\n{item['summary']}\n"
+
+    return f"""
+    Ты — редактор новостной ленты. Твоя задача — синтезировать одну сводку из нескольких источников.
+
+    ВХОДНЫЕ ДАННЫЕ (фактические выжимки статей):
+    {context_text}
+
+    НАСТРОЙКИ ГЕНЕРАЦИИ:
+    Уровень фильтрации "шума": {cynicism_level}/100.
+    {style_instruction(cynicism_level)}
+
+    Напиши сводку на русском языке. Используй Markdown.
+    """
+
+
+async def stream_cynical_digest(articles_data: list, cynicism_level: int):
+    """Этап 2: дешевый проход стилизации по выжимкам, текст отдается по мере генерации."""
+    if not any(a.get('text_content') for a in articles_data):
+        yield "⚠️ Нет данных для генерации дайджеста."
+        return
+
+    summaries = await get_fact_summaries(articles_data)
+    if not summaries:
+        yield "Ошибка AI: не удалось подготовить выжимки статей."
+        return
+
+    async for chunk in stream_text(_digest_prompt(summaries, cynicism_level)):
+        yield chunk
+
+
+async def generate_cynical_digest(articles_data: list, cynicism_level: int):
+    try:
+        parts = [chunk async for chunk in stream_cynical_digest(articles_data, cynicism_level)]
+        return "".join(parts)
+    except Exception as e:
+        logger.error(f"Ошибка генерации дайджеста: {e}")
+        return f"Ошибка AI: {e}"
+
+
+def iter_cynical_digest(articles_data: list, cynicism_level: int):
+    """Синхронная обертка для st.write_stream: крутит свой event loop."""
+    loop = asyncio.new_event_loop()
+    stream = stream_cynical_digest(articles_data, cynicism_level)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(stream.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(stream.aclose())
+        loop.close()
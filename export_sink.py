@@ -0,0 +1,156 @@
+import datetime
+import json
+import os
+import re
+from loguru import logger
+
+from config import EXPORT_DIR, EXPORT_PARQUET
+
+# Стабильная схема выгрузки: одинаковый набор колонок для любого источника строк
+# (run_parser, мониторинг с query_topic, выгрузка из базы).
+REPORT_FIELDS = (
+    'url',
+    'title',
+    'published_date',
+    'rating',
+    'status',
+    'search_query',
+    'query_topic',
+    'retrieved_at',
+    'ai_analysis',
+    'text_content',
+)
+
+PARQUET_ROW_GROUP = 500
+
+
+def normalize_row(item: dict, query: str | None = None) -> dict:
+    row = {}
+    for field in REPORT_FIELDS:
+        value = item.get(field)
+        row[field] = None if value is None else str(value)
+    if query and not row['search_query']:
+        row['search_query'] = query
+    if not row['retrieved_at']:
+        row['retrieved_at'] = datetime.datetime.now().isoformat()
+    return row
+
+
+def _slugify(text: str) -> str:
+    slug = re.sub(r'[^\w-]+', '_', text or '', flags=re.UNICODE).strip('_')
+    return slug[:50] or 'report'
+
+
+class _ParquetStream:
+    """Пишет строки в Parquet группами по PARQUET_ROW_GROUP, не держа весь отчет в памяти."""
+
+    def __init__(self, path: str):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self.schema = pa.schema([(field, pa.string()) for field in REPORT_FIELDS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.buffer = []
+
+    def write(self, row: dict):
+        self.buffer.append(row)
+        if len(self.buffer) >= PARQUET_ROW_GROUP:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        columns = {field: [row[field] for row in self.buffer] for field in REPORT_FIELDS}
+        self.writer.write_table(self._pa.table(columns, schema=self.schema))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+class ExportSink:
+    """
+    Append-only выгрузка результатов: каждая строка пишется сразу, как только
+    статья обработана. Один запуск = один файл с меткой времени, история не затирается.
+    """
+
+    def __init__(self, query: str, export_dir: str = EXPORT_DIR, parquet: bool = EXPORT_PARQUET):
+        os.makedirs(export_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        base = os.path.join(export_dir, f"report_{stamp}_{_slugify(query)}")
+
+        self.query = query
+        self.count = 0
+        self.jsonl_path = f"{base}.jsonl"
+        self.parquet_path = None
+        self._jsonl = open(self.jsonl_path, "a", encoding="utf-8")
+        self._parquet = None
+
+        if parquet:
+            try:
+                self._parquet = _ParquetStream(f"{base}.parquet")
+                self.parquet_path = f"{base}.parquet"
+            except ImportError:
+                logger.warning("pyarrow не установлен: Parquet-выгрузка отключена.")
+
+    def write(self, item: dict):
+        if not item:
+            return
+        row = normalize_row(item, self.query)
+        self._jsonl.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._jsonl.flush()
+        if self._parquet:
+            self._parquet.write(row)
+        self.count += 1
+
+    def close(self):
+        if self._jsonl.closed:
+            return
+        self._jsonl.close()
+        if self._parquet:
+            self._parquet.close()
+
+    def paths(self) -> list[str]:
+        return [p for p in (self.jsonl_path, self.parquet_path) if p]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def export_archive(path: str, chunk_size: int = 1000) -> int:
+    """
+    Потоковая выгрузка всей таблицы articles в JSONL или Parquet (по расширению файла).
+    Читает базу порциями по chunk_size, pandas не используется.
+    """
+    from database import DatabaseHandler
+
+    db = DatabaseHandler()
+    parquet = path.endswith(".parquet")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    count = 0
+    if parquet:
+        stream = _ParquetStream(path)
+        try:
+            for chunk in db.iter_articles(chunk_size):
+                for item in chunk:
+                    stream.write(normalize_row(item))
+                    count += 1
+        finally:
+            stream.close()
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            for chunk in db.iter_articles(chunk_size):
+                for item in chunk:
+                    f.write(json.dumps(normalize_row(item), ensure_ascii=False) + "\n")
+                    count += 1
+
+    logger.success(f"Архив выгружен в {path}: {count} записей")
+    return count
@@ -0,0 +1,80 @@
+import asyncio
+import weakref
+from google import genai
+from loguru import logger
+
+import telemetry
+
+from config import GEMINI_KEY, GEMINI_MODEL, GEMINI_CONCURRENCY, GEMINI_API_URL
+
+# Семафор на каждый event loop: веб-интерфейс и воркеры создают свои циклы
+_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def make_client() -> genai.Client:
+    if GEMINI_API_URL:
+        return genai.Client(api_key=GEMINI_KEY, http_options=genai.types.HttpOptions(base_url=GEMINI_API_URL))
+    return genai.Client(api_key=GEMINI_KEY)
+
+
+def _limiter() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    limiter = _limiters.get(loop)
+    if limiter is None:
+        limiter = _limiters[loop] = asyncio.Semaphore(GEMINI_CONCURRENCY)
+    return limiter
+
+
+async def generate_text(prompt: str, json_output: bool = False, max_retries: int = 3) -> str:
+    """
+    Один вызов Gemini с ограничением параллельности (GEMINI_CONCURRENCY на цикл)
+    и повтором при 429. Остальные ошибки пробрасываются вызывающему.
+    """
+    config = {'response_mime_type': 'application/json'} if json_output else None
+    for attempt in range(max_retries):
+        try:
+            async with _limiter():
+                with telemetry.span("ai_call", kind="json" if json_output else "text"):
+                    client = make_client()
+                    response = await client.aio.models.generate_content(
+                        model=GEMINI_MODEL,
+                        contents=prompt,
+                        config=config
+                    )
+            return (response.text if response is not None else None) or ""
+        except Exception as e:
+            if "429" in str(e):
+                telemetry.incr("gemini_429")
+            if "429" in str(e) and attempt < max_retries - 1:
+                wait_time = 20 + (attempt * 10)
+                logger.warning(f"Лимит API (429). Жду {wait_time} сек и пробую снова...")
+                await asyncio.sleep(wait_time)
+            else:
+                raise
+    return ""
+
+
+async def stream_text(prompt: str, max_retries: int = 3):
+    """Потоковый вариант generate_text: отдает куски текста по мере генерации."""
+    started = False
+    for attempt in range(max_retries):
+        try:
+            async with _limiter():
+                with telemetry.span("ai_call", kind="stream"):
+                    client = make_client()
+                    stream = await client.aio.models.generate_content_stream(model=GEMINI_MODEL, contents=prompt)
+                    async for chunk in stream:
+                        if chunk.text:
+                            started = True
+                            yield chunk.text
+            return
+        except Exception as e:
+            if "429" in str(e):
+                telemetry.incr("gemini_429")
+            # Повторяем только 429, пришедший до начала ответа: начатый текст уже отдан
+            if "429" in str(e) and not started and attempt < max_retries - 1:
+                wait_time = 20 + (attempt * 10)
+                logger.warning(f"Лимит API (429). Жду {wait_time} сек и пробую снова...")
+                await asyncio.sleep(wait_time)
+            else:
+                raise
@@ -0,0 +1,189 @@
+import datetime
+import json
+import os
+import subprocess
+import sys
+import uuid
+from loguru import logger
+from sqlalchemy import update
+
+from config import JOB_STALE_MINUTES, JOB_REUSE_SECONDS, JOB_WORKERS, JOB_METRICS_PORT
+from database import DatabaseHandler, JobModel
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def normalize_query(query: str | None) -> str:
+    return " ".join((query or "").lower().split())
+
+
+def request_key(query: str) -> str:
+    query = query.strip()
+    # Ссылки сравниваем как есть: регистр пути в URL значим
+    return query if query.startswith("http") else normalize_query(query)
+
+
+def make_dedupe_key(kind: str, query: str | None, num_results: int | None) -> str:
+    return f"{kind}|{normalize_query(query)}|{num_results or 0}"
+
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat()
+
+
+def start_worker_processes(count: int = JOB_WORKERS) -> list[subprocess.Popen]:
+    """Запускает воркеры очереди (job_worker.py) отдельными процессами."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_worker.py")
+    workers = []
+    for i in range(count):
+        env = dict(os.environ)
+        if JOB_METRICS_PORT:
+            env["JOB_METRICS_PORT"] = str(JOB_METRICS_PORT + i)
+        workers.append(subprocess.Popen([sys.executable, script], env=env))
+    logger.info(f"Запущено воркеров очереди: {count}")
+    return workers
+
+
+class JobQueue:
+    """
+    Очередь задач в общей базе: веб-интерфейс ставит задачи и опрашивает их статус,
+    job_worker.py забирает и выполняет. Одинаковые запросы из разных сессий
+    получают одну и ту же задачу.
+    """
+
+    def __init__(self):
+        self.db = DatabaseHandler()
+
+    def submit(self, kind: str, query: str | None = None, num_results: int | None = None) -> str:
+        key = make_dedupe_key(kind, query, num_results)
+        reuse_after = (datetime.datetime.now() - datetime.timedelta(seconds=JOB_REUSE_SECONDS)).isoformat()
+        session = self.db.get_session()
+        try:
+            existing = session.query(JobModel).filter(
+                JobModel.dedupe_key == key,
+                (JobModel.status.in_(ACTIVE_STATUSES)) |
+                ((JobModel.status == "done") & (JobModel.updated_at >= reuse_after))
+            ).order_by(JobModel.created_at.desc()).first()
+            if existing:
+                logger.debug(f"Задача {existing.id[:8]} переиспользована для '{query}'")
+                return existing.id
+
+            job = JobModel(
+                id=uuid.uuid4().hex,
+                kind=kind,
+                query=query,
+                num_results=num_results,
+                dedupe_key=key,
+                status="queued",
+                progress="В очереди",
+                progress_value=0,
+                created_at=_now(),
+                updated_at=_now()
+            )
+            session.add(job)
+            session.commit()
+            logger.info(f"Задача {job.id[:8]} ({kind}) поставлена в очередь: '{query}'")
+            return job.id
+        finally:
+            session.close()
+
+    def get(self, job_id: str) -> dict | None:
+        session = self.db.get_session()
+        try:
+            job = session.get(JobModel, job_id)
+            if not job:
+                return None
+            return {
+                'id': job.id,
+                'kind': job.kind,
+                'query': job.query,
+                'status': job.status,
+                'progress': job.progress,
+                'progress_value': job.progress_value or 0,
+                'result': json.loads(job.result) if job.result else None,
+                'error': job.error,
+            }
+        finally:
+            session.close()
+
+    def claim(self) -> dict | None:
+        """Атомарно забирает самую старую задачу из очереди (безопасно для нескольких воркеров)."""
+        self.requeue_stale()
+        session = self.db.get_session()
+        try:
+            candidates = session.query(JobModel.id).filter(JobModel.status == "queued") \
+                .order_by(JobModel.created_at).limit(5).all()
+            for (job_id,) in candidates:
+                claimed = session.execute(
+                    update(JobModel)
+                    .where(JobModel.id == job_id, JobModel.status == "queued")
+                    .values(status="running", progress="Запуск...", updated_at=_now())
+                )
+                session.commit()
+                if claimed.rowcount == 1:
+                    job = session.get(JobModel, job_id)
+                    return {'id': job.id, 'kind': job.kind, 'query': job.query, 'num_results': job.num_results}
+            return None
+        finally:
+            session.close()
+
+    def _update(self, job_id: str, **values):
+        session = self.db.get_session()
+        try:
+            session.execute(update(JobModel).where(JobModel.id == job_id).values(updated_at=_now(), **values))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Ошибка обновления задачи {job_id[:8]}: {e}")
+        finally:
+            session.close()
+
+    def set_progress(self, job_id: str, text: str, value: int | None = None):
+        values = {'progress': text}
+        if value is not None:
+            values['progress_value'] = max(0, min(100, int(value)))
+        self._update(job_id, **values)
+
+    def complete(self, job_id: str, result, message: str = "Готово"):
+        self._update(
+            job_id, status="done", progress=message, progress_value=100,
+            result=json.dumps(result, ensure_ascii=False, default=str)
+        )
+
+    def heartbeat(self, job_id: str):
+        """Отметка, что воркер еще выполняет задачу: requeue_stale ее не тронет."""
+        session = self.db.get_session()
+        try:
+            session.execute(
+                update(JobModel)
+                .where(JobModel.id == job_id, JobModel.status == "running")
+                .values(updated_at=_now())
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Ошибка отметки задачи {job_id[:8]}: {e}")
+        finally:
+            session.close()
+
+    def fail(self, job_id: str, error: str):
+        self._update(job_id, status="failed", progress="Ошибка", error=error)
+
+    def requeue_stale(self):
+        """
+        Задачи упавшего воркера возвращаются в очередь: живой воркер обновляет
+        задачу раз в JOB_HEARTBEAT_SECONDS, а эти молчат дольше JOB_STALE_MINUTES.
+        """
+        stale_before = (datetime.datetime.now() - datetime.timedelta(minutes=JOB_STALE_MINUTES)).isoformat()
+        session = self.db.get_session()
+        try:
+            result = session.execute(
+                update(JobModel)
+                .where(JobModel.status == "running", JobModel.updated_at < stale_before)
+                .values(status="queued", progress="Перезапуск после сбоя воркера", updated_at=_now())
+            )
+            session.commit()
+            if result.rowcount:
+                logger.warning(f"Возвращено в очередь зависших задач: {result.rowcount}")
+        finally:
+            session.close()
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import threading
+import time
+from loguru import logger
+
+import page_parser as parser
+import telemetry
+from config import API_KEY, SEARCH_ENGINE_ID, JOB_POLL_SECONDS, JOB_METRICS_PORT, JOB_HEARTBEAT_SECONDS
+from job_queue import JobQueue
+from logger_config import setup_logger
+from monitor import MonitorEngine
+from search_client import SearchClient
+from trends_client import TrendsClient
+
+
+async def run_search_job(queue: JobQueue, job: dict) -> tuple[list, str]:
+    query, num_results = job['query'], job['num_results'] or 5
+    queue.set_progress(job['id'], f"🔎 Ищу {num_results} результатов для: {query}", 5)
+
+    client = SearchClient(API_KEY, SEARCH_ENGINE_ID)
+    results_data = await asyncio.to_thread(client.search, query, num_results, False)
+    if not results_data or not results_data.get('items'):
+        return [], "⚠️ Результаты поиска не найдены."
+
+    total = len(results_data['items'])
+    done = 0
+    queue.set_progress(job['id'], f"🔗 Найдено {total} ссылок. Читаю и анализирую контент...", 10)
+
+    def on_item(item):
+        nonlocal done
+        done += 1
+        queue.set_progress(job['id'], f"📰 Обработано {done}/{total}", 10 + 90 * done // total)
+
+    final_report_data = await parser.run_parser(results_data, query, show_logs=True, on_item=on_item)
+    return final_report_data, f"✅ Анализ {total} статей завершен!"
+
+
+async def run_monitor_job(queue: JobQueue, job: dict) -> tuple[list, str]:
+    queue.set_progress(job['id'], "📰 Читаю заголовки Google News...", 5)
+    trends = await TrendsClient().aget_top_trends(3)
+    if not trends:
+        raise RuntimeError("Не удалось получить тренды.")
+
+    state = {topic: "⏳" for topic in trends}
+    finished = set()
+
+    def on_progress(topic, done, total):
+        state[topic] = f"{done}/{total}" if total else "—"
+        if done >= total:
+            finished.add(topic)
+        summary = " | ".join(f"{t[:30]}: {state[t]}" for t in trends)
+        queue.set_progress(job['id'], f"🕵️ {summary}", 10 + 90 * len(finished) // len(trends))
+
+    queue.set_progress(job['id'], f"🕵️ Анализирую темы параллельно: {len(trends)}", 10)
+    all_articles = await MonitorEngine(num_results=2, show_logs=True).run(trends, on_progress=on_progress)
+    return all_articles, f"✅ Готово! Собрано статей: {len(all_articles)}"
+
+
+JOB_HANDLERS = {
+    'search': run_search_job,
+    'monitor': run_monitor_job,
+}
+
+
+def _heartbeat(queue: JobQueue, job_id: str, done: threading.Event):
+    # Отдельный поток: цикл событий может быть занят разбором дольше JOB_STALE_MINUTES
+    while not done.wait(JOB_HEARTBEAT_SECONDS):
+        queue.heartbeat(job_id)
+
+
+def run_worker(poll_seconds: float = JOB_POLL_SECONDS):
+    queue = JobQueue()
+    telemetry.start_metrics_server(JOB_METRICS_PORT)
+    # Один цикл событий на все задачи воркера: модульные семафоры и пачки памяти
+    # привязываются к циклу, и новый asyncio.run на каждую задачу их бы ломал
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    logger.info(f"Воркер очереди запущен (pid {os.getpid()}).")
+    try:
+        _serve(queue, loop, poll_seconds)
+    finally:
+        loop.close()
+
+
+def _serve(queue: JobQueue, loop: asyncio.AbstractEventLoop, poll_seconds: float):
+    while True:
+        job = queue.claim()
+        if not job:
+            time.sleep(poll_seconds)
+            continue
+
+        handler = JOB_HANDLERS.get(job['kind'])
+        telemetry.new_trace(f"job-{job['id'][:8]}-")
+        logger.info(f"Задача {job['id'][:8]} ({job['kind']}): '{job['query']}'")
+        if handler is None:
+            queue.fail(job['id'], f"Неизвестный тип задачи: {job['kind']}")
+            continue
+        done = threading.Event()
+        threading.Thread(target=_heartbeat, args=(queue, job['id'], done), daemon=True).start()
+        try:
+            with telemetry.span("job", kind=job['kind']):
+                result, message = loop.run_until_complete(handler(queue, job))
+            queue.complete(job['id'], result, message)
+        except Exception as e:
+            logger.error(f"Задача {job['id'][:8]} упала: {e}")
+            queue.fail(job['id'], str(e))
+        finally:
+            done.set()
+
+
+if __name__ == "__main__":
+    setup_logger()
+    try:
+        run_worker()
+    except KeyboardInterrupt:
+        logger.info("Воркер остановлен.")
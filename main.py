@@ -3,17 +3,43 @@ import io
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 from search_client import SearchClient
-from config import API_KEY, SEARCH_ENGINE_ID
+from config import API_KEY, SEARCH_ENGINE_ID, JOB_WORKERS
 from loguru import logger
 import argparse
 from logger_config import setup_logger
 import page_parser as parser
 import asyncio
+import os
 import subprocess
 from database import DatabaseHandler
 from rich.console import Console
 from rich.markdown import Markdown
-from report_generator import create_pdf
+from rich.table import Table
+from render_service import ReportRenderer
+from job_queue import start_worker_processes
+from report_generator import create_pdf_stream
+from export_sink import export_archive
+from scheduler import run_scheduler
+import telemetry
+
+
+def print_stage_timings(console: Console, run: telemetry.RunStats):
+    rows = run.summary()
+    if not rows:
+        return
+    table = Table(title="⏱️ Время по этапам", title_style="bold cyan")
+    table.add_column("Этап")
+    table.add_column("Вызовов", justify="right")
+    table.add_column("Всего, с", justify="right")
+    table.add_column("p50, мс", justify="right")
+    table.add_column("p95, мс", justify="right")
+    table.add_column("max, мс", justify="right")
+    for row in rows:
+        table.add_row(
+            row['stage'], str(row['count']), f"{row['total']:.2f}",
+            f"{row['p50'] * 1000:.0f}", f"{row['p95'] * 1000:.0f}", f"{row['max'] * 1000:.0f}"
+        )
+    console.print(table)
 
 
 def main():
@@ -53,13 +79,71 @@ def main():
         action='store_true',
         help="Сохранить результат в PDF"
     )
+    arg_parser.add_argument(
+        '-e', '--export-archive',
+        type=str,
+        metavar='FILE',
+        help="Выгрузить весь архив статей в JSONL или Parquet (по расширению файла) и выйти"
+    )
+    arg_parser.add_argument(
+        '--archive-pdf',
+        type=str,
+        metavar='FILE',
+        help="Собрать PDF по всему архиву (постранично, без загрузки в память) и выйти"
+    )
+    arg_parser.add_argument(
+        '--month',
+        type=str,
+        metavar='YYYY-MM',
+        help="Ограничить --archive-pdf статьями, проверенными в указанном месяце"
+    )
+    arg_parser.add_argument(
+        '-d', '--daemon',
+        action='store_true',
+        help="Запустить фоновый мониторинг трендов и watchlist (инкрементально, по расписанию)"
+    )
+    arg_parser.add_argument(
+        '--once',
+        action='store_true',
+        help="Вместе с --daemon: выполнить один проход мониторинга и выйти"
+    )
     args = arg_parser.parse_args()
     query = args.query
     num_results = args.num
     show_logs = args.logs
     if args.web:
         if show_logs: logger.info("Запуск веб-интерфейса Streamlit...")
-        subprocess.run(["streamlit", "run", "web_app.py"])
+        # Поиск и анализ выполняют воркеры очереди, Streamlit только ставит задачи
+        workers = start_worker_processes(JOB_WORKERS)
+        try:
+            subprocess.run(["streamlit", "run", "web_app.py"], env={**os.environ, "JOB_WORKERS_EXTERNAL": "1"})
+        finally:
+            for worker in workers:
+                worker.terminate()
+        return
+
+    if args.daemon:
+        run_scheduler(once=args.once)
+        return
+
+    if args.export_archive:
+        try:
+            count = export_archive(args.export_archive)
+            console.print(f"[bold green]✅ Архив выгружен: {args.export_archive} ({count} записей)[/bold green]")
+        except Exception as e:
+            console.print(f"[bold red]❌ Ошибка выгрузки архива: {e}[/bold red]")
+        return
+
+    if args.archive_pdf:
+        title = f"Архив за {args.month}" if args.month else "Архив расследований"
+        console.print(f"[yellow]⏳ Генерация PDF по архиву: {title}...[/yellow]")
+        try:
+            articles = (item for chunk in db.iter_articles(month=args.month) for item in chunk)
+            with open(args.archive_pdf, "wb") as f:
+                count = create_pdf_stream(title, articles, f)
+            console.print(f"[bold green]✅ PDF архива сохранен: {args.archive_pdf} ({count} статей)[/bold green]")
+        except Exception as e:
+            console.print(f"[bold red]❌ Ошибка создания PDF: {e}[/bold red]")
         return
 
     if show_logs:
@@ -72,42 +156,46 @@ def main():
     except ValueError:
         logger.critical("Запуск невозможен: нет ключей API.")
         return
-    results_data = client.search(query, num_results, show_logs)
-    if results_data:
-        final_data = asyncio.run(parser.run_parser(results_data, query, show_logs))
-        report_text = None
-        if args.cross_check:
-            if not show_logs:
-                console.print("\n[bold yellow]⚔️ Запуск сводного анализа (Cross-Check)...[/bold yellow]")
-                console.print("[dim]AI читает тексты и ищет противоречия...[/dim]")
-            else:
-                logger.info("Запуск сводного анализа...")
-
-            try:
-                report_text = asyncio.run(parser.get_cross_check_analysis(final_data))
-                console.print("\n")
-                console.rule("[bold green]📊 СВОДНЫЙ ОТЧЕТ AI[/bold green]")
-                console.print(Markdown(report_text))
-                console.rule("[bold green]КОНЕЦ ОТЧЕТА[/bold green]")
-                console.print("\n")
-            except Exception as e:
-                logger.error(f"Ошибка кросс-анализа: {e}")
-
-        if args.report:
-            console.print("[yellow]⏳ Генерация PDF...[/yellow]")
-            try:
-                # Если report_text равен None, PDF просто создастся без секции кросс-анализа
-                pdf_bytes = create_pdf(query, final_data, report_text)
-
-                filename = f"report_{query.replace(' ', '_')}.pdf"
-                with open(filename, "wb") as f:
-                    f.write(pdf_bytes)
-
-                console.print(f"[bold green]✅ PDF отчет сохранен: {filename}[/bold green]")
-            except Exception as e:
-                console.print(f"[bold red]❌ Ошибка создания PDF: {e}[/bold red]")
-                if "ttf" in str(e).lower():
-                    console.print("[dim]Подсказка: Проверьте, лежит ли файл DejaVuSans.ttf рядом с main.py[/dim]")
+    with telemetry.collect_run() as run:
+        results_data = client.search(query, num_results, show_logs)
+        if results_data:
+            final_data = asyncio.run(parser.run_parser(results_data, query, show_logs))
+            report_text = None
+            if args.cross_check:
+                if not show_logs:
+                    console.print("\n[bold yellow]⚔️ Запуск сводного анализа (Cross-Check)...[/bold yellow]")
+                    console.print("[dim]AI читает тексты и ищет противоречия...[/dim]")
+                else:
+                    logger.info("Запуск сводного анализа...")
+
+                try:
+                    report_text = asyncio.run(parser.get_cross_check_analysis(final_data))
+                    console.print("\n")
+                    console.rule("[bold green]📊 СВОДНЫЙ ОТЧЕТ AI[/bold green]")
+                    console.print(Markdown(report_text))
+                    console.rule("[bold green]КОНЕЦ ОТЧЕТА[/bold green]")
+                    console.print("\n")
+                except Exception as e:
+                    logger.error(f"Ошибка кросс-анализа: {e}")
+
+            if args.report:
+                console.print("[yellow]⏳ Генерация PDF...[/yellow]")
+                try:
+                    # Если report_text равен None, PDF просто создастся без секции кросс-анализа.
+                    # Одинаковый отчет повторно не рендерится, а берется из кеша.
+                    pdf_bytes = ReportRenderer().render(query, final_data, report_text, inline=True)
+
+                    filename = f"report_{query.replace(' ', '_')}.pdf"
+                    with open(filename, "wb") as f:
+                        f.write(pdf_bytes)
+
+                    console.print(f"[bold green]✅ PDF отчет сохранен: {filename}[/bold green]")
+                except Exception as e:
+                    console.print(f"[bold red]❌ Ошибка создания PDF: {e}[/bold red]")
+                    if "ttf" in str(e).lower():
+                        console.print("[dim]Подсказка: Проверьте, лежит ли файл DejaVuSans.ttf рядом с main.py[/dim]")
+
+    print_stage_timings(console, run)
 
     if show_logs:
         logger.info("Приложение завершило работу.")
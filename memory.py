@@ -1,48 +1,211 @@
-import chromadb
 from sentence_transformers import SentenceTransformer
 import os
 import uuid
+import asyncio
+import datetime
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+import numpy as np
 from loguru import logger
 
+from compressor import estimate_tokens
+from config import (
+    MEMORY_RESULTS, MEMORY_CANDIDATES, MEMORY_MIN_SIMILARITY, MEMORY_HALF_LIFE_DAYS,
+    MEMORY_RECENCY_WEIGHT, MEMORY_DIVERSITY, MEMORY_BATCH_WINDOW, MEMORY_BACKEND, MEMORY_STORE_PATH,
+    MEMORY_PARTITIONS
+)
+import telemetry
+
+# Индексируется и ищется один и тот же кусок текста, поэтому вектор запроса
+# переиспользуется при сохранении статьи
+INDEX_CHARS = 1000
+VECTOR_CACHE_SIZE = 1024
+
+
+def _parse_date(value) -> datetime.datetime | None:
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=None)
+
+
 class MemoryHandler:
-    def __init__(self, db_path="chroma_db"):
-        self.client = chromadb.PersistentClient(path=db_path)
-        self.collection = self.client.get_or_create_collection(name="news_knowledge")
+    def __init__(self, db_path="chroma_db", backend: str = MEMORY_BACKEND, partitions: str = MEMORY_PARTITIONS):
         self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        if partitions == "month":
+            from memory_partitions import PartitionedStore
+            self.collection = PartitionedStore(backend, self.model.get_sentence_embedding_dimension(), db_path)
+        elif backend == "mmap":
+            from vector_store import MmapVectorStore
+            self.collection = MmapVectorStore(MEMORY_STORE_PATH, dim=self.model.get_sentence_embedding_dimension())
+        else:
+            import chromadb
+            self.client = chromadb.PersistentClient(path=db_path)
+            self.collection = self.client.get_or_create_collection(name="news_knowledge")
+        self.vectors: OrderedDict[str, np.ndarray] = OrderedDict()
+        # Пачки из afind_similar_context считаются в потоке, а add_article — в цикле событий
+        self.lock = threading.Lock()
+        # Очередь пачки и задача сброса — свои на каждый event loop: воркеры и CLI
+        # запускают несколько asyncio.run подряд, а future другого цикла ждать нельзя
+        self.pending: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, list]" = weakref.WeakKeyDictionary()
+        self.flush_tasks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Task]" = weakref.WeakKeyDictionary()
+
+    def embed(self, texts: list[str]) -> list[np.ndarray]:
+        """Векторы кусков текста; уже посчитанные берутся из LRU-кеша по хешу текста."""
+        keys = [hashlib.sha1(text.encode("utf-8")).hexdigest() for text in texts]
+        with self.lock:
+            missing = [i for i, key in enumerate(keys) if key not in self.vectors]
+            telemetry.incr("cache_hits", len(keys) - len(missing), cache="memory_vector")
+            telemetry.incr("cache_misses", len(missing), cache="memory_vector")
+            if missing:
+                with telemetry.span("embedding", batch=len(missing)):
+                    encoded = self.model.encode([texts[i] for i in missing], normalize_embeddings=True)
+                for i, vector in zip(missing, encoded):
+                    self.vectors[keys[i]] = np.asarray(vector, dtype=np.float32)
+            result = []
+            for key in keys:
+                self.vectors.move_to_end(key)
+                result.append(self.vectors[key])
+            while len(self.vectors) > VECTOR_CACHE_SIZE:
+                self.vectors.popitem(last=False)
+            return result
 
     def add_article(self, article_data):
         if not article_data.get('text_content') or len(article_data['text_content']) < 100:
             return
 
         url = article_data.get('url')
-        text = article_data.get('text_content')[:1000] # Берем первый кусок для индексации
+        text = article_data.get('text_content')[:INDEX_CHARS] # Берем первый кусок для индексации
         title = article_data.get('title') or "Без названия"
         date = article_data.get('published_date') or "Неизвестно"
-        vector = self.model.encode(text).tolist()
+        vector = self.embed([text])[0].tolist()
 
         try:
-            self.collection.upsert(
-                documents=[text],
-                embeddings=[vector],
-                metadatas=[{"url": url, "title": title, "date": str(date)}],
-                ids=[url] # URL как уникальный ID
-            )
+            with telemetry.span("vector_upsert"):
+                self.collection.upsert(
+                    documents=[text],
+                    embeddings=[vector],
+                    metadatas=[{"url": url, "title": title, "date": str(date), "added": time.time()}],
+                    ids=[url] # URL как уникальный ID
+                )
             logger.debug(f"💾 Запомнил статью: {title}")
         except Exception as e:
             logger.error(f"Ошибка памяти: {e}")
 
-    def find_similar_context(self, query_text, n_results=3):
-        if not query_text: return ""
-        vector = self.model.encode(query_text).tolist()
-        results = self.collection.query(
-            query_embeddings=[vector],
-            n_results=n_results
-        )
-
-        context_str = ""
-        if results['documents']:
-            for i, doc in enumerate(results['documents'][0]):
-                meta = results['metadatas'][0][i]
+    def _recency(self, meta: dict, now: datetime.datetime) -> float:
+        """Множитель свежести: 1 для сегодняшних статей, 1 - MEMORY_RECENCY_WEIGHT для очень старых."""
+        published = _parse_date(meta.get('date'))
+        if published is None and meta.get('added'):
+            published = datetime.datetime.fromtimestamp(float(meta['added']))
+        if published is None:
+            decay = 0.5
+        else:
+            age_days = max((now - published).total_seconds() / 86400, 0.0)
+            decay = 0.5 ** (age_days / MEMORY_HALF_LIFE_DAYS)
+        return 1 - MEMORY_RECENCY_WEIGHT + MEMORY_RECENCY_WEIGHT * decay
+
+    def _pick(self, query: np.ndarray, exclude_url: str | None, ids: list, documents: list,
+              metadatas: list, embeddings, n_results: int) -> list[tuple[float, str, dict]]:
+        """
+        Кандидаты -> до n_results результатов: без самой статьи, не ниже порога сходства,
+        с поправкой на свежесть и MMR, чтобы почти одинаковые перепечатки не повторялись.
+        """
+        now = datetime.datetime.now()
+        candidates = []
+        for doc_id, doc, meta, embedding in zip(ids, documents, metadatas, embeddings):
+            if doc_id == exclude_url or meta.get('url') == exclude_url:
+                continue
+            vector = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            similarity = float(query @ vector / norm) if norm else 0.0
+            if similarity < MEMORY_MIN_SIMILARITY:
+                continue
+            candidates.append((similarity * self._recency(meta, now), doc, meta, vector / norm))
+
+        chosen = []
+        while candidates and len(chosen) < n_results:
+            def mmr(candidate):
+                redundancy = max((float(candidate[3] @ c[3]) for c in chosen), default=0.0)
+                return (1 - MEMORY_DIVERSITY) * candidate[0] - MEMORY_DIVERSITY * redundancy
+            best = max(candidates, key=mmr)
+            candidates.remove(best)
+            chosen.append(best)
+        return [(score, doc, meta) for score, doc, meta, _ in chosen]
+
+    def find_similar_contexts(self, queries: list[tuple[str, str | None]], n_results: int = MEMORY_RESULTS) -> list[str]:
+        """
+        Пачка запросов (текст статьи, ее url) одним обращением к Chroma. Для каждого
+        берется MEMORY_CANDIDATES ближайших, из них отбирается до n_results (_pick).
+        """
+        if not queries:
+            return []
+        vectors = self.embed([text[:INDEX_CHARS] for text, _ in queries])
+        count = self.collection.count()
+        if not count:
+            return [""] * len(queries)
+        with telemetry.span("vector_query", batch=len(queries)):
+            results = self.collection.query(
+                query_embeddings=[v.tolist() for v in vectors],
+                # +1: сама статья может уже лежать в памяти с прошлого прогона
+                n_results=min(MEMORY_CANDIDATES + 1, count),
+                include=["documents", "metadatas", "embeddings"]
+            )
+
+        contexts = []
+        for i, (vector, (_, exclude_url)) in enumerate(zip(vectors, queries)):
+            picked = self._pick(
+                vector, exclude_url, results['ids'][i], results['documents'][i],
+                results['metadatas'][i], results['embeddings'][i], n_results
+            )
+            context_str = ""
+            for score, doc, meta in picked:
                 context_str += f"\n[Архив: {meta['date']} | {meta['title']}]\n{doc[:300]}...\n"
+            telemetry.incr("prompt_tokens", estimate_tokens(context_str) if context_str else 0, call="memory")
+            contexts.append(context_str)
+        return contexts
+
+    def maybe_compact(self):
+        """Уплотнение старых месяцев памяти, если пора (см. PartitionedStore.maybe_compact)."""
+        if hasattr(self.collection, "maybe_compact"):
+            stats = self.collection.maybe_compact()
+            if stats:
+                logger.info(f"Память уплотнена: {stats}")
 
-        return context_str
+    def find_similar_context(self, query_text, n_results=MEMORY_RESULTS, exclude_url: str | None = None):
+        if not query_text: return ""
+        return self.find_similar_contexts([(query_text, exclude_url)], n_results)[0]
+
+    async def afind_similar_context(self, query_text: str, exclude_url: str | None = None) -> str:
+        """
+        То же из корутины: запросы статей, обрабатываемых параллельно, копятся
+        MEMORY_BATCH_WINDOW секунд и уходят в модель и Chroma одной пачкой в потоке.
+        """
+        if not query_text:
+            return ""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.setdefault(loop, []).append((query_text, exclude_url, future))
+        flush_task = self.flush_tasks.get(loop)
+        if flush_task is None or flush_task.done():
+            self.flush_tasks[loop] = asyncio.create_task(self._flush(loop))
+        return await future
+
+    async def _flush(self, loop: asyncio.AbstractEventLoop):
+        await asyncio.sleep(MEMORY_BATCH_WINDOW)
+        batch = self.pending.pop(loop, [])
+        # Запросы, пришедшие во время поиска, соберет уже следующая пачка
+        self.flush_tasks.pop(loop, None)
+        if len(batch) > 1:
+            telemetry.incr("coalesced_requests", len(batch) - 1, kind="memory")
+        try:
+            contexts = await asyncio.to_thread(self.find_similar_contexts, [(t, u) for t, u, _ in batch])
+        except Exception as e:
+            logger.error(f"Ошибка поиска в памяти: {e}")
+            contexts = [""] * len(batch)
+        for (_, _, future), context in zip(batch, contexts):
+            if not future.done():
+                future.set_result(context)
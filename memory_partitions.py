@@ -0,0 +1,385 @@
+import datetime
+import os
+import shutil
+import time
+import numpy as np
+from filelock import FileLock, Timeout
+from loguru import logger
+
+from config import (
+    MEMORY_STORE_PATH, MEMORY_WINDOW_MONTHS, MEMORY_COMPACT_AFTER_MONTHS, MEMORY_RETENTION_MONTHS,
+    MEMORY_COMPACT_SIMILARITY, MEMORY_COMPACT_INTERVAL_HOURS
+)
+
+COLLECTION = "news_knowledge"
+# Старая общая коллекция (или корень MEMORY_STORE_PATH): без даты, ищется всегда
+LEGACY = "legacy"
+# Суффикс уплотненного месяца: 2025-01c
+COMPACT_SUFFIX = "c"
+LISTING_SECONDS = 30
+SUMMARY_TITLES = 5
+
+
+def month_of(meta: dict) -> str:
+    """Месяц партиции YYYY-MM: по дате публикации, иначе по времени добавления."""
+    date = str(meta.get('date') or "")
+    try:
+        return datetime.datetime.fromisoformat(date).strftime("%Y-%m")
+    except ValueError:
+        added = meta.get('added')
+        when = datetime.datetime.fromtimestamp(float(added)) if added else datetime.datetime.now()
+        return when.strftime("%Y-%m")
+
+
+def latest_date(metadatas) -> str | None:
+    """Самая поздняя дата публикации в ISO (свежесть сюжета в памяти считается по ней)."""
+    dates = []
+    for meta in metadatas:
+        try:
+            dates.append(datetime.datetime.fromisoformat(str(meta.get('date') or "")).replace(tzinfo=None))
+        except ValueError:
+            continue
+    return max(dates).isoformat() if dates else None
+
+
+def months_back(now: datetime.date, months: int) -> str:
+    """Месяц YYYY-MM, отстоящий от now на months назад."""
+    index = now.year * 12 + now.month - 1 - months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def cluster_vectors(vectors: np.ndarray, threshold: float) -> list[list[int]]:
+    """Жадная кластеризация: вектор идет в первый кластер с центроидом ближе threshold (косинус)."""
+    clusters: list[list[int]] = []
+    sums = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        if len(clusters):
+            centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True)
+            scores = centroids @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= threshold:
+                clusters[best].append(i)
+                sums[best] += vector
+                continue
+        clusters.append([i])
+        sums = np.vstack([sums, vector[None, :]])
+    return clusters
+
+
+class PartitionedStore:
+    """
+    Память, разбитая по месяцам публикации: отдельная коллекция Chroma
+    (news_knowledge_2025_01) или папка MmapVectorStore (memory_store/2025-01)
+    на месяц. Интерфейс тот же, что у коллекции (count, upsert, query), поэтому
+    MemoryHandler не знает о партициях.
+
+    - Запрос идет только в месяцы за последние MEMORY_WINDOW_MONTHS и в старую
+      общую коллекцию, если она осталась (python memory_partitions.py --repartition).
+    - Месяцы старше MEMORY_COMPACT_AFTER_MONTHS уплотняются: похожие статьи
+      сливаются в одну запись с центроидом и списком заголовков сюжета.
+    - Месяцы старше MEMORY_RETENTION_MONTHS удаляются (0 — хранить всегда).
+    """
+
+    def __init__(self, backend: str, dim: int, db_path: str = "chroma_db"):
+        self.backend = backend
+        self.dim = dim
+        if backend == "mmap":
+            self.base = MEMORY_STORE_PATH
+            self.client = None
+        else:
+            import chromadb
+            self.base = db_path
+            self.client = chromadb.PersistentClient(path=db_path)
+        os.makedirs(self.base, exist_ok=True)
+        self.opened: dict[str, object] = {}
+        self.names: list[str] = []
+        self.next_listing = 0.0
+        self.locks: dict[str, FileLock] = {}
+        self.compact_lock = FileLock(os.path.join(self.base, "compact.lock"))
+        self.stamp_path = os.path.join(self.base, "compact.stamp")
+
+    # --- партиции -----------------------------------------------------------
+
+    def _collection_name(self, name: str) -> str:
+        return COLLECTION if name == LEGACY else f"{COLLECTION}_{name.replace('-', '_')}"
+
+    def _list(self) -> list[str]:
+        if self.backend == "mmap":
+            names = [n for n in os.listdir(self.base) if os.path.exists(os.path.join(self.base, n, "vectors.bin"))]
+            if os.path.exists(os.path.join(self.base, "vectors.bin")):
+                names.append(LEGACY)
+            return sorted(names)
+        names = []
+        for collection in self.client.list_collections():
+            name = getattr(collection, "name", collection)
+            if name == COLLECTION:
+                names.append(LEGACY)
+            elif name.startswith(f"{COLLECTION}_"):
+                names.append(name[len(COLLECTION) + 1:].replace("_", "-"))
+        return sorted(names)
+
+    def partitions(self, refresh: bool = False) -> list[str]:
+        """Имена партиций; список перечитывается раз в LISTING_SECONDS (другие процессы создают новые)."""
+        now = time.monotonic()
+        if refresh or now >= self.next_listing:
+            self.names = self._list()
+            self.next_listing = now + LISTING_SECONDS
+        return self.names
+
+    def _open(self, name: str, create: bool = False):
+        store = self.opened.get(name)
+        if store is not None:
+            return store
+        if self.backend == "mmap":
+            from vector_store import MmapVectorStore
+            path = self.base if name == LEGACY else os.path.join(self.base, name)
+            store = MmapVectorStore(path, dim=self.dim if create else None)
+        elif create:
+            store = self.client.get_or_create_collection(name=self._collection_name(name))
+        else:
+            store = self.client.get_collection(name=self._collection_name(name))
+        self.opened[name] = store
+        return store
+
+    def _lock(self, name: str) -> FileLock:
+        """
+        Блокировка записи в месяц на все процессы; лежит рядом с партициями, а не
+        внутри. Ключ — месяц без суффикса: сырая и уплотненная партиции одного
+        месяца (запись, уплотнение, удаление по сроку) идут под одной блокировкой.
+        """
+        name = name.removesuffix(COMPACT_SUFFIX) if name != LEGACY else name
+        lock = self.locks.get(name)
+        if lock is None:
+            lock = self.locks[name] = FileLock(os.path.join(self.base, f"{name}.lock"))
+        return lock
+
+    def _drop(self, name: str) -> bool:
+        self.opened.pop(name, None)
+        try:
+            if self.backend == "mmap":
+                shutil.rmtree(os.path.join(self.base, name))
+            else:
+                self.client.delete_collection(name=self._collection_name(name))
+            return True
+        except Exception as e:
+            # На Windows папку держат открытые mmap других процессов: удалим в следующий раз
+            logger.warning(f"Память: не удалось удалить партицию {name}: {e}")
+            return False
+
+    def window(self, now: datetime.date | None = None) -> list[str]:
+        """Партиции для поиска: месяцы окна (сырые и уплотненные) и старая общая."""
+        start = months_back(now or datetime.date.today(), MEMORY_WINDOW_MONTHS - 1)
+        return [name for name in self.partitions() if name == LEGACY or name.removesuffix(COMPACT_SUFFIX) >= start]
+
+    # --- интерфейс коллекции -------------------------------------------------
+
+    def _unavailable(self, name: str, error: Exception):
+        # Партицию мог уплотнить или удалить другой процесс
+        logger.warning(f"Память: партиция {name} недоступна: {error}")
+        self.opened.pop(name, None)
+        self.partitions(refresh=True)
+
+    def count(self) -> int:
+        total = 0
+        for name in self.window():
+            try:
+                total += self._open(name).count()
+            except Exception as e:
+                self._unavailable(name, e)
+        return total
+
+    def upsert(self, ids: list[str], embeddings, documents: list[str], metadatas: list[dict]):
+        by_month: dict[str, list[int]] = {}
+        for i, meta in enumerate(metadatas):
+            by_month.setdefault(month_of(meta), []).append(i)
+        for month, rows in by_month.items():
+            batch = dict(
+                ids=[ids[i] for i in rows],
+                embeddings=[embeddings[i] for i in rows],
+                documents=[documents[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows],
+            )
+            # Под блокировкой месяца: уплотнение не удалит его посреди записи
+            with self._lock(month):
+                try:
+                    self._open(month, create=True).upsert(**batch)
+                except Exception:
+                    # Открытую партицию уже уплотнил другой процесс: создаем месяц заново
+                    self.opened.pop(month, None)
+                    self._open(month, create=True).upsert(**batch)
+            if month not in self.names:
+                self.partitions(refresh=True)
+
+    def query(self, query_embeddings, n_results: int = 10, include=None) -> dict:
+        """Запрос в каждую партицию окна и слияние по расстоянию: n_results лучших на запрос."""
+        merged = [[] for _ in query_embeddings]
+        for name in self.window():
+            try:
+                store = self._open(name)
+                count = store.count()
+                if not count:
+                    continue
+                result = store.query(
+                    query_embeddings=query_embeddings, n_results=min(n_results, count),
+                    include=["documents", "metadatas", "embeddings", "distances"]
+                )
+            except Exception as e:
+                self._unavailable(name, e)
+                continue
+            for q in range(len(query_embeddings)):
+                merged[q].extend(zip(
+                    result['distances'][q], result['ids'][q], result['documents'][q],
+                    result['metadatas'][q], result['embeddings'][q]
+                ))
+        for hits in merged:
+            hits.sort(key=lambda hit: hit[0])
+            del hits[n_results:]
+        return {
+            key: [[hit[pos] for hit in hits] for hits in merged]
+            for pos, key in enumerate(("distances", "ids", "documents", "metadatas", "embeddings"))
+        }
+
+    # --- уплотнение и хранение -------------------------------------------------
+
+    def _rows(self, name: str, batch: int = 1000):
+        store = self._open(name)
+        total = store.count()
+        for offset in range(0, total, batch):
+            page = store.get(include=["embeddings", "documents", "metadatas"], limit=batch, offset=offset)
+            if not len(page['ids']):
+                return
+            yield page
+
+    def compact_partition(self, month: str) -> int:
+        """
+        Месяц -> уплотненная партиция: похожие статьи (MEMORY_COMPACT_SIMILARITY)
+        сливаются в одну запись с центроидом; документ — заголовки сюжета.
+        Сюжеты дописываются к уже уплотненному месяцу (статьи с давней датой
+        публикации приходят и после уплотнения). Весь проход идет под блокировкой
+        записи месяца, поэтому статьи, которые другие процессы добавляют в это
+        время, ждут и попадают уже в новую сырую партицию. Сначала пишется
+        уплотненная партиция, потом удаляется исходная: прерванный проход
+        повторится, в худшем случае оставив дубли сюжетов, но не потеряв статей.
+        """
+        with self._lock(month):
+            return self._compact_locked(month)
+
+    def _compact_locked(self, month: str) -> int:
+        ids, vectors, metadatas = [], [], []
+        for page in self._rows(month):
+            ids.extend(page['ids'])
+            vectors.extend(np.asarray(page['embeddings'], dtype=np.float32))
+            metadatas.extend(page['metadatas'])
+        if not ids:
+            self._drop(month)
+            return 0
+        matrix = np.asarray(vectors)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-9)
+
+        clusters = cluster_vectors(matrix, MEMORY_COMPACT_SIMILARITY)
+        batch = int(time.time())
+        out_ids, out_vectors, out_docs, out_metas = [], [], [], []
+        for number, members in enumerate(clusters):
+            centroid = matrix[members].mean(axis=0)
+            titles = list(dict.fromkeys(metadatas[i].get('title') or "Без названия" for i in members))
+            out_ids.append(f"{month}:{batch}:{number}")
+            out_vectors.append((centroid / np.linalg.norm(centroid)).tolist())
+            out_docs.append(f"Сюжет из {len(members)} статей: " + "; ".join(titles[:SUMMARY_TITLES]))
+            out_metas.append({
+                'url': "", 'title': titles[0] if len(members) == 1 else f"{titles[0]} (+{len(members) - 1})",
+                'date': latest_date(metadatas[i] for i in members) or f"{month}-01", 'articles': len(members),
+            })
+
+        target = f"{month}{COMPACT_SUFFIX}"
+        store = self._open(target, create=True)
+        for start in range(0, len(out_ids), 1000):
+            end = start + 1000
+            store.upsert(ids=out_ids[start:end], embeddings=out_vectors[start:end],
+                         documents=out_docs[start:end], metadatas=out_metas[start:end])
+        self._drop(month)
+        logger.info(f"Память: {month} уплотнен, {len(ids)} статей -> {len(clusters)} сюжетов")
+        return len(clusters)
+
+    def compact(self, now: datetime.date | None = None) -> dict:
+        """Уплотнение старых месяцев и удаление вышедших за срок хранения."""
+        now = now or datetime.date.today()
+        compact_before = months_back(now, MEMORY_COMPACT_AFTER_MONTHS)
+        drop_before = months_back(now, MEMORY_RETENTION_MONTHS) if MEMORY_RETENTION_MONTHS else None
+        stats = {'compacted': 0, 'dropped': 0}
+        names = self.partitions(refresh=True)
+        for name in names:
+            if name == LEGACY:
+                continue
+            month = name.removesuffix(COMPACT_SUFFIX)
+            if drop_before and month < drop_before:
+                with self._lock(month):
+                    stats['dropped'] += self._drop(name)
+            elif not name.endswith(COMPACT_SUFFIX) and month < compact_before:
+                self.compact_partition(month)
+                stats['compacted'] += 1
+        self.partitions(refresh=True)
+        return stats
+
+    def maybe_compact(self) -> dict | None:
+        """
+        Уплотнение не чаще раза в MEMORY_COMPACT_INTERVAL_HOURS на все процессы:
+        время прошлого прохода лежит в compact.stamp, одновременно работает один процесс.
+        """
+        if MEMORY_COMPACT_INTERVAL_HOURS <= 0:
+            return None
+        try:
+            if time.time() - os.path.getmtime(self.stamp_path) < MEMORY_COMPACT_INTERVAL_HOURS * 3600:
+                return None
+        except OSError:
+            pass
+        try:
+            with self.compact_lock.acquire(timeout=0):
+                stats = self.compact()
+                with open(self.stamp_path, "w", encoding="utf-8") as f:
+                    f.write(datetime.datetime.now().isoformat())
+                return stats
+        except Timeout:
+            return None
+
+    def repartition(self) -> int:
+        """Переносит старую общую коллекцию по месяцам и удаляет ее."""
+        if LEGACY not in self.partitions(refresh=True):
+            return 0
+        moved = 0
+        for page in self._rows(LEGACY):
+            self.upsert(list(page['ids']), [list(v) for v in page['embeddings']],
+                        list(page['documents']), list(page['metadatas']))
+            moved += len(page['ids'])
+            logger.info(f"Память: перенесено по месяцам {moved}")
+        if self.backend == "mmap":
+            # Корень MEMORY_STORE_PATH — общий для партиций, удаляем только файлы хранилища
+            self.opened.pop(LEGACY, None)
+            for file_name in ("vectors.bin", "records.jsonl", "hnsw.bin"):
+                path = os.path.join(self.base, file_name)
+                if os.path.exists(path):
+                    os.remove(path)
+        else:
+            self._drop(LEGACY)
+        self.partitions(refresh=True)
+        return moved
+
+
+if __name__ == "__main__":
+    import argparse
+    from logger_config import setup_logger
+    from config import MEMORY_BACKEND
+    from sentence_transformers import SentenceTransformer
+
+    setup_logger()
+    arg_parser = argparse.ArgumentParser(description="Помесячные партиции памяти: перенос, уплотнение, срок хранения.")
+    arg_parser.add_argument('--repartition', action='store_true', help="Разложить старую общую коллекцию по месяцам")
+    arg_parser.add_argument('--compact', action='store_true', help="Уплотнить старые месяцы и удалить просроченные")
+    args = arg_parser.parse_args()
+
+    dim = SentenceTransformer('all-MiniLM-L6-v2').get_sentence_embedding_dimension()
+    store = PartitionedStore(MEMORY_BACKEND, dim)
+    if args.repartition:
+        store.repartition()
+    if args.compact:
+        print(store.compact())
+    print(f"Партиции: {', '.join(store.partitions(refresh=True)) or '—'}")
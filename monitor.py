@@ -0,0 +1,86 @@
+import asyncio
+from loguru import logger
+
+import page_parser as parser
+from config import API_KEY, SEARCH_ENGINE_ID
+from search_client import SearchClient
+
+
+class MonitorEngine:
+    """
+    Мониторинг нескольких тем за один прогон: поиск по всем темам идет параллельно,
+    одинаковые URL скачиваются и анализируются один раз, а результат
+    размечается темой (query_topic).
+    """
+
+    def __init__(self, num_results: int = 2, show_logs: bool = False, search_client: SearchClient | None = None):
+        self.num_results = num_results
+        self.show_logs = show_logs
+        self.search_client = search_client or SearchClient(API_KEY, SEARCH_ENGINE_ID)
+
+    async def search_topics(self, topics: list[str]) -> dict[str, list[str]]:
+        # SearchClient.search блокирующий: уводим запросы в потоки, чтобы они шли одновременно
+        results = await asyncio.gather(*[
+            asyncio.to_thread(self.search_client.search, topic, self.num_results, self.show_logs)
+            for topic in topics
+        ], return_exceptions=True)
+
+        links_by_topic = {}
+        for topic, data in zip(topics, results):
+            if isinstance(data, Exception):
+                logger.error(f"Ошибка поиска по теме '{topic}': {data}")
+                data = None
+            links_by_topic[topic] = [item["link"] for item in (data or {}).get("items", [])]
+        return links_by_topic
+
+    async def run(self, topics: list[str], on_progress=None) -> list[dict]:
+        """
+        on_progress(topic, done, total) вызывается по мере готовности статей каждой темы.
+        Статья, найденная по нескольким темам, попадает в результат под каждой из них.
+        """
+        links_by_topic = await self.search_topics(topics)
+        return await self.process(links_by_topic, on_progress)
+
+    async def process(self, links_by_topic: dict[str, list[str]], on_progress=None) -> list[dict]:
+        topics = list(links_by_topic)
+        url_topics: dict[str, list[str]] = {}
+        for topic, links in links_by_topic.items():
+            for url in links:
+                topics_for_url = url_topics.setdefault(url, [])
+                if topic not in topics_for_url:
+                    topics_for_url.append(topic)
+
+        totals = {topic: len(set(links)) for topic, links in links_by_topic.items()}
+        done = {topic: 0 for topic in topics}
+        if on_progress:
+            for topic in topics:
+                if not totals[topic]:
+                    on_progress(topic, 0, 0)
+
+        if not url_topics:
+            return []
+
+        dupes = sum(len(links) for links in links_by_topic.values()) - len(url_topics)
+        if dupes:
+            logger.info(f"Пропущено дублей между темами: {dupes}")
+
+        def handle_item(item: dict):
+            for topic in url_topics.get(item.get('url'), []):
+                done[topic] += 1
+                if on_progress:
+                    on_progress(topic, done[topic], totals[topic])
+
+        search_results = {"items": [{"link": url} for url in url_topics]}
+        primary_topics = {url: owners[0] for url, owners in url_topics.items()}
+        parsed = await parser.run_parser(
+            search_results, "Картина дня", self.show_logs,
+            topics=primary_topics, on_item=handle_item
+        )
+
+        all_articles = []
+        for item in parsed:
+            owners = url_topics.get(item.get('url'), [])
+            all_articles.append(item)
+            for extra_topic in owners[1:]:
+                all_articles.append({**item, 'query_topic': extra_topic})
+        return all_articles
@@ -3,31 +3,49 @@ from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 import ssl
 import httpx
-import os
-import csv
-import json
 import re
-from config import TRUSTED_DOMAINS, FAKE_DOMAINS, PLATFORM_DOMAINS, CLICKBAIT_TRIGGERS
+import time
+import weakref
+from config import CROSSCHECK_MODE, ANALYSIS_TEXT_TOKENS, CROSSCHECK_FLAT_SOURCE_TOKENS
 from database import DatabaseHandler
 from loguru import logger
 import dateparser
 from typing import Optional
 from newspaper import Article
-from google import genai
 from rich.console import Console
 from rich.panel import Panel
 from rich.text import Text
 from rich.table import Table
 from rich import box
 import datetime
+import json
 from memory import MemoryHandler
+from export_sink import ExportSink
+import cross_check
+from compressor import compress
+from page_utils import (
+    is_js_stub, get_domain_rating, extract_date, analyze_title_sentiment, colorize_rating, ai_preview
+)
+from gemini_client import make_client
+import telemetry
+from triage import Triage, label_from_analysis, SAMPLE_KIND
 from curl_cffi.requests import AsyncSession
 from playwright.async_api import async_playwright
 
 console = Console()
 memory = MemoryHandler()
+triage = Triage()
+
+# Один браузер за раз на каждый event loop: CLI, веб и воркеры очереди создают свои циклы
+_playwright_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
 
-PLAYWRIGHT_SEMAPHORE = asyncio.Semaphore(1)
+
+def _playwright_limiter() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    limiter = _playwright_limiters.get(loop)
+    if limiter is None:
+        limiter = _playwright_limiters[loop] = asyncio.Semaphore(1)
+    return limiter
 
 def print_rich_card(item: dict):
     title = item.get('title') or "Без названия"
@@ -51,29 +69,11 @@ def print_rich_card(item: dict):
     content.add_row("📅 Дата:", f"[cyan]{date}[/cyan]")
     content.add_row("🔗 URL:", f"[blue underline]{url}[/blue underline]")
 
-    rating_colored = rating \
-        .replace("Высокое доверие", "[bold green]Высокое доверие[/bold green]") \
-        .replace("Пропаганда", "[bold red]Пропаганда[/bold red]") \
-        .replace("Низкое доверие", "[bold red]Низкое доверие[/bold red]") \
-        .replace("Платформа", "[yellow]Платформа[/yellow]") \
-        .replace("Неизвестен", "[grey70]Неизвестен[/grey70]")
-
-    def color_ai_score(match):
-        score = int(match.group(1))
-        if score >= 80: color = "bold green"
-        elif score >= 50: color = "bold yellow"
-        else: color = "bold red"
-        return f"| [{color}]AI: {score}%[/{color}]"
-
-    rating_colored = re.sub(r'\|\s*AI:\s*(\d{1,3})%', color_ai_score, rating_colored)
+    content.add_row("🛡️ Рейтинг:", f"{colorize_rating(rating)}")
 
-    content.add_row("🛡️ Рейтинг:", f"{rating_colored}")
-
-    if ai_text and "Пропущено" not in ai_text and "короткий" not in ai_text:
-        clean_text = re.sub(r'SCORE:\s*\d{1,3}%\s*', '', ai_text, flags=re.IGNORECASE)
-        clean_text = ai_text.replace("**", "").replace("###", "").replace("\n", " ").strip()
-        ai_preview = clean_text[:150] + "..."
-        content.add_row("🤖 Мнение:", f"[italic grey70]{ai_preview}[/italic grey70]")
+    preview = ai_preview(ai_text)
+    if preview:
+        content.add_row("🤖 Мнение:", f"[italic grey70]{preview}[/italic grey70]")
 
     panel = Panel(
         content,
@@ -101,7 +101,7 @@ def get_dirty_ssl_context():
 
 
 async def fetch_via_playwright(url: str) -> tuple[str, str]:
-    async with PLAYWRIGHT_SEMAPHORE:
+    async with _playwright_limiter():
         logger.warning(f"🎭 Запуск Playwright для: {urlparse(url).netloc}")
         try:
             async with async_playwright() as p:
@@ -137,37 +137,20 @@ async def fetch_via_playwright(url: str) -> tuple[str, str]:
             logger.error(f"❌ Playwright сломался на {url}: {e}")
             raise e
 
-def is_js_stub(html: str) -> bool:
-    if not html or len(html) < 500:
-        return True
-
-    soup = BeautifulSoup(html, 'lxml')
-    text = soup.get_text().lower()
-
-    triggers = [
-        "enable javascript",
-        "javascript is disabled",
-        "browser not supported",
-        "please enable cookies",
-        "включите javascript"
-    ]
-    if len(text) < 1000 and any(t in text for t in triggers):
-        return True
-    return False
-
-
 async def fetch_with_fallback(url: str, curl_client: AsyncSession) -> tuple[str, str]:
     html_text = ""
     source = ""
     error_msg = ""
     try:
-        response = await curl_client.get(url, timeout=15)
-        response.raise_for_status()
+        with telemetry.span("fetch.curl_cffi"):
+            response = await curl_client.get(url, timeout=15)
+            response.raise_for_status()
         html_text = response.text
         source = "curl_cffi"
 
         if is_js_stub(html_text):
             logger.info(f"🤔 {urlparse(url).netloc} требует JS. Переключаюсь на Playwright...")
+            telemetry.incr("js_stubs")
             raise Exception("JS required")
 
     except Exception as e:
@@ -180,19 +163,23 @@ async def fetch_with_fallback(url: str, curl_client: AsyncSession) -> tuple[str,
              logger.warning(f"Ошибка curl_cffi: {e}. Пробуем дальше...")
 
     if not html_text and "js required" not in error_msg:
+            telemetry.incr("fallbacks", method="httpx")
             async with httpx.AsyncClient(verify=get_dirty_ssl_context(), follow_redirects=True) as fallback_client:
                 fallback_client.headers.update({
                     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
                 })
                 try:
-                    resp = await fallback_client.get(url, timeout=15)
-                    resp.raise_for_status()
+                    with telemetry.span("fetch.httpx"):
+                        resp = await fallback_client.get(url, timeout=15)
+                        resp.raise_for_status()
                     return resp.text, "httpx_fallback"
                 except Exception as ex:
                     raise Exception(f"Fallback failed: {ex}")
     if not html_text or is_js_stub(html_text):
+        telemetry.incr("fallbacks", method="playwright")
         try:
-            html_text, source = await fetch_via_playwright(url)
+            with telemetry.span("fetch.playwright"):
+                html_text, source = await fetch_via_playwright(url)
         except Exception as final_e:
             raise Exception(f"Все методы (Curl, Httpx, Playwright) провалились. Последняя ошибка: {final_e}")
 
@@ -211,6 +198,7 @@ async def get_ai_analyzis(text: str, context: str = "") -> Optional[str]:
 
         Используй этот контекст, чтобы заметить противоречия (если новая статья противоречит старым фактам) или подтвердить тренд.
         """
+    article_text = await asyncio.to_thread(compress, text, ANALYSIS_TEXT_TOKENS, memory.model.encode)
     # model = genai.GenerativeModel('gemini-2.5-flash')
     prompt = f"""
     Проанализируй этот новостной текст.
@@ -223,19 +211,21 @@ async def get_ai_analyzis(text: str, context: str = "") -> Optional[str]:
     3. Вердикт (1-2 предложения).
 
     Текст статьи:
-    "{text[:3000]}"
+    "{article_text}"
     """
 
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            client = genai.Client(api_key=os.getenv("GEMINI_KEY"))
-            response = await client.aio.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt)
+            with telemetry.span("ai_call", kind="analysis"):
+                client = make_client()
+                response = await client.aio.models.generate_content(
+                    model="gemini-2.5-flash",
+                    contents=prompt)
             return response.text
         except Exception as e:
             if "429" in str(e):
+                telemetry.incr("gemini_429")
                 wait_time = 20 + (attempt * 10)
                 logger.warning(f"Лимит API (429). Жду {wait_time} сек и пробую снова...")
                 await asyncio.sleep(wait_time)
@@ -244,51 +234,17 @@ async def get_ai_analyzis(text: str, context: str = "") -> Optional[str]:
                 return f"Ошибка AI: {e}"
     return "Ошибка AI: Лимит исчерпан после 3 попыток"
 
-def get_domain_rating(url):
-    try:
-        domain = urlparse(url).netloc
-        if domain.startswith('www.'):
-            domain = domain[4:]
-
-        if domain in TRUSTED_DOMAINS:
-            return "Рейтинг: Высокое доверие"
-        if domain in FAKE_DOMAINS:
-            return "Рейтинг: Низкое доверие / Пропаганда"
-        if domain in PLATFORM_DOMAINS:
-            return "Рейтинг: Платформа (Не СМИ)"
-
-        return "Рейтинг: Неизвестен"
-    except Exception:
-        return "Рейтинг: Ошибка (невалидный URL)"
-
-def extract_date(soup):
-    time_tag = soup.find("time")
-    if time_tag and time_tag.has_attr("datetime"):
-        return time_tag["datetime"]
-
-    meta_properties = [
-        "article:published_time",
-        "datePublished",
-        "og:updated_time",
-        "og:published_time",
-        "pubdate"
-    ]
-    for prop in meta_properties:
-        meta_tag = soup.find("meta", {"property": prop}) or soup.find("meta", {"name": prop})
-        if meta_tag and meta_tag.has_attr("content"):
-            return meta_tag["content"]
-    return None
-
-def save_report(report_data: list, query: str, show_logs: bool):
+async def save_report(report_data: list, query: str, show_logs: bool, sink: ExportSink | None = None):
     if not report_data: return
 
     db = DatabaseHandler()
-    saved_count = 0
-
+    by_query = {}
     for item in report_data:
         if item and item.get('status') != 'Failed':
-            if db.save_article(item, query):
-                saved_count += 1
+            by_query.setdefault(item.get('query_topic') or query, []).append(item)
+    saved_count = 0
+    for item_query, items in by_query.items():
+        saved_count += await db.asave_articles(items, item_query)
 
     if show_logs:
         logger.success(f"Сохранено {saved_count} записей в базу через ORM.")
@@ -298,57 +254,40 @@ def save_report(report_data: list, query: str, show_logs: bool):
         except ImportError:
             print(f"База данных обновлена: +{saved_count} записей")
 
-    if not report_data:
-        if show_logs:
-            logger.warning("Нет данных для сохранения отчета.")
+    if sink is None:
         return
-    try:
-        with open("report.json", "w", encoding="utf-8") as f:
-            json.dump(report_data, f, ensure_ascii=False, indent=4)
-        if show_logs:
-            logger.success("Отчет сохранен в report.json")
-    except Exception as e:
-        if show_logs:
-            logger.error(f"Ошибка при сохранении отчета: {e}")
-        else:
-            console.print(f"[red]❌ Ошибка JSON: {e}[/red]")
+    files = ", ".join(sink.paths())
+    if show_logs:
+        logger.success(f"Выгрузка ({sink.count} строк) сохранена: {files}")
+    else:
+        console.print(f"[bold green]💾 Отчеты сохранены: {files}[/bold green]")
 
-    try:
-        fieldnames = report_data[0].keys()
-        with open("report.csv", "w", newline='', encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(report_data)
-        if show_logs:
-            logger.success("Финальный отчет сохранен в report.csv")
-        else:
-            console.print(f"\n[bold green]💾 Отчеты сохранены: report.json, report.csv[/bold green]")
-    except Exception as e:
-        if show_logs:
-            logger.error(f"Ошибка сохранения CSV: {e}")
+async def record_triage_outcome(url: str, features: dict, probability: float | None, ai_result: str):
+    """
+    Ответ Gemini как метка для триажа: образец для следующего обучения и, если
+    модель есть, счетчик согласия (в shadow-режиме по нему выбирают порог).
+    """
+    label = label_from_analysis(ai_result)
+    if label is None:
+        return
+    if probability is not None:
+        predicted_skip = probability < triage.threshold
+        if predicted_skip == (label == 0):
+            outcome = "agree"
         else:
-            console.print(f"[red]❌ Ошибка CSV: {e}[/red]")
-
-def analyze_title_sentiment(title: str | None) -> str:
-    if not title:
-        return ""
-    title_lower = title.lower()
-    for trigger in CLICKBAIT_TRIGGERS:
-        if trigger in title_lower:
-            logger.debug(f"Найдено триггер-слово: '{trigger}'")
-            return " (Кликбейт: Триггер-слово)"
-    if '!!!' in title or '???' in title or '!?' in title:
-        logger.debug("Найдена чрезмерная пунктуация")
-        return " (Кликбейт: Пунктуация)"
-    if title.isupper() and len(title) > 10:
-        logger.debug("Заголовок написан в ALL CAPS")
-        return " (Кликбейт: ALL CAPS)"
-    return ""
+            outcome = "would_lose" if predicted_skip else "would_spend"
+        telemetry.incr("triage_shadow", outcome=outcome)
+        logger.debug(f"[{telemetry.current_trace()}] Триаж: {probability:.0%}, Gemini: {'польза' if label else 'пусто'} ({outcome})")
+    sample = json.dumps({'features': features, 'label': label}, ensure_ascii=False)
+    await asyncio.to_thread(DatabaseHandler().save_ai_cache, SAMPLE_KIND, {f"{SAMPLE_KIND}:{url}": sample})
 
 async def fetch_and_parse_url(client: AsyncSession, url: str, semaphore: asyncio.Semaphore, show_logs: bool) -> dict:
+    # Каждая статья обрабатывается в своей задаче, поэтому trace id не смешивается
+    trace_id = telemetry.new_trace()
     async with semaphore:
+        started = time.perf_counter()
         if show_logs:
-            logger.info(f"Обрабатываем: {url}")
+            logger.info(f"[{trace_id}] Обрабатываем: {url}")
         else:
             console.print(f"[grey50]⏳ Обработка: {urlparse(url).netloc}...[/grey50]")
         domain_rating = get_domain_rating(url)
@@ -364,10 +303,11 @@ async def fetch_and_parse_url(client: AsyncSession, url: str, semaphore: asyncio
         ai_score_short = ""
         try:
             html_text, method = await fetch_with_fallback(url, client)
-            soup = BeautifulSoup(html_text, "lxml")
-            article = Article(url)
-            article.set_html(html_text)
-            article.parse()
+            with telemetry.span("extract", method=method):
+                soup = BeautifulSoup(html_text, "lxml")
+                article = Article(url)
+                article.set_html(html_text)
+                article.parse()
 
             if "youtube.com" in url or "youtu.be" in url:
                 report_item['ai_analysis'] = "Пропущено (Видео контент)"
@@ -377,18 +317,28 @@ async def fetch_and_parse_url(client: AsyncSession, url: str, semaphore: asyncio
                 if show_logs: logger.warning("AI пропущен (Мало текста)")
             else:
                 report_item['text_content'] = article.text
-                if show_logs: logger.info("Отправляю текст в AI...")
-                past_context = memory.find_similar_context(article.text[:500])
-                if past_context and show_logs:
-                    logger.info("🧠 Найден контекст из прошлого!")
-                ai_result = await get_ai_analyzis(article.text, context=past_context)
-                if ai_result:
-                    report_item['ai_analysis'] = ai_result
-                    if show_logs: logger.success("AI анализ получен!")
-                    match = re.search(r'(\d{1,3}%)', ai_result)
-                    if match:
-                        ai_score_short = f" | AI: {match.group(1)}"
-                    await asyncio.sleep(2)
+                # Признаки считаются и при TRIAGE_MODE=off: ответ Gemini станет образцом для обучения
+                with telemetry.span("triage"):
+                    features = triage.features(url, article.title, domain_rating, article.text)
+                    probability = triage.predict(features) if triage.enabled else None
+                if triage.should_skip(probability):
+                    report_item['ai_analysis'] = f"Пропущено (триаж: польза {probability:.0%})"
+                    telemetry.incr("triage_skipped")
+                    if show_logs: logger.info(f"AI пропущен (триаж: {probability:.0%})")
+                else:
+                    if show_logs: logger.info("Отправляю текст в AI...")
+                    past_context = await memory.afind_similar_context(article.text, exclude_url=url)
+                    if past_context and show_logs:
+                        logger.info("🧠 Найден контекст из прошлого!")
+                    ai_result = await get_ai_analyzis(article.text, context=past_context)
+                    if ai_result:
+                        report_item['ai_analysis'] = ai_result
+                        if show_logs: logger.success("AI анализ получен!")
+                        match = re.search(r'(\d{1,3}%)', ai_result)
+                        if match:
+                            ai_score_short = f" | AI: {match.group(1)}"
+                        await record_triage_outcome(url, features, probability, ai_result)
+                        await asyncio.sleep(2)
 
             title = article.title
             if not title:
@@ -401,7 +351,7 @@ async def fetch_and_parse_url(client: AsyncSession, url: str, semaphore: asyncio
                 if show_logs: logger.warning("Название не найдено")
 
             report_item['title'] = title
-            sentiment_tag = analyze_title_sentiment(title)
+            sentiment_tag = analyze_title_sentiment(title, article.text)
             final_rating = f"{domain_rating}{sentiment_tag}{ai_score_short}"
             report_item['rating'] = final_rating
 
@@ -448,11 +398,18 @@ async def fetch_and_parse_url(client: AsyncSession, url: str, semaphore: asyncio
             else:
                 console.print(f"[red]❌ Ошибка {urlparse(url).netloc}: {e}[/red]")
             report_item['status'] = f"Failed: {e}"
+            telemetry.incr("fetch_failures")
             print("\n")
 
+        # Время одной статьи без ожидания семафора: fetch + разбор + AI + память
+        telemetry.record("article", time.perf_counter() - started)
         return report_item
 
-async def run_parser(search_results_data, query, show_logs: bool):
+async def run_parser(search_results_data, query, show_logs: bool, topics: dict | None = None, on_item=None):
+    """
+    topics: url -> тема (query_topic) для общих прогонов по нескольким темам.
+    on_item: колбэк, вызывается с каждой статьей сразу после ее обработки.
+    """
     links = [item["link"] for item in search_results_data.get("items", [])]
 
     headers = {
@@ -463,25 +420,52 @@ async def run_parser(search_results_data, query, show_logs: bool):
     tasks = []
     if not show_logs:
         console.print(f"[bold cyan]🚀 Запуск анализа для {len(links)} ссылок...[/bold cyan]\n")
-    async with AsyncSession(impersonate="chrome110", headers=headers, verify=False) as client:
-        for url in links:
-            tasks.append(fetch_and_parse_url(client, url, semaphore, show_logs))
-        if show_logs: logger.info(f"Запускаю {len(tasks)} задач одновременно...")
-        final_report_data = await asyncio.gather(*tasks)
-
-    save_report(final_report_data, query, show_logs)
+    async def process_and_export(client: AsyncSession, url: str) -> dict:
+        item = await fetch_and_parse_url(client, url, semaphore, show_logs)
+        if topics and url in topics:
+            item['query_topic'] = topics[url]
+        try:
+            sink.write(item)
+        except Exception as e:
+            logger.error(f"Ошибка записи выгрузки: {e}")
+        if on_item:
+            on_item(item)
+        return item
+
+    with ExportSink(query) as sink:
+        async with AsyncSession(impersonate="chrome110", headers=headers, verify=False) as client:
+            for url in links:
+                tasks.append(process_and_export(client, url))
+            if show_logs: logger.info(f"Запускаю {len(tasks)} задач одновременно...")
+            final_report_data = await asyncio.gather(*tasks)
+
+    await save_report(final_report_data, query, show_logs, sink)
     return final_report_data
 
 
-async def get_cross_check_analysis(articles_data: list ) -> str:
+async def get_cross_check_analysis(articles_data: list, mode: str = CROSSCHECK_MODE) -> str:
+    """
+    mode: "flat" — все тексты (сжатые до CROSSCHECK_FLAT_SOURCE_TOKENS) в один запрос; "hierarchical" —
+    извлечение фактов по источникам и сравнение фактов (cross_check.py);
+    "auto" — flat, пока тексты короткие и помещаются в бюджет целиком.
+    """
     valid_articles = [a for a in articles_data if a.get('text_content')]
 
     if len(valid_articles) < 2:
         return "⚠️ Для кросс-анализа нужно минимум 2 успешные статьи с текстом."
 
+    if mode == "hierarchical" or (mode == "auto" and not cross_check.fits_flat(valid_articles)):
+        try:
+            return await cross_check.hierarchical_cross_check(valid_articles, encode=memory.model.encode)
+        except Exception as e:
+            logger.error(f"Ошибка кросс-анализа: {e}")
+            return f"❌ Не удалось провести кросс-анализ: {e}"
+
     context_text = ""
     for i, art in enumerate(valid_articles):
-        text_snippet = art['text_content'][:4000]
+        text_snippet = await asyncio.to_thread(
+            compress, art['text_content'], CROSSCHECK_FLAT_SOURCE_TOKENS, memory.model.encode, "crosscheck"
+        )
         domain = urlparse(art['url']).netloc
         context_text += f"\n=== ИСТОЧНИК {i+1} ({domain}) ===\n{text_snippet}\n"
 
@@ -511,7 +495,7 @@ async def get_cross_check_analysis(articles_data: list ) -> str:
     """
 
     try:
-        client = genai.Client(api_key=os.getenv("GEMINI_KEY"))
+        client = make_client()
         response = await client.aio.models.generate_content(
             model="gemini-2.5-flash",
             contents=prompt
@@ -0,0 +1,108 @@
+import re
+from urllib.parse import urlparse
+from bs4 import BeautifulSoup
+from loguru import logger
+
+from clickbait import ClickbaitMatcher
+from config import CLICKBAIT_MIN_SCORE
+from reputation import ReputationIndex, TRUSTED, FAKE, PLATFORM
+
+# Легкие функции, которые вызываются на каждую статью. Отдельно от page_parser,
+# чтобы их можно было импортировать (и мерить, benchmarks/bench_micro.py)
+# без загрузки моделей эмбеддингов и браузера.
+
+_AI_SCORE_RE = re.compile(r'\|\s*AI:\s*(\d{1,3})%')
+_DOMAIN_RATINGS = {
+    TRUSTED: "Рейтинг: Высокое доверие",
+    FAKE: "Рейтинг: Низкое доверие / Пропаганда",
+    PLATFORM: "Рейтинг: Платформа (Не СМИ)",
+}
+_RATING_COLORS = (
+    ("Высокое доверие", "[bold green]Высокое доверие[/bold green]"),
+    ("Пропаганда", "[bold red]Пропаганда[/bold red]"),
+    ("Низкое доверие", "[bold red]Низкое доверие[/bold red]"),
+    ("Платформа", "[yellow]Платформа[/yellow]"),
+    ("Неизвестен", "[grey70]Неизвестен[/grey70]"),
+)
+
+
+def is_js_stub(html: str) -> bool:
+    if not html or len(html) < 500:
+        return True
+
+    soup = BeautifulSoup(html, 'lxml')
+    text = soup.get_text().lower()
+
+    triggers = [
+        "enable javascript",
+        "javascript is disabled",
+        "browser not supported",
+        "please enable cookies",
+        "включите javascript"
+    ]
+    if len(text) < 1000 and any(t in text for t in triggers):
+        return True
+    return False
+
+
+def get_domain_rating(url):
+    try:
+        # Поддомены наследуют рейтинг: edition.bbc.com, m.ria.ru, *.blogspot.com
+        category = ReputationIndex().lookup(urlparse(url).hostname)
+        return _DOMAIN_RATINGS.get(category, "Рейтинг: Неизвестен")
+    except Exception:
+        return "Рейтинг: Ошибка (невалидный URL)"
+
+
+def extract_date(soup):
+    time_tag = soup.find("time")
+    if time_tag and time_tag.has_attr("datetime"):
+        return time_tag["datetime"]
+
+    meta_properties = [
+        "article:published_time",
+        "datePublished",
+        "og:updated_time",
+        "og:published_time",
+        "pubdate"
+    ]
+    for prop in meta_properties:
+        meta_tag = soup.find("meta", {"property": prop}) or soup.find("meta", {"name": prop})
+        if meta_tag and meta_tag.has_attr("content"):
+            return meta_tag["content"]
+    return None
+
+
+def analyze_title_sentiment(title: str | None, text: str | None = None) -> str:
+    """Метка для рейтинга: " (Кликбейт 64/100: Сенсация, Интрига)" или пустая строка."""
+    if not title and not text:
+        return ""
+    matcher = ClickbaitMatcher()
+    result = matcher.score(title, text)
+    if result['score'] < CLICKBAIT_MIN_SCORE:
+        return ""
+    labels = ", ".join(matcher.label(c) for c in result['categories'][:2])
+    logger.debug(f"Кликбейт {result['score']}/100: {labels}")
+    return f" (Кликбейт {result['score']}/100: {labels})"
+
+
+def _color_ai_score(match):
+    score = int(match.group(1))
+    if score >= 80: color = "bold green"
+    elif score >= 50: color = "bold yellow"
+    else: color = "bold red"
+    return f"| [{color}]AI: {score}%[/{color}]"
+
+
+def colorize_rating(rating: str) -> str:
+    """Разметка rich для строки рейтинга в карточке статьи."""
+    for plain, colored in _RATING_COLORS:
+        rating = rating.replace(plain, colored)
+    return _AI_SCORE_RE.sub(_color_ai_score, rating)
+
+
+def ai_preview(ai_text: str | None, limit: int = 150) -> str | None:
+    if not ai_text or "Пропущено" in ai_text or "короткий" in ai_text:
+        return None
+    clean_text = ai_text.replace("**", "").replace("###", "").replace("\n", " ").strip()
+    return clean_text[:limit] + "..."
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from loguru import logger
+
+from config import REPORT_CACHE_DIR, REPORT_CACHE_MAX_FILES, RENDER_WORKERS
+from report_generator import REPORT_TEMPLATE_VERSION
+import telemetry
+
+# Поля статьи, которые реально попадают в PDF. Только они идут в ключ и в воркер.
+PDF_FIELDS = ('title', 'url', 'rating', 'ai_analysis')
+
+
+def _pdf_articles(articles: list) -> list[dict]:
+    return [{field: item.get(field) for field in PDF_FIELDS} for item in (articles or []) if item]
+
+
+def report_key(query: str, articles: list, cross_check_text: str | None = None) -> str:
+    payload = json.dumps(
+        [REPORT_TEMPLATE_VERSION, query, _pdf_articles(articles), cross_check_text],
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _render_to_file(path: str, query: str, articles: list, cross_check_text: str | None) -> str:
+    from report_generator import create_pdf
+
+    pdf_bytes = create_pdf(query, articles, cross_check_text)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, path)
+    return path
+
+
+class ReportRenderer:
+    """
+    Фоновый рендер PDF: задачи уходят в пул процессов, готовые отчеты лежат
+    на диске под ключом report_key(...) и отдаются повторно без перерисовки.
+    """
+    _instance = None
+
+    def __new__(cls, cache_dir=REPORT_CACHE_DIR, workers=RENDER_WORKERS):
+        if cls._instance is None:
+            cls._instance = super(ReportRenderer, cls).__new__(cls)
+            cls._instance._initialize(cache_dir, workers)
+        return cls._instance
+
+    def _initialize(self, cache_dir, workers):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.workers = workers
+        # Пул создается при первой фоновой задаче: CLI рендерит в своем процессе и пул не поднимает
+        self.executor = None
+        self.lock = threading.Lock()
+        self.jobs: dict[str, Future] = {}
+        logger.info(f"ReportRenderer инициализирован ({workers} воркеров, кеш: {cache_dir}).")
+
+    def _new_executor(self):
+        # spawn: форк процесса Streamlit/aiogram с живыми потоками небезопасен
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def submit(self, query: str, articles: list, cross_check_text: str | None = None) -> str:
+        key = report_key(query, articles, cross_check_text)
+        path = self.path_for(key)
+        with self.lock:
+            if os.path.exists(path):
+                telemetry.cache_hit("report")
+                return key
+            job = self.jobs.get(key)
+            if job is not None and not job.done():
+                return key
+            telemetry.cache_hit("report", hit=False)
+            args = (_render_to_file, path, query, _pdf_articles(articles), cross_check_text)
+            if self.executor is None:
+                self.executor = self._new_executor()
+            try:
+                future = self.executor.submit(*args)
+            except BrokenProcessPool:
+                logger.warning("Пул рендера PDF упал, пересоздаю...")
+                self.executor = self._new_executor()
+                future = self.executor.submit(*args)
+            submitted = time.perf_counter()
+            future.add_done_callback(lambda f, key=key: self._on_done(key, f, submitted))
+            self.jobs[key] = future
+        logger.debug(f"PDF поставлен в очередь: {key[:12]}")
+        return key
+
+    def _on_done(self, key: str, future: Future, submitted: float):
+        # Рендер идет в другом процессе: span туда не дотянется, меряем от постановки в очередь
+        telemetry.registry.observe("pdf_render", time.perf_counter() - submitted)
+        error = future.exception()
+        if error:
+            logger.error(f"Ошибка рендера PDF {key[:12]}: {error}")
+            return
+        with self.lock:
+            self.jobs.pop(key, None)
+        self._prune()
+
+    def _prune(self):
+        try:
+            files = [
+                os.path.join(self.cache_dir, name)
+                for name in os.listdir(self.cache_dir) if name.endswith(".pdf")
+            ]
+            if len(files) <= REPORT_CACHE_MAX_FILES:
+                return
+            files.sort(key=os.path.getmtime)
+            for path in files[:len(files) - REPORT_CACHE_MAX_FILES]:
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"Не удалось очистить кеш отчетов: {e}")
+
+    def status(self, key: str) -> str:
+        if os.path.exists(self.path_for(key)):
+            return "ready"
+        with self.lock:
+            job = self.jobs.get(key)
+        if job is None:
+            return "missing"
+        if job.done() and job.exception():
+            return "error"
+        return "pending"
+
+    def error(self, key: str) -> BaseException | None:
+        with self.lock:
+            job = self.jobs.get(key)
+        if job is not None and job.done():
+            return job.exception()
+        return None
+
+    def fetch(self, key: str) -> bytes | None:
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)  # Отчет свежий: не удалять при очистке
+        with open(path, "rb") as f:
+            return f.read()
+
+    def render(self, query: str, articles: list, cross_check_text: str | None = None,
+               timeout: float | None = None, inline: bool = False) -> bytes:
+        """
+        Блокирующий вариант: ставит задачу (или берет из кеша) и ждет результат.
+        inline=True рисует в текущем процессе (CLI): процесс пула с spawn заново
+        импортирует __main__, а main.py тянет за собой page_parser с моделью эмбеддингов.
+        """
+        if inline:
+            key = report_key(query, articles, cross_check_text)
+            path = self.path_for(key)
+            if os.path.exists(path):
+                telemetry.cache_hit("report")
+            else:
+                telemetry.cache_hit("report", hit=False)
+                with telemetry.span("pdf_render"):
+                    _render_to_file(path, query, _pdf_articles(articles), cross_check_text)
+                self._prune()
+            return self.fetch(key)
+
+        key = self.submit(query, articles, cross_check_text)
+        with self.lock:
+            job = self.jobs.get(key)
+        if job is not None:
+            job.result(timeout=timeout)
+        pdf_bytes = self.fetch(key)
+        if pdf_bytes is None:
+            raise RuntimeError("PDF не найден в кеше после рендера")
+        return pdf_bytes
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
@@ -1,9 +1,66 @@
 from fpdf import FPDF
+import fpdf.fpdf as fpdf_module
+from collections import OrderedDict
+import copy
 import os
 import re
+import threading
+import zlib
 from urllib.parse import urlparse
 
+FONT_DIR = os.path.dirname(os.path.abspath(__file__))
+FONT_FILES = {
+    '': 'DejaVuSans.ttf',
+    'B': 'DejaVuSans-Bold.ttf',
+    'I': 'DejaVuSans.ttf',
+}
+SUBSET_CACHE_SIZE = 32
+# Повышать при любом изменении верстки: входит в ключ кеша готовых отчетов
+REPORT_TEMPLATE_VERSION = "2"
+
+_font_lock = threading.Lock()
+_font_snapshot = None  # [(fontkey, font, font_files)] после первой регистрации в процессе
+
+# Метрики шрифтов кешируются в памяти процесса, а не в .pkl рядом с текущей директорией
+if hasattr(fpdf_module, 'FPDF_CACHE_MODE'):
+    fpdf_module.FPDF_CACHE_MODE = 1
+
+class GlyphSubset(list):
+    """
+    Список символов шрифта без дублей и с проверкой вхождения за O(1).
+    fpdf дописывает в subset каждый выведенный символ, а при сборке шрифта
+    проверяет `cid in subset` для всех 65536 кодов.
+    """
+
+    def __init__(self, codes=()):
+        unique = list(dict.fromkeys(codes))
+        super().__init__(unique)
+        self._members = set(unique)
+
+    def append(self, code):
+        if code not in self._members:
+            self._members.add(code)
+            super().append(code)
+
+    def __contains__(self, code):
+        return code in self._members
+
+    def __delitem__(self, index):
+        removed = self[index]
+        super().__delitem__(index)
+        if isinstance(index, slice):
+            self._members = set(self)
+        else:
+            self._members.discard(removed)
+
+
 class PDFReport(FPDF):
+    def _putfonts(self):
+        for font in self.fonts.values():
+            if isinstance(font, dict) and isinstance(font.get('subset'), list):
+                font['subset'] = GlyphSubset(font['subset'])
+        super()._putfonts()
+
     def header(self):
         self.set_fill_color(44, 62, 80) # Midnight Blue
         self.rect(0, 0, 210, 40, 'F')
@@ -22,43 +79,216 @@ class PDFReport(FPDF):
         self.set_text_color(128, 128, 128)
         self.cell(0, 10, f'Страница {self.page_no()} | Сгенерировано AI-Анализатором', align='C')
 
+class _StreamBuffer:
+    """Заменяет строковый FPDF.buffer: `+=` сразу пишет в файл, len() отдает смещение в байтах."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = 0
+
+    def __iadd__(self, text):
+        data = text.encode('latin-1')
+        self.stream.write(data)
+        self.size += len(data)
+        return self
+
+    def __len__(self):
+        return self.size
+
+
+class StreamingPDFReport(PDFReport):
+    """
+    Отчет, который сбрасывает каждую завершенную страницу в поток и освобождает ее.
+    Порядок объектов совпадает с fpdf 1.7.2 (страница 3+2*i, содержимое 4+2*i),
+    поэтому шрифты, ресурсы и xref дописываются штатным _enddoc.
+    Алиас {nb} (alias_nb_pages) в этом режиме не поддерживается.
+    """
+
+    def __init__(self, stream, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buffer = _StreamBuffer(stream)
+        self.flushed_pages = 0
+
+    def _putheader(self):
+        if len(self.buffer) == 0:
+            super()._putheader()
+
+    def _endpage(self):
+        super()._endpage()
+        self._flush_page(self.page)
+
+    def _page_size(self):
+        if self.def_orientation == 'P':
+            return self.fw_pt, self.fh_pt
+        return self.fh_pt, self.fw_pt
+
+    def _flush_page(self, n):
+        if n <= self.flushed_pages:
+            return
+        self._putheader()
+        w_pt, h_pt = self._page_size()
+
+        self._newobj()
+        self._out('<</Type /Page')
+        self._out('/Parent 1 0 R')
+        if n in self.orientation_changes:
+            self._out('/MediaBox [0 0 %.2f %.2f]' % (h_pt, w_pt))
+        self._out('/Resources 2 0 R')
+        if self.page_links and n in self.page_links:
+            annots = '/Annots ['
+            for pl in self.page_links.pop(n):
+                rect = '%.2f %.2f %.2f %.2f' % (pl[0], pl[1], pl[0] + pl[2], pl[1] - pl[3])
+                annots += '<</Type /Annot /Subtype /Link /Rect [' + rect + '] /Border [0 0 0] '
+                if isinstance(pl[4], str):
+                    annots += '/A <</S /URI /URI ' + self._textstring(pl[4]) + '>>>>'
+                else:
+                    link = self.links[pl[4]]
+                    h = w_pt if link[0] in self.orientation_changes else h_pt
+                    annots += '/Dest [%d 0 R /XYZ 0 %.2f null]>>' % (1 + 2 * link[0], h - link[1] * self.k)
+            self._out(annots + ']')
+        if self.pdf_version > '1.3':
+            self._out('/Group <</Type /Group /S /Transparency /CS /DeviceRGB>>')
+        self._out('/Contents ' + str(self.n + 1) + ' 0 R>>')
+        self._out('endobj')
+
+        content = self.pages[n]
+        self.pages[n] = ''
+        if self.compress:
+            content = zlib.compress(content.encode('latin1'))
+            content_filter = '/Filter /FlateDecode '
+        else:
+            content_filter = ''
+        self._newobj()
+        self._out('<<' + content_filter + '/Length ' + str(len(content)) + '>>')
+        self._putstream(content)
+        self._out('endobj')
+        self.flushed_pages = n
+
+    def _putpages(self):
+        for n in range(self.flushed_pages + 1, self.page + 1):
+            self._flush_page(n)
+        w_pt, h_pt = self._page_size()
+        self.offsets[1] = len(self.buffer)
+        self._out('1 0 obj')
+        self._out('<</Type /Pages')
+        self._out('/Kids [' + ''.join(str(3 + 2 * i) + ' 0 R ' for i in range(self.page)) + ']')
+        self._out('/Count ' + str(self.page))
+        self._out('/MediaBox [0 0 %.2f %.2f]' % (w_pt, h_pt))
+        self._out('>>')
+        self._out('endobj')
+
+
+def resolve_font_path(filename):
+    for directory in (FONT_DIR, os.getcwd()):
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+if hasattr(fpdf_module, 'TTFontFile'):
+    class CachedTTFontFile(fpdf_module.TTFontFile):
+        """Запоминает готовые подмножества глифов: повторный набор символов не пересобирается."""
+        _subsets = OrderedDict()
+
+        def makeSubset(self, file, subset):
+            key = (file, tuple(subset.items()) if isinstance(subset, dict) else tuple(subset))
+            with _font_lock:
+                cached = self._subsets.get(key)
+                if cached:
+                    self._subsets.move_to_end(key)
+            if cached:
+                stream, state = cached
+                self.__dict__.update(state)
+                return stream
+
+            stream = super().makeSubset(file, subset)
+            state = {k: v for k, v in self.__dict__.items() if k != 'fh'}
+            with _font_lock:
+                self._subsets[key] = (stream, state)
+                if len(self._subsets) > SUBSET_CACHE_SIZE:
+                    self._subsets.popitem(last=False)
+            return stream
+
+    fpdf_module.TTFontFile = CachedTTFontFile
+
+
+def _add_fonts(pdf):
+    regular = resolve_font_path(FONT_FILES[''])
+    if regular is None:
+        raise RuntimeError(f"TTF Font file not found: {FONT_FILES['']}")
+    for style, filename in FONT_FILES.items():
+        pdf.add_font('DejaVu', style, resolve_font_path(filename) or regular, uni=True)
+
+
+def register_fonts(pdf):
+    """
+    Регистрирует DejaVu в документе. TTF разбирается один раз на процесс,
+    следующие отчеты получают копию метрик и чистую карту подмножества.
+    """
+    global _font_snapshot
+    with _font_lock:
+        if _font_snapshot is None:
+            template = PDFReport()
+            _add_fonts(template)
+            snapshot = [(key, font, dict(template.font_files)) for key, font in template.fonts.items()]
+            if all(isinstance(font, dict) and 'subset' in font for _, font, _ in snapshot):
+                _font_snapshot = snapshot
+            else:
+                _font_snapshot = []  # Неизвестная версия fpdf: регистрируем шрифты штатно
+        snapshot = _font_snapshot
+
+    if not snapshot:
+        _add_fonts(pdf)
+        return
+
+    for key, font, font_files in snapshot:
+        if key in pdf.fonts:
+            continue
+        entry = dict(font)
+        entry['i'] = len(pdf.fonts) + 1
+        entry['subset'] = copy.deepcopy(font['subset'])
+        pdf.fonts[key] = entry
+        pdf.font_files.update(font_files)
+
+
+_ASTRAL_RE = re.compile('[\U00010000-\U0010FFFF]')
+_PDF_REPLACEMENTS = (
+    ("–", "-"), ("—", "-"), ("“", '"'), ("”", '"'),
+    ("«", '"'), ("»", '"'), ("…", "...")
+)
+_MD_HEADER_RE = re.compile(r'^#+\s+', flags=re.MULTILINE)
+_SCORE_RE = re.compile(r'SCORE:\s*\d+%?', flags=re.IGNORECASE)
+
 def clean_text_for_pdf(text):
     if not isinstance(text, str):
         return str(text)
-    cleaned = "".join(c for c in text if ord(c) < 65536)
-    replacements = {
-        "–": "-", "—": "-", "“": '"', "”": '"',
-        "«": '"', "»": '"', "…": "..."
-    }
-    for old, new in replacements.items():
+    if text.isascii():
+        return text
+    # Символы вне BMP (эмодзи) DejaVu не отрисует. str.translate на кириллице
+    # медленнее цепочки replace, поэтому замены остаются встроенными методами.
+    cleaned = _ASTRAL_RE.sub('', text)
+    for old, new in _PDF_REPLACEMENTS:
         cleaned = cleaned.replace(old, new)
     return cleaned
 
 def clean_markdown(text):
     if not text: return ""
     text = text.replace('```markdown', '').replace('```', '')
-    text = re.sub(r'^#+\s+', '', text, flags=re.MULTILINE)
+    text = _MD_HEADER_RE.sub('', text)
     text = text.replace('**', '').replace('__', '').replace('*', '')
     text = text.encode('utf-8', 'ignore').decode('utf-8')
     return text.strip()
 
-def create_pdf(query, articles, cross_check_text=None, filename="report.pdf"):
-    pdf = PDFReport()
+def _prepare(pdf):
     pdf.set_auto_page_break(auto=True, margin=20)
-
-    font_path = 'DejaVuSans.ttf'
-    bold_font_path = 'DejaVuSans-Bold.ttf'
-
     try:
-        pdf.add_font('DejaVu', '', font_path, uni=True)
-        if os.path.exists(bold_font_path):
-            pdf.add_font('DejaVu', 'B', bold_font_path, uni=True)
-        else:
-            pdf.add_font('DejaVu', 'B', font_path, uni=True)
-        pdf.add_font('DejaVu', 'I', font_path, uni=True)
+        register_fonts(pdf)
     except RuntimeError:
         pdf.set_font("Arial", size=12)
 
+
+def _render_report(pdf, query, articles, cross_check_text=None):
     pdf.add_page()
 
     pdf.set_font('DejaVu', '', 12)
@@ -109,7 +339,7 @@ def create_pdf(query, articles, cross_check_text=None, filename="report.pdf"):
 
         title = clean_text_for_pdf(raw_title) # Чистим заголовок
 
-        url = item.get('url', '')
+        url = item.get('url') or ''
         domain = urlparse(url).netloc.replace('www.', '')
         valid_count += 1
         pdf.set_font('DejaVu', 'B', 13)
@@ -124,7 +354,7 @@ def create_pdf(query, articles, cross_check_text=None, filename="report.pdf"):
 
         pdf.cell(0, 5, f"Источник: {domain}  | {short_url}", link=url, ln=True)
         pdf.ln(3)
-        rating = item.get('rating', '')
+        rating = item.get('rating') or ''
         pdf.set_font('DejaVu', 'B', 10)
         if "Высокое доверие" in rating:
             pdf.set_text_color(39, 174, 96); icon = "[+]" # Green Plus
@@ -137,13 +367,13 @@ def create_pdf(query, articles, cross_check_text=None, filename="report.pdf"):
 
         clean_rating = clean_text_for_pdf(rating.split('|')[0].strip())
         pdf.cell(0, 6, f"{icon} {clean_rating}", ln=True)
-        ai_text = item.get('ai_analysis', '')
+        ai_text = item.get('ai_analysis') or ''
         if ai_text and len(ai_text) > 10 and "Пропущено" not in ai_text:
             pdf.ln(2)
             pdf.set_font('DejaVu', '', 10)
             pdf.set_text_color(44, 62, 80)
             clean_ai = clean_text_for_pdf(clean_markdown(ai_text))
-            clean_ai = re.sub(r'SCORE:\s*\d+%?', '', clean_ai, flags=re.IGNORECASE).strip()
+            clean_ai = _SCORE_RE.sub('', clean_ai).strip()
             if len(clean_ai) > 600: clean_ai = clean_ai[:600] + "..."
             pdf.set_x(15)
             pdf.multi_cell(0, 5, clean_ai)
@@ -153,7 +383,28 @@ def create_pdf(query, articles, cross_check_text=None, filename="report.pdf"):
         pdf.line(10, pdf.get_y(), 200, pdf.get_y())
         pdf.ln(5)
 
+    return valid_count
+
+
+def create_pdf(query, articles, cross_check_text=None, filename="report.pdf"):
+    pdf = PDFReport()
+    _prepare(pdf)
+    _render_report(pdf, query, articles, cross_check_text)
+
     try:
         return pdf.output(dest='S').encode('latin-1')
     except AttributeError:
         return pdf.output()
+
+
+def create_pdf_stream(query, articles, stream, cross_check_text=None) -> int:
+    """
+    Пишет отчет в бинарный файловый объект постранично. articles может быть генератором
+    (например, DatabaseHandler.iter_articles), весь документ в памяти не собирается.
+    Возвращает количество статей в отчете.
+    """
+    pdf = StreamingPDFReport(stream)
+    _prepare(pdf)
+    count = _render_report(pdf, query, articles, cross_check_text)
+    pdf.close()
+    return count
@@ -0,0 +1,318 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from loguru import logger
+
+from config import (
+    TRUSTED_DOMAINS, FAKE_DOMAINS, PLATFORM_DOMAINS,
+    REPUTATION_DIR, REPUTATION_INDEX, REPUTATION_RELOAD_SECONDS
+)
+
+TRUSTED, PLATFORM, FAKE = 1, 2, 3
+# Имя файла списка -> категория: trusted_news.txt, fake_2025.txt, platforms.txt
+CATEGORY_PREFIXES = (("trusted", TRUSTED), ("fake", FAKE), ("propaganda", FAKE), ("platform", PLATFORM))
+CATEGORY_NAMES = {"trusted": TRUSTED, "fake": FAKE, "propaganda": FAKE, "platform": PLATFORM}
+
+MAGIC = b"GCSREP2\0"
+# magic, число слотов, число записей, смещение блока строк, отпечаток источников
+_HEADER = struct.Struct("<8sIIQQ")
+# хеш суффикса, смещение строки, категория (+3 байта выравнивания)
+_SLOT = struct.Struct("<QIB3x")
+_LENGTH = struct.Struct("<H")
+_HEADER_SIZE, _SLOT_SIZE = _HEADER.size, _SLOT.size
+# Хосты в выдаче сильно повторяются: готовые ответы держим в словаре до перезагрузки индекса
+HOST_CACHE_SIZE = 65536
+
+# Суффиксы, под которыми регистрируют чужие домены: правило на них задело бы
+# всех подряд. Полный список можно положить в REPUTATION_DIR/public_suffix_list.dat
+_DEFAULT_PUBLIC_SUFFIXES = {
+    "com", "net", "org", "info", "ru", "ua", "by", "kz", "uk", "de", "media", "io", "me",
+    "com.ua", "org.ua", "net.ua", "gov.ua", "in.ua", "kiev.ua", "co.uk", "org.uk", "com.ru", "msk.ru",
+}
+
+
+def _hash(suffix: bytes) -> int:
+    # 64 бита из двух быстрых контрольных сумм (hash() меняется между процессами).
+    # Коллизии все равно отсекаются сравнением строки. 0 — признак пустого слота
+    return (zlib.crc32(suffix) | zlib.adler32(suffix) << 32) or 1
+
+
+def normalize_domain(domain: str) -> str:
+    domain = domain.strip().lower().rstrip(".")
+    if domain.startswith("*."):
+        domain = domain[2:]
+    if domain.startswith("www."):
+        domain = domain[4:]
+    return domain
+
+
+def _source_files(source_dir: str) -> list[str]:
+    if not os.path.isdir(source_dir):
+        return []
+    return sorted(
+        os.path.join(source_dir, name) for name in os.listdir(source_dir)
+        if name.endswith((".txt", ".csv"))
+    )
+
+
+def sources_fingerprint(source_dir: str = REPUTATION_DIR) -> int:
+    """
+    Отпечаток того, что не видно по времени изменения файлов: доменов из
+    config.py и состава списков в source_dir (удаленный файл тоже меняет отпечаток).
+    """
+    digest = hashlib.sha1()
+    for domains, category in ((TRUSTED_DOMAINS, TRUSTED), (PLATFORM_DOMAINS, PLATFORM), (FAKE_DOMAINS, FAKE)):
+        for domain in sorted(domains):
+            digest.update(f"{category}:{domain}\n".encode("utf-8"))
+    for path in _source_files(source_dir):
+        digest.update(f"file:{os.path.basename(path)}\n".encode("utf-8"))
+    return int.from_bytes(digest.digest()[:8], "little")
+
+
+def _load_public_suffixes(source_dir: str) -> set[str]:
+    path = os.path.join(source_dir, "public_suffix_list.dat")
+    if not os.path.exists(path):
+        return _DEFAULT_PUBLIC_SUFFIXES
+    suffixes = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("//") and not line.startswith("!"):
+                suffixes.add(normalize_domain(line))
+    return suffixes
+
+
+def collect_entries(source_dir: str = REPUTATION_DIR) -> dict[str, int]:
+    """
+    Домены из config.py и из файлов source_dir. Строка файла — домен ("*.домен"
+    означает то же самое: правило всегда действует и на поддомены) и, через
+    запятую или таб, необязательная категория; иначе категория берется из имени
+    файла. При конфликте побеждает более строгая категория (fake > platform > trusted).
+    """
+    entries: dict[str, int] = {}
+
+    def add(domain: str, category: int):
+        domain = normalize_domain(domain)
+        if domain and category > entries.get(domain, 0):
+            entries[domain] = category
+
+    for domains, category in ((TRUSTED_DOMAINS, TRUSTED), (PLATFORM_DOMAINS, PLATFORM), (FAKE_DOMAINS, FAKE)):
+        for domain in domains:
+            add(domain, category)
+
+    public_suffixes = _load_public_suffixes(source_dir)
+    for path in _source_files(source_dir):
+        name = os.path.basename(path).lower()
+        default = next((cat for prefix, cat in CATEGORY_PREFIXES if name.startswith(prefix)), None)
+        skipped = 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if not line:
+                    continue
+                parts = [p.strip() for p in line.replace("\t", ",").split(",")]
+                category = CATEGORY_NAMES.get(parts[1].lower()) if len(parts) > 1 else default
+                if category is None or normalize_domain(parts[0]) in public_suffixes:
+                    skipped += 1
+                    continue
+                add(parts[0], category)
+        if skipped:
+            logger.warning(f"Репутация: в {name} пропущено строк без категории или на публичном суффиксе: {skipped}")
+    return entries
+
+
+def compile_index(entries: dict[str, int], fingerprint: int = 0) -> bytes:
+    """
+    Открытая адресация с линейным пробированием, заполнение не больше 50%.
+    Строки хранятся рядом, чтобы отсекать коллизии хешей; файл читается через
+    mmap без разбора, поэтому процессы бота делят одну копию в page cache.
+    """
+    n_slots = 16
+    while n_slots < len(entries) * 2:
+        n_slots *= 2
+    mask = n_slots - 1
+    slots = bytearray(n_slots * _SLOT.size)
+    strings = bytearray()
+    used = [False] * n_slots
+
+    for domain, category in entries.items():
+        encoded = domain.encode("utf-8")
+        h = _hash(encoded)
+        slot = h & mask
+        while used[slot]:
+            slot = (slot + 1) & mask
+        used[slot] = True
+        _SLOT.pack_into(slots, slot * _SLOT.size, h, len(strings), category)
+        strings += _LENGTH.pack(len(encoded)) + encoded
+
+    header = _HEADER.pack(MAGIC, n_slots, len(entries), _HEADER.size + len(slots), fingerprint)
+    return header + bytes(slots) + bytes(strings)
+
+
+def build_index(source_dir: str = REPUTATION_DIR, path: str = REPUTATION_INDEX) -> int:
+    """Собирает индекс в файл атомарно: читатели видят либо старую, либо новую версию целиком."""
+    entries = collect_entries(source_dir)
+    data = compile_index(entries, sources_fingerprint(source_dir))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    logger.info(f"Индекс репутации собран: {len(entries)} доменов, {len(data) / 1024 / 1024:.1f} МБ -> {path}")
+    return len(entries)
+
+
+class ReputationIndex:
+    """
+    Поиск категории домена за O(число меток): проверяются суффиксы хоста от
+    самого длинного (edition.bbc.com, bbc.com), побеждает самое точное правило.
+
+    Индекс перечитывается без перезапуска: раз в REPUTATION_RELOAD_SECONDS
+    проверяется время изменения файла индекса, а если списки в REPUTATION_DIR
+    новее индекса или изменились домены config.py и состав списков
+    (sources_fingerprint) — он пересобирается.
+    """
+    _instance = None
+
+    def __new__(cls, source_dir: str = REPUTATION_DIR, path: str = REPUTATION_INDEX):
+        if cls._instance is None:
+            cls._instance = super(ReputationIndex, cls).__new__(cls)
+            cls._instance._initialize(source_dir, path)
+        return cls._instance
+
+    def _initialize(self, source_dir: str, path: str):
+        self.source_dir = source_dir
+        self.path = path
+        self.lock = threading.Lock()
+        self.buffer = None
+        self.n_slots = 0
+        self.strings = 0
+        self.signature = None
+        self.cache: dict[str, int] = {}
+        self.next_check = 0.0
+        self._reload()
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def _stored_fingerprint(self) -> int | None:
+        try:
+            with open(self.path, "rb") as f:
+                header = f.read(_HEADER.size)
+        except FileNotFoundError:
+            return None
+        if len(header) < _HEADER.size:
+            return None
+        magic, _, _, _, fingerprint = _HEADER.unpack(header)
+        return fingerprint if magic == MAGIC else None
+
+    def _sources_changed(self) -> bool:
+        files = _source_files(self.source_dir)
+        signature = self._signature()
+        if signature is None:
+            # Без списков и без файла индекс собирается в памяти
+            return bool(files)
+        if self._stored_fingerprint() != sources_fingerprint(self.source_dir):
+            return True
+        return bool(files) and max(os.path.getmtime(p) for p in files) * 1e9 > signature[0]
+
+    def _reload(self):
+        if self._sources_changed():
+            build_index(self.source_dir, self.path)
+
+        signature = self._signature()
+        if self.buffer is not None and signature == self.signature:
+            return
+        if signature is None:
+            # Внешних списков нет: индекс только из config.py, в памяти
+            buffer = compile_index(collect_entries(self.source_dir), sources_fingerprint(self.source_dir))
+        else:
+            with open(self.path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, n_slots, n_entries, strings, _ = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            logger.error(f"Файл {self.path} не является индексом репутации, оставляю прежний.")
+            return
+        # Старый mmap не закрываем явно: его может дочитывать другой поток,
+        # он освободится сборщиком мусора
+        self.buffer, self.n_slots, self.strings, self.signature = buffer, n_slots, strings, signature
+        self.cache = {}
+        logger.info(f"Индекс репутации загружен: {n_entries} доменов")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        with self.lock:
+            if now < self.next_check:
+                return
+            self.next_check = now + REPUTATION_RELOAD_SECONDS
+            try:
+                self._reload()
+            except Exception as e:
+                logger.error(f"Не удалось перечитать индекс репутации: {e}")
+
+    def _find(self, suffix: bytes) -> int:
+        buffer, mask, strings = self.buffer, self.n_slots - 1, self.strings
+        h = _hash(suffix)
+        slot = h & mask
+        unpack_slot = _SLOT.unpack_from
+        while True:
+            slot_hash, offset, category = unpack_slot(buffer, _HEADER_SIZE + slot * _SLOT_SIZE)
+            if slot_hash == 0:
+                return 0
+            if slot_hash == h:
+                (length,) = _LENGTH.unpack_from(buffer, strings + offset)
+                start = strings + offset + _LENGTH.size
+                if buffer[start:start + length] == suffix:
+                    return category
+            slot = (slot + 1) & mask
+
+    def lookup(self, host: str | None) -> int:
+        """Категория хоста (TRUSTED / PLATFORM / FAKE) или 0, если домена нет в списках."""
+        if not host:
+            return 0
+        self._maybe_reload()
+        cache = self.cache
+        category = cache.get(host)
+        if category is not None:
+            return category
+
+        category = 0
+        labels = normalize_domain(host).split(".")
+        # Голый TLD не проверяем
+        for i in range(len(labels) - 1):
+            category = self._find(".".join(labels[i:]).encode("utf-8"))
+            if category:
+                break
+        if len(cache) >= HOST_CACHE_SIZE:
+            cache.clear()
+        cache[host] = category
+        return category
+
+
+if __name__ == "__main__":
+    import argparse
+    from logger_config import setup_logger
+
+    setup_logger()
+    arg_parser = argparse.ArgumentParser(description="Сборка и проверка индекса репутации доменов.")
+    arg_parser.add_argument('--source', default=REPUTATION_DIR, help="Папка со списками (*.txt, *.csv)")
+    arg_parser.add_argument('--out', default=REPUTATION_INDEX, help="Файл индекса")
+    arg_parser.add_argument('--check', nargs='*', metavar='HOST', help="Показать категории для хостов")
+    args = arg_parser.parse_args()
+
+    build_index(args.source, args.out)
+    if args.check:
+        index = ReputationIndex(args.source, args.out)
+        names = {TRUSTED: "trusted", PLATFORM: "platform", FAKE: "fake", 0: "—"}
+        for host in args.check:
+            print(f"{host}: {names[index.lookup(host)]}")
@@ -0,0 +1,166 @@
+import asyncio
+import datetime
+import httpx
+from loguru import logger
+
+from config import (
+    MONITOR_INTERVAL_MINUTES, MONITOR_WATCHLIST, MONITOR_TRENDS_LIMIT,
+    MONITOR_RESULTS_PER_TOPIC, MONITOR_RECHECK_HOURS
+)
+from database import DatabaseHandler
+from logger_config import setup_logger
+from monitor import MonitorEngine
+import page_parser
+from trends_client import TrendsClient
+
+HEAD_CONCURRENCY = 10
+
+
+class MonitorScheduler:
+    """
+    Фоновый мониторинг без UI: раз в interval минут берет тренды Google News и
+    темы из watchlist, ищет статьи и анализирует только новые или изменившиеся URL.
+    Результаты пишутся в DatabaseHandler и память, откуда их читают дашборд и бот.
+    """
+
+    def __init__(self, watchlist: list[str] | None = None, interval_minutes: int = MONITOR_INTERVAL_MINUTES,
+                 trends_limit: int = MONITOR_TRENDS_LIMIT, results_per_topic: int = MONITOR_RESULTS_PER_TOPIC):
+        self.watchlist = watchlist if watchlist is not None else MONITOR_WATCHLIST
+        self.interval = interval_minutes * 60
+        self.trends_limit = trends_limit
+        self.engine = MonitorEngine(num_results=results_per_topic, show_logs=True)
+        self.db = DatabaseHandler()
+        self.recheck_after = datetime.timedelta(hours=MONITOR_RECHECK_HOURS)
+
+    async def collect_topics(self) -> list[str]:
+        trends = []
+        if self.trends_limit:
+            trends = await TrendsClient().aget_top_trends(self.trends_limit)
+        return list(dict.fromkeys(trends + self.watchlist))
+
+    def _is_stale(self, state: dict) -> bool:
+        try:
+            checked = datetime.datetime.fromisoformat(state.get('last_checked') or "")
+        except ValueError:
+            return True
+        return datetime.datetime.now() - checked > self.recheck_after
+
+    async def _check_url(self, client: httpx.AsyncClient, url: str, state: dict | None,
+                         semaphore: asyncio.Semaphore) -> tuple[bool, dict]:
+        """Условный HEAD-запрос: (нужно ли анализировать, новое состояние для crawl_state)."""
+        headers = {}
+        if state and state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state and state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+
+        now = datetime.datetime.now().isoformat()
+        new_state = {
+            'url': url,
+            'etag': state.get('etag') if state else None,
+            'last_modified': state.get('last_modified') if state else None,
+            'last_checked': now,
+        }
+        async with semaphore:
+            try:
+                resp = await client.head(url, headers=headers, timeout=10)
+            except Exception as e:
+                logger.debug(f"HEAD не удался для {url}: {e}")
+                # Новую ссылку все равно пробуем, известную перепроверяем только по возрасту
+                return (state is None or self._is_stale(state)), new_state
+
+        if resp.status_code == 304:
+            return False, new_state
+
+        etag = resp.headers.get('etag')
+        last_modified = resp.headers.get('last-modified')
+        new_state['etag'] = etag
+        new_state['last_modified'] = last_modified
+        if state is None:
+            return True, new_state
+        if etag or last_modified:
+            return (etag, last_modified) != (state.get('etag'), state.get('last_modified')), new_state
+        # Сервер не отдает валидаторов: перепроверяем по возрасту
+        if self._is_stale(state):
+            return True, new_state
+        new_state['last_checked'] = state.get('last_checked')
+        return False, new_state
+
+    async def filter_new(self, links_by_topic: dict[str, list[str]]) -> tuple[dict[str, list[str]], list[dict]]:
+        """Оставляет только новые/изменившиеся URL. Состояния сохраняются после анализа."""
+        urls = list(dict.fromkeys(url for links in links_by_topic.values() for url in links))
+        states = await asyncio.to_thread(self.db.get_crawl_states, urls)
+
+        semaphore = asyncio.Semaphore(HEAD_CONCURRENCY)
+        async with httpx.AsyncClient(follow_redirects=True, verify=False) as client:
+            checks = await asyncio.gather(*[
+                self._check_url(client, url, states.get(url), semaphore) for url in urls
+            ])
+
+        changed = {url for url, (is_changed, _) in zip(urls, checks) if is_changed}
+        logger.info(f"Инкрементальный обход: {len(changed)} новых/измененных из {len(urls)} URL")
+        fresh = {topic: [url for url in links if url in changed] for topic, links in links_by_topic.items()}
+        return fresh, [state for _, state in checks]
+
+    async def run_once(self) -> list[dict]:
+        topics = await self.collect_topics()
+        if not topics:
+            logger.warning("Нет тем для мониторинга.")
+            return []
+        logger.info(f"Темы мониторинга: {topics}")
+
+        links_by_topic = await self.engine.search_topics(topics)
+        fresh, states = await self.filter_new(links_by_topic)
+        if not any(fresh.values()):
+            await asyncio.to_thread(self.db.save_crawl_states, states)
+            logger.info("Новых статей нет, анализ пропущен.")
+            return []
+
+        def on_progress(topic, done, total):
+            if total:
+                logger.info(f"[{topic}] {done}/{total}")
+
+        articles = await self.engine.process(fresh, on_progress)
+
+        # Неудачные загрузки не запоминаем, чтобы повторить их в следующем проходе
+        failed = {item['url'] for item in articles if not str(item.get('status', '')).startswith('Success')}
+        await asyncio.to_thread(self.db.save_crawl_states, [st for st in states if st['url'] not in failed])
+        logger.success(f"Мониторинг завершен: обработано {len(articles)} статей")
+        return articles
+
+    async def run_forever(self):
+        logger.info(f"Планировщик запущен, интервал {self.interval // 60} мин.")
+        while True:
+            started = asyncio.get_running_loop().time()
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка цикла мониторинга: {e}")
+            try:
+                # Старые месяцы памяти уплотняются между проходами, не чаще MEMORY_COMPACT_INTERVAL_HOURS
+                await asyncio.to_thread(page_parser.memory.maybe_compact)
+            except Exception as e:
+                logger.error(f"Ошибка уплотнения памяти: {e}")
+            elapsed = asyncio.get_running_loop().time() - started
+            await asyncio.sleep(max(0, self.interval - elapsed))
+
+
+def run_scheduler(once: bool = False):
+    scheduler = MonitorScheduler()
+    try:
+        if once:
+            asyncio.run(scheduler.run_once())
+        else:
+            asyncio.run(scheduler.run_forever())
+    except KeyboardInterrupt:
+        logger.info("Планировщик остановлен.")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    setup_logger()
+    arg_parser = argparse.ArgumentParser(description="Фоновый мониторинг трендов и watchlist.")
+    arg_parser.add_argument('--once', action='store_true', help="Выполнить один проход и выйти")
+    args = arg_parser.parse_args()
+    run_scheduler(once=args.once)
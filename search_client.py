@@ -1,7 +1,9 @@
 import requests
 import json
 from loguru import logger
+import telemetry
 import os
+from config import SEARCH_API_URL
 
 
 class SearchClient:
@@ -13,7 +15,7 @@ class SearchClient:
             logger.error("API_KEY или SEARCH_ENGINE_ID отсутствуют!")
             raise ValueError("Переменные среды не найдены")
 
-        self.url = "https://www.googleapis.com/customsearch/v1"
+        self.url = SEARCH_API_URL
 
     def search(self, query: str, num_results: int = 5, show_logs: bool = True):
         params = {
@@ -27,7 +29,10 @@ class SearchClient:
         response = None
 
         try:
-            response = requests.get(self.url, params=params)
+            with telemetry.span("search"):
+                response = requests.get(self.url, params=params)
+            if response.status_code == 429:
+                telemetry.incr("search_429")
             response.raise_for_status()
             data = response.json()
 
@@ -0,0 +1,192 @@
+import contextvars
+import statistics
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from loguru import logger
+
+METRIC_PREFIX = "gcs"
+# Границы гистограмм в секундах: от разбора HTML до долгих ответов Gemini
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+_trace_id: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="-")
+_run: contextvars.ContextVar["RunStats | None"] = contextvars.ContextVar("run_stats", default=None)
+
+
+class MetricsRegistry:
+    """Счетчики и гистограммы процесса в формате Prometheus (text exposition)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: dict[tuple, float] = {}
+        self.histograms: dict[str, dict] = {}
+
+    def incr(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            hist = self.histograms.get(stage)
+            if hist is None:
+                hist = self.histograms[stage] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist['buckets'][i] += 1
+            hist['sum'] += seconds
+            hist['count'] += 1
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = {stage: {**h, 'buckets': list(h['buckets'])} for stage, h in self.histograms.items()}
+
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{metric}{{{label_text}}} {value:g}" if label_text else f"{metric} {value:g}")
+
+        metric = f"{METRIC_PREFIX}_stage_seconds"
+        if histograms:
+            lines.append(f"# TYPE {metric} histogram")
+        for stage, hist in sorted(histograms.items()):
+            for bound, count in zip(BUCKETS, hist['buckets']):
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound:g}"}} {count}')
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {hist["count"]}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {hist["sum"]:.6f}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {hist["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class RunStats:
+    """Длительности этапов за один прогон CLI (для итоговой таблицы)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages: dict[str, list[float]] = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage: str, seconds: float):
+        with self.lock:
+            self.stages.setdefault(stage, []).append(seconds)
+
+    def summary(self) -> list[dict]:
+        rows = []
+        with self.lock:
+            stages = {stage: sorted(values) for stage, values in self.stages.items()}
+        for stage, values in stages.items():
+            rows.append({
+                'stage': stage,
+                'count': len(values),
+                'total': sum(values),
+                'p50': statistics.median(values),
+                'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+                'max': values[-1],
+            })
+        rows.sort(key=lambda row: -row['total'])
+        return rows
+
+
+def new_trace(prefix: str = "") -> str:
+    """Новый trace id для текущего контекста (задачи asyncio наследуют его)."""
+    trace_id = f"{prefix}{uuid.uuid4().hex[:8]}"
+    _trace_id.set(trace_id)
+    return trace_id
+
+
+def current_trace() -> str:
+    return _trace_id.get()
+
+
+def record(stage: str, seconds: float):
+    """Готовая длительность этапа, когда span неудобен (например, замер через несколько блоков)."""
+    registry.observe(stage, seconds)
+    run = _run.get()
+    if run is not None:
+        run.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str, **attrs):
+    """
+    Замер этапа: время идет в гистограмму gcs_stage_seconds{stage=...} и в
+    RunStats текущего прогона. Работает и вокруг await внутри корутин.
+    """
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        record(stage, elapsed)
+        extra = " ".join(f"{k}={v}" for k, v in attrs.items())
+        logger.debug(f"[{_trace_id.get()}] {stage} {elapsed * 1000:.0f}ms {status} {extra}".rstrip())
+
+
+def incr(name: str, value: float = 1, **labels):
+    registry.incr(name, value, **labels)
+
+
+def cache_hit(cache: str, hit: bool = True):
+    registry.incr("cache_hits" if hit else "cache_misses", cache=cache)
+
+
+@contextmanager
+def collect_run():
+    """Собирает длительности этапов всего, что выполняется внутри блока (включая asyncio.run)."""
+    run = RunStats()
+    token = _run.set(run)
+    try:
+        yield run
+    finally:
+        _run.reset(token)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_servers: dict[int, ThreadingHTTPServer] = {}
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> bool:
+    """/metrics в фоновом потоке. port=0 — выключено. Повторный вызов с тем же портом ничего не делает."""
+    if not port or port in _servers:
+        return bool(port)
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Не удалось открыть порт метрик {port}: {e}")
+        return False
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"metrics-{port}", daemon=True).start()
+    _servers[port] = server
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return True
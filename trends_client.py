@@ -1,38 +1,154 @@
+import asyncio
+import re
+import time
 import feedparser
+import httpx
 from loguru import logger
 
+import telemetry
+from config import TRENDS_FEEDS, TRENDS_TTL, TRENDS_CLUSTER_THRESHOLD
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Грубый стемминг: у русских/украинских слов отбрасываем окончание
+STEM_LENGTH = 5
+# Сводим украинское написание к русскому, чтобы одна новость из RU и UA лент совпадала
+_FOLD_TABLE = str.maketrans({'і': 'и', 'ї': 'и', 'є': 'е', 'ґ': 'г', 'ё': 'е', 'ь': None, 'ъ': None, "'": None})
+
+
+def clean_title(title: str) -> str:
+    """'Заголовок - Название издания' -> 'Заголовок' (тире внутри заголовка не трогаем)."""
+    return title.rsplit(" - ", 1)[0].strip()
+
+
+def title_tokens(title: str) -> frozenset:
+    words = _WORD_RE.findall(title.lower().translate(_FOLD_TABLE))
+    return frozenset(word[:STEM_LENGTH] for word in words if len(word) > 2)
+
+
+def _similarity(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def cluster_titles(titles: list[str], threshold: float = TRENDS_CLUSTER_THRESHOLD) -> list[list[str]]:
+    """
+    Жадная кластеризация заголовков по пересечению слов: одна и та же новость
+    из разных лент и изданий попадает в один кластер. Кластеры отсортированы
+    по размеру (сколько раз тема встретилась), при равенстве — по позиции в лентах.
+    """
+    clusters: list[tuple[frozenset, list[str]]] = []
+    for title in titles:
+        tokens = title_tokens(title)
+        best, best_score = None, threshold
+        for cluster in clusters:
+            score = _similarity(tokens, cluster[0])
+            if score >= best_score:
+                best, best_score = cluster, score
+        if best is None:
+            clusters.append((tokens, [title]))
+        else:
+            best[1].append(title)  # Дубли тоже считаем: они увеличивают вес темы
+    order = sorted(range(len(clusters)), key=lambda i: (-len(clusters[i][1]), i))
+    return [clusters[i][1] for i in order]
+
+
 class TrendsClient:
-    def __init__(self):
-        self.rss_url = "https://news.google.com/rss?hl=ru&gl=UA&ceid=UA:ru"
+    """
+    Главные темы из нескольких лент Google News. Ленты запрашиваются параллельно
+    с If-None-Match/If-Modified-Since, результат живет TRENDS_TTL секунд, так что
+    повторные нажатия "Картина дня" и проходы планировщика не ходят в сеть.
+    """
+    _instance = None
+
+    def __new__(cls, feeds: list[str] | None = None):
+        if cls._instance is None:
+            cls._instance = super(TrendsClient, cls).__new__(cls)
+            cls._instance._initialize(feeds or TRENDS_FEEDS)
+        return cls._instance
+
+    def _initialize(self, feeds: list[str]):
+        self.feeds = feeds
+        self.validators: dict[str, dict] = {}
+        self.entries: dict[str, list[str]] = {}
+        self.clusters: list[list[str]] = []
+        self.expires = 0.0
+        self.locks: dict = {}
+
+    def _lock(self) -> asyncio.Lock:
+        # asyncio.Lock привязан к event loop, а job_worker создает новый loop на каждую задачу
+        loop = asyncio.get_running_loop()
+        if loop not in self.locks:
+            self.locks = {loop: asyncio.Lock()}
+        return self.locks[loop]
 
-    def get_top_trends(self, limit=5):
-        logger.info(f"📰 Загружаю главные новости с Google News (UA/RU)...")
+    async def _fetch_feed(self, client: httpx.AsyncClient, url: str) -> list[str]:
+        headers = {}
+        validators = self.validators.get(url, {})
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
 
         try:
-            feed = feedparser.parse(self.rss_url)
+            resp = await client.get(url, headers=headers, timeout=10)
+        except httpx.HTTPError as e:
+            logger.warning(f"Лента недоступна ({url}): {e}")
+            return self.entries.get(url, [])
 
-            trends = []
-            if feed.entries:
-                for entry in feed.entries:
-                    clean_title = entry.title.split(" - ")[0]
+        if resp.status_code == 304:
+            return self.entries.get(url, [])
+        if resp.status_code != 200:
+            logger.warning(f"Лента {url} ответила {resp.status_code}")
+            return self.entries.get(url, [])
 
-                    if len(clean_title) > 10:
-                        trends.append(clean_title)
+        feed = feedparser.parse(resp.content)
+        titles = [clean_title(entry.title) for entry in feed.entries if entry.get('title')]
+        self.validators[url] = {
+            'etag': resp.headers.get('etag'),
+            'last_modified': resp.headers.get('last-modified'),
+        }
+        self.entries[url] = titles
+        return titles
 
-                    if len(trends) >= limit:
-                        break
+    async def refresh(self):
+        with telemetry.span("trends_fetch", feeds=len(self.feeds)):
+            async with httpx.AsyncClient(follow_redirects=True) as client:
+                results = await asyncio.gather(*[self._fetch_feed(client, url) for url in self.feeds])
 
-            if not trends:
-                logger.warning("RSS вернул пустой список.")
-                return ["Война в Украине", "Курс доллара", "Ситуация на фронте"] # Fallback темы
+        # Чередуем ленты, чтобы верх каждой ленты шел раньше хвоста любой из них
+        titles = []
+        for row in range(max((len(r) for r in results), default=0)):
+            titles.extend(r[row] for r in results if row < len(r) and len(r[row]) > 10)
 
-            logger.success(f"Найдено тем: {len(trends)}")
-            return trends
+        if titles:
+            self.clusters = cluster_titles(titles)
+            self.expires = time.monotonic() + TRENDS_TTL
+            logger.debug(f"Тренды: {len(titles)} заголовков из {len(self.feeds)} лент -> {len(self.clusters)} тем")
 
-        except Exception as e:
-            logger.error(f"Ошибка получения новостей: {e}")
+    async def aget_top_trends(self, limit=5) -> list[str]:
+        async with self._lock():
+            telemetry.cache_hit("trends", time.monotonic() < self.expires)
+            if time.monotonic() >= self.expires:
+                logger.info(f"📰 Загружаю главные новости с Google News ({len(self.feeds)} лент)...")
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    logger.error(f"Ошибка получения новостей: {e}")
+
+        if not self.clusters:
+            logger.warning("RSS вернул пустой список.")
             return []
 
+        trends = [cluster[0] for cluster in self.clusters[:limit]]
+        logger.success(f"Найдено тем: {len(trends)}")
+        return trends
+
+    def get_top_trends(self, limit=5) -> list[str]:
+        """Синхронный вариант для кода вне event loop."""
+        return asyncio.run(self.aget_top_trends(limit))
+
+
 # if __name__ == "__main__":
 #     client = TrendsClient()
 #     top_news = client.get_top_trends(limit=5)
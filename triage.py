@@ -0,0 +1,366 @@
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+from loguru import logger
+
+from clickbait import ClickbaitMatcher
+from config import TRIAGE_MODE, TRIAGE_THRESHOLD, TRIAGE_MODEL_PATH
+
+# Ключи образцов в ai_cache: признаки статьи и ответ Gemini, собранные при прогонах
+SAMPLE_KIND = "triage"
+# Признаки, которые встретились реже, отбрасываются при обучении
+MIN_FEATURE_COUNT = 3
+EPOCHS = 15
+# Образцов с признаками текста, после которых оценка модели отражает живую работу
+# и можно включать TRIAGE_MODE=on; до этого — только shadow
+MIN_TEXT_SAMPLES = 300
+LEARNING_RATE = 0.1
+L2 = 1e-4
+# Шинглы недавних текстов для поиска дублей агрегаторов (в пределах процесса)
+SHINGLE_SIZE = 8
+SEEN_TEXTS = 2000
+MODEL_CHECK_SECONDS = 30
+
+_WORD_RE = re.compile(r"\w+")
+_TIME_LINE_RE = re.compile(r"^\s*\d{1,2}:\d{2}\b", re.MULTILINE)
+_SCORE_RE = re.compile(r"(\d{1,3})%")
+_RATINGS = (("Высокое доверие", "trusted"), ("Пропаганда", "fake"), ("Низкое доверие", "fake"), ("Платформа", "platform"))
+
+# Заглушки вместо статьи: по нескольку фраз на вид (RU/UA/EN)
+STUB_MARKERS = {
+    'cookie': ("cookie", "куки", "файлы cookie", "файли cookie", "принять все", "accept all", "privacy settings"),
+    'paywall': ("подпишитесь", "оформите подписку", "оформить подписку", "передплат", "subscribe to",
+                "subscribers only", "доступно только", "premium"),
+    'live': ("онлайн-трансляция", "текстовая трансляция", "в режиме реального времени", "наживо",
+             "live updates", "следите за обновлениями", "обновляется"),
+    'aggregator': ("читайте также", "читайте далее", "читати також", "другие новости", "read more",
+                   "источник:", "джерело:", "полный текст"),
+}
+# Gemini прямо говорит, что анализировать было нечего. Только фразы о самой
+# странице: анализ новости про подписки или cookie не должен становиться отрицательным примером
+NOT_ARTICLE_MARKERS = (
+    "не является новост", "не содержит новост", "недостаточно информации", "недостаточно данных",
+    "невозможно оценить", "невозможно провести", "нет содержательн", "отсутствует текст",
+    "содержит только уведомлени", "содержит только баннер", "содержит только предложение подписк",
+    "вместо текста", "вместо статьи", "текст статьи недоступен", "текст статьи скрыт",
+    "страница-заглушка", "является заглушкой",
+)
+
+
+def label_from_analysis(ai_text: str | None) -> int | None:
+    """
+    1 — Gemini дал содержательную оценку, 0 — анализ был пустой тратой запроса
+    (нет SCORE или ответ о том, что текста статьи нет). None — Gemini не вызывался
+    или вернул ошибку: такие ответы ничего не говорят о самой статье.
+    """
+    if not ai_text or ai_text.startswith(("Пропущено", "Текст слишком", "Ошибка AI")):
+        return None
+    lowered = ai_text[:1500].lower()
+    if not _SCORE_RE.search(lowered) or any(m in lowered for m in NOT_ARTICLE_MARKERS):
+        return 0
+    return 1
+
+
+def _bucket(value: float) -> int:
+    return min(int(math.log2(value + 1)), 16)
+
+
+def extract_features(url: str, title: str | None, rating: str | None, text: str | None = None,
+                     duplicate: float | None = None) -> dict[str, float]:
+    """
+    Признаки статьи: домен и его рейтинг, слова пути URL и заголовка, кликбейт
+    заголовка, а если есть текст — длина, маркеры заглушек (cookie, пейвол,
+    лента, агрегатор) и доля уже виденных шинглов. У архивных статей текста нет,
+    поэтому модель обучается на обоих наборах и обходится без текстовых признаков.
+    """
+    features: dict[str, float] = {}
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").removeprefix("www.")
+    features[f"domain={host}"] = 1.0
+    category = next((name for plain, name in _RATINGS if plain in (rating or "")), "unknown")
+    features[f"rating={category}"] = 1.0
+    for token in _WORD_RE.findall(parsed.path.lower()):
+        if not token.isdigit() and len(token) > 2:
+            features[f"path:{token}"] = 1.0
+
+    title = title or ""
+    for token in _WORD_RE.findall(title.lower()):
+        if len(token) > 2:
+            features[f"title:{token}"] = 1.0
+    features[f"title_len={_bucket(len(title))}"] = 1.0
+    features[f"clickbait={ClickbaitMatcher().score(title)['score'] // 25}"] = 1.0
+
+    if text is not None:
+        words = len(_WORD_RE.findall(text))
+        features[f"chars={_bucket(len(text))}"] = 1.0
+        features[f"words={_bucket(words)}"] = 1.0
+        lowered = text[:5000].lower()
+        for name, phrases in STUB_MARKERS.items():
+            hits = sum(lowered.count(p) for p in phrases)
+            if hits:
+                features[f"marker:{name}"] = math.log1p(hits)
+        time_lines = len(_TIME_LINE_RE.findall(text))
+        if time_lines:
+            features["time_lines"] = math.log1p(time_lines)
+        if duplicate is not None:
+            features[f"duplicate={int(duplicate * 4)}"] = 1.0
+    return features
+
+
+def _sigmoid(x: float) -> float:
+    if x < -30:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+class TriageModel:
+    """Логистическая регрессия на разреженных именованных признаках (веса в JSON)."""
+
+    def __init__(self, weights: dict[str, float] | None = None, bias: float = 0.0, meta: dict | None = None):
+        self.weights = weights or {}
+        self.bias = bias
+        self.meta = meta or {}
+
+    def predict(self, features: dict[str, float]) -> float:
+        weights = self.weights
+        return _sigmoid(self.bias + sum(weights.get(name, 0.0) * value for name, value in features.items()))
+
+    def fit(self, samples: list[tuple[dict[str, float], int]], seed: int = 1):
+        """SGD с L2 по перемешанным образцам; классы уравниваются весами."""
+        counts: dict[str, int] = {}
+        for features, _ in samples:
+            for name in features:
+                counts[name] = counts.get(name, 0) + 1
+        kept = {name for name, count in counts.items() if count >= MIN_FEATURE_COUNT}
+        samples = [({n: v for n, v in f.items() if n in kept}, y) for f, y in samples]
+
+        positives = sum(y for _, y in samples) or 1
+        negatives = (len(samples) - positives) or 1
+        class_weight = {1: len(samples) / (2 * positives), 0: len(samples) / (2 * negatives)}
+
+        rng = random.Random(seed)
+        weights = dict.fromkeys(kept, 0.0)
+        bias = 0.0
+        for epoch in range(EPOCHS):
+            rng.shuffle(samples)
+            rate = LEARNING_RATE / (1 + epoch)
+            for features, y in samples:
+                p = _sigmoid(bias + sum(weights[n] * v for n, v in features.items()))
+                grad = (p - y) * class_weight[y]
+                bias -= rate * grad
+                for name, value in features.items():
+                    weights[name] -= rate * (grad * value + L2 * weights[name])
+        self.weights = {n: round(w, 5) for n, w in weights.items() if abs(w) > 1e-4}
+        self.bias = bias
+
+    def save(self, path: str):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({'bias': self.bias, 'weights': self.weights, 'meta': self.meta}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "TriageModel":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data['weights'], data['bias'], data.get('meta'))
+
+
+class Triage:
+    """
+    Решает до запроса к Gemini, стоит ли статья полного анализа. Модель читается
+    из TRIAGE_MODEL_PATH и перечитывается, если файл обновили (python triage.py --train).
+    Без файла модели триаж ничего не отсекает.
+    """
+    _instance = None
+
+    def __new__(cls, path: str = TRIAGE_MODEL_PATH):
+        if cls._instance is None:
+            cls._instance = super(Triage, cls).__new__(cls)
+            cls._instance._initialize(path)
+        return cls._instance
+
+    def _initialize(self, path: str):
+        self.path = path
+        self.mode = TRIAGE_MODE
+        self.threshold = TRIAGE_THRESHOLD
+        self.lock = threading.Lock()
+        self.model = None
+        self.mtime = None
+        self.next_check = 0.0
+        # хеш шингла -> None, самые старые тексты вытесняются первыми
+        self.seen: OrderedDict[int, None] = OrderedDict()
+        self.seen_sizes: list[int] = []
+        self._maybe_reload()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("shadow", "on")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        self.next_check = now + MODEL_CHECK_SECONDS
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            if self.model is None and self.enabled:
+                logger.warning(f"Триаж: нет модели {self.path}, все статьи идут в AI (обучение: python triage.py --train)")
+            return
+        if mtime == self.mtime:
+            return
+        try:
+            self.model, self.mtime = TriageModel.load(self.path), mtime
+            logger.info(f"Триаж: модель загружена ({len(self.model.weights)} признаков, режим {self.mode})")
+            if self.mode == "on" and not self.model.meta.get('ready_for_on'):
+                logger.warning(
+                    f"Триаж: модель обучена на {self.model.meta.get('text_samples', 0)} образцах с текстом "
+                    f"(нужно {MIN_TEXT_SAMPLES}), ее оценка не отражает живую работу — лучше TRIAGE_MODE=shadow"
+                )
+        except Exception as e:
+            logger.error(f"Триаж: не удалось прочитать модель {self.path}: {e}")
+
+    def duplicate_share(self, text: str) -> float:
+        """Доля шинглов текста, уже встречавшихся в недавних статьях, и запоминание текста."""
+        words = _WORD_RE.findall(text[:20000].lower())
+        shingles = {hash(" ".join(words[i:i + SHINGLE_SIZE])) for i in range(0, max(len(words) - SHINGLE_SIZE, 1), 2)}
+        if not shingles:
+            return 0.0
+        with self.lock:
+            seen = self.seen
+            share = sum(1 for s in shingles if s in seen) / len(shingles)
+            for s in shingles:
+                seen[s] = None
+            self.seen_sizes.append(len(shingles))
+            while len(self.seen_sizes) > SEEN_TEXTS:
+                for _ in range(self.seen_sizes.pop(0)):
+                    if seen:
+                        seen.popitem(last=False)
+        return share
+
+    def features(self, url: str, title: str | None, rating: str | None, text: str) -> dict[str, float]:
+        return extract_features(url, title, rating, text, self.duplicate_share(text))
+
+    def predict(self, features: dict[str, float]) -> float | None:
+        """Вероятность того, что полный анализ даст результат; None, если модели нет."""
+        self._maybe_reload()
+        if self.model is None:
+            return None
+        return self.model.predict(features)
+
+    def should_skip(self, probability: float | None) -> bool:
+        return self.mode == "on" and probability is not None and probability < self.threshold
+
+
+def load_samples(db) -> list[tuple[dict[str, float], int]]:
+    """
+    Образцы для обучения: архив articles (рейтинг домена, заголовок и ответ Gemini,
+    без текста) и образцы с полными признаками, которые fetch_and_parse_url
+    кладет в ai_cache при каждом вызове Gemini. Для одного URL берется второй вариант.
+    """
+    samples: dict[str, tuple[dict[str, float], int]] = {}
+    for chunk in db.iter_articles():
+        for row in chunk:
+            label = label_from_analysis(row.get('ai_analysis'))
+            if label is not None:
+                samples[row['url']] = (extract_features(row['url'], row.get('title'), row.get('rating')), label)
+    with_text = 0
+    for chunk in db.iter_ai_cache(SAMPLE_KIND):
+        for key, value in chunk:
+            data = json.loads(value)
+            samples[key.removeprefix(f"{SAMPLE_KIND}:")] = (data['features'], data['label'])
+            with_text += 1
+    logger.info(f"Триаж: образцов {len(samples)}, из них с признаками текста {with_text}")
+    return list(samples.values())
+
+
+def has_text(features: dict[str, float]) -> bool:
+    """Образец собран на живом прогоне (с текстом), а не из архива articles."""
+    return any(name.startswith("chars=") for name in features)
+
+
+def evaluate(model: TriageModel, samples: list[tuple[dict[str, float], int]], threshold: float) -> dict:
+    """Что было бы при пороге threshold: сколько вызовов сэкономлено и сколько полезных потеряно."""
+    skipped = lost = agree = 0
+    for features, y in samples:
+        skip = model.predict(features) < threshold
+        skipped += skip
+        lost += skip and y == 1
+        agree += skip == (y == 0)
+    useful = sum(y for _, y in samples) or 1
+    total = len(samples) or 1
+    return {
+        'samples': len(samples),
+        'agreement': round(agree / total, 3),
+        'skipped_share': round(skipped / total, 3),
+        'lost_useful_share': round(lost / useful, 3),
+    }
+
+
+def train(db, path: str = TRIAGE_MODEL_PATH, holdout: float = 0.2) -> TriageModel:
+    """
+    Обучение на всех образцах. Живые прогнозы всегда видят признаки текста, а
+    архивные образцы их не имеют, поэтому отложенная часть для оценки ('holdout')
+    берется только из образцов с текстом; архив оценивается отдельно.
+    """
+    samples = load_samples(db)
+    if len(samples) < 50:
+        raise ValueError(f"Слишком мало образцов для обучения: {len(samples)}")
+    rng = random.Random(0)
+    rng.shuffle(samples)
+    with_text = [sample for sample in samples if has_text(sample[0])]
+    archive = [sample for sample in samples if not has_text(sample[0])]
+    text_cut = int(len(with_text) * (1 - holdout))
+    archive_cut = int(len(archive) * (1 - holdout))
+    model = TriageModel()
+    model.fit(with_text[:text_cut] + archive[:archive_cut])
+    thresholds = (0.2, 0.3, 0.4, 0.5)
+    model.meta = {
+        'trained_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'text_samples': len(with_text),
+        'ready_for_on': len(with_text) >= MIN_TEXT_SAMPLES,
+        'holdout': {str(t): evaluate(model, with_text[text_cut:], t) for t in thresholds},
+        'holdout_archive': {str(t): evaluate(model, archive[archive_cut:], t) for t in thresholds},
+    }
+    if not model.meta['ready_for_on']:
+        logger.warning(
+            f"Триаж: образцов с текстом {len(with_text)} из нужных {MIN_TEXT_SAMPLES}. Оценка на них "
+            f"еще неустойчива: оставьте TRIAGE_MODE=shadow, пока они копятся"
+        )
+    # Итоговая модель — на всех образцах, оценка выше — честная, на отложенной части
+    model.fit(samples)
+    model.save(path)
+    logger.info(f"Триаж: модель сохранена в {path} ({len(model.weights)} признаков)")
+    return model
+
+
+if __name__ == "__main__":
+    import argparse
+    from logger_config import setup_logger
+    from database import DatabaseHandler
+
+    setup_logger()
+    arg_parser = argparse.ArgumentParser(description="Обучение и проверка локального триажа перед Gemini.")
+    arg_parser.add_argument('--train', action='store_true', help="Обучить модель на data.db")
+    arg_parser.add_argument('--model', default=TRIAGE_MODEL_PATH, help="Файл модели")
+    arg_parser.add_argument('--threshold', type=float, default=TRIAGE_THRESHOLD, help="Порог для оценки")
+    args = arg_parser.parse_args()
+
+    db = DatabaseHandler()
+    if args.train:
+        trained = train(db, args.model)
+        print(f"Образцов с текстом: {trained.meta['text_samples']} (для TRIAGE_MODE=on нужно {MIN_TEXT_SAMPLES})")
+        for threshold, stats in trained.meta['holdout'].items():
+            print(f"порог {threshold}: с текстом {stats}, архив {trained.meta['holdout_archive'][threshold]}")
+    else:
+        samples = load_samples(db)
+        model = TriageModel.load(args.model)
+        print("с текстом:", evaluate(model, [s for s in samples if has_text(s[0])], args.threshold))
+        print("архив:", evaluate(model, [s for s in samples if not has_text(s[0])], args.threshold))
@@ -0,0 +1,295 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import numpy as np
+from filelock import FileLock
+from loguru import logger
+
+from config import MEMORY_STORE_PATH, MEMORY_STORE_DTYPE
+
+MAGIC = b"GCSVEC1\0"
+# magic, размерность, байт на число, зафиксировано строк, зафиксировано байт records.jsonl
+_HEADER = struct.Struct("<8sIIQQ")
+HEADER_SIZE = 64
+DTYPES = {"float16": np.float16, "float32": np.float32}
+# Полный перебор идет блоками, чтобы float16 не разворачивался в float32 целиком
+SCAN_BLOCK_ROWS = 65536
+HNSW_EF = 128
+
+
+class MmapVectorStore:
+    """
+    Хранилище векторов памяти в папке path, без сервера и без Chroma:
+
+    - vectors.bin — заголовок и матрица нормированных векторов float16/float32,
+      строки только дописываются;
+    - records.jsonl — строка на вектор: id, документ, метаданные;
+    - hnsw.bin — необязательный граф HNSW (hnswlib) по первым N строкам.
+
+    Читать могут сколько угодно процессов (бот, Streamlit, CLI): файл открывается
+    через mmap, новые строки подхватываются по счетчику в заголовке. Пишет один
+    процесс за раз под файловой блокировкой; счетчик обновляется последним, поэтому
+    читатели не видят недописанных строк. Повторный upsert того же id дописывает
+    новую строку, старая перестает участвовать в поиске.
+
+    Интерфейс — подмножество коллекции Chroma (count, upsert, query, get), чтобы
+    MemoryHandler работал с любым из них.
+    """
+
+    def __init__(self, path: str = MEMORY_STORE_PATH, dim: int | None = None, dtype: str = MEMORY_STORE_DTYPE):
+        self.path = path
+        self.vectors_path = os.path.join(path, "vectors.bin")
+        self.records_path = os.path.join(path, "records.jsonl")
+        self.hnsw_path = os.path.join(path, "hnsw.bin")
+        self.write_lock = FileLock(os.path.join(path, "write.lock"))
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        if not os.path.exists(self.vectors_path):
+            if dim is None:
+                raise ValueError(f"{self.vectors_path} не существует: для нового хранилища нужна размерность")
+            with self.write_lock:
+                if not os.path.exists(self.vectors_path):
+                    self._write_header(dim, np.dtype(DTYPES[dtype]).itemsize, 0, 0, create=True)
+
+        # Без буфера: заголовок перечитывается при каждом обращении и меняется другими процессами
+        self.file = open(self.vectors_path, "rb", buffering=0)
+        magic, self.dim, itemsize, _, _ = _HEADER.unpack(self.file.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{self.vectors_path} не является хранилищем векторов")
+        self.dtype = np.float16 if itemsize == 2 else np.float32
+        self.row_bytes = self.dim * itemsize
+
+        self.buffer = None
+        self.matrix = np.zeros((0, self.dim), dtype=self.dtype)
+        self.ids: list[str] = []
+        self.documents: list[str] = []
+        self.metadatas: list[dict] = []
+        self.latest: dict[str, int] = {}
+        self.alive = np.zeros(0, dtype=bool)
+        self.records_read = 0
+        self.hnsw = None
+        self.hnsw_rows = 0
+        self.hnsw_mtime = None
+        self.refresh()
+
+    def _write_header(self, dim: int, itemsize: int, count: int, records_size: int, create: bool = False):
+        header = _HEADER.pack(MAGIC, dim, itemsize, count, records_size).ljust(HEADER_SIZE, b"\0")
+        with open(self.vectors_path, "wb" if create else "r+b") as f:
+            f.write(header)
+
+    def _read_header(self) -> tuple[int, int]:
+        self.file.seek(0)
+        _, _, _, count, records_size = _HEADER.unpack(self.file.read(_HEADER.size))
+        return count, records_size
+
+    def refresh(self):
+        """Подхватывает строки, дописанные другими процессами, и перестроенный граф HNSW."""
+        with self.lock:
+            count, records_size = self._read_header()
+            if count > len(self.ids):
+                self._load_records(records_size)
+                # mmap фиксированного размера: после дозаписи отображаем файл заново
+                self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.matrix = np.frombuffer(
+                    self.buffer, dtype=self.dtype, count=count * self.dim, offset=HEADER_SIZE
+                ).reshape(count, self.dim)
+            self._maybe_load_hnsw()
+
+    def _load_records(self, records_size: int):
+        with open(self.records_path, "rb") as f:
+            f.seek(self.records_read)
+            data = f.read(records_size - self.records_read)
+        replaced = []
+        for line in data.splitlines():
+            record = json.loads(line)
+            previous = self.latest.get(record['id'])
+            if previous is not None:
+                replaced.append(previous)
+            self.latest[record['id']] = len(self.ids)
+            self.ids.append(record['id'])
+            self.documents.append(record.get('document') or "")
+            self.metadatas.append(record.get('metadata') or {})
+        alive = np.ones(len(self.ids), dtype=bool)
+        alive[:len(self.alive)] = self.alive
+        alive[replaced] = False
+        self.alive = alive
+        self.records_read = records_size
+
+    def _maybe_load_hnsw(self):
+        try:
+            mtime = os.path.getmtime(self.hnsw_path)
+        except OSError:
+            self.hnsw = None
+            return
+        if mtime == self.hnsw_mtime:
+            return
+        try:
+            import hnswlib
+        except ImportError:
+            logger.warning("hnswlib не установлен: поиск в памяти идет полным перебором.")
+            self.hnsw_mtime = mtime
+            return
+        index = hnswlib.Index(space="ip", dim=self.dim)
+        index.load_index(self.hnsw_path)
+        index.set_ef(HNSW_EF)
+        # Граф строится по строкам 0..N-1, поэтому число элементов — это граница хвоста
+        self.hnsw, self.hnsw_rows, self.hnsw_mtime = index, index.get_current_count(), mtime
+        logger.info(f"Граф HNSW памяти загружен: {self.hnsw_rows} векторов")
+
+    def count(self) -> int:
+        self.refresh()
+        return len(self.latest)
+
+    def upsert(self, ids: list[str], embeddings, documents: list[str] | None = None, metadatas: list[dict] | None = None):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"Ожидались векторы размерности {self.dim}, получено {vectors.shape}")
+        # Храним нормированные векторы: поиск идет по косинусу, а float16 так точнее
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        documents = documents or [""] * len(ids)
+        metadatas = metadatas or [{}] * len(ids)
+        lines = b"".join(
+            json.dumps({'id': i, 'document': d, 'metadata': m}, ensure_ascii=False).encode("utf-8") + b"\n"
+            for i, d, m in zip(ids, documents, metadatas)
+        )
+        with self.write_lock:
+            count, records_size = self._read_header()
+            # Хвосты после упавшей записи отрезаются: зафиксировано только то, что в заголовке.
+            # Без нужды не обрезаем: на Windows нельзя менять размер файла, открытого через mmap
+            with open(self.records_path, "ab") as f:
+                if f.tell() != records_size:
+                    f.truncate(records_size)
+                f.write(lines)
+            with open(self.vectors_path, "r+b") as f:
+                if f.seek(0, os.SEEK_END) != HEADER_SIZE + count * self.row_bytes:
+                    f.truncate(HEADER_SIZE + count * self.row_bytes)
+                    f.seek(0, os.SEEK_END)
+                f.write(vectors.astype(self.dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self._write_header(self.dim, self.row_bytes // self.dim, count + len(ids), records_size + len(lines))
+        self.refresh()
+
+    def _scan(self, queries: np.ndarray, start: int, stop: int, k: int) -> list[list[tuple[float, int]]]:
+        """Полный перебор строк [start, stop): лучшие k живых строк на каждый запрос."""
+        best = [[] for _ in range(len(queries))]
+        for block in range(start, stop, SCAN_BLOCK_ROWS):
+            end = min(block + SCAN_BLOCK_ROWS, stop)
+            # float32 читается прямо из mmap без копии, float16 разворачивается по блоку
+            scores = queries @ np.asarray(self.matrix[block:end], dtype=np.float32).T
+            scores[:, ~self.alive[block:end]] = -np.inf
+            take = min(k, end - block)
+            top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            for q, rows in enumerate(top):
+                best[q].extend((float(scores[q, r]), block + int(r)) for r in rows if scores[q, r] > -np.inf)
+        return [sorted(hits, reverse=True)[:k] for hits in best]
+
+    def _search(self, queries: np.ndarray, k: int) -> list[list[tuple[float, int]]]:
+        total = len(self.ids)
+        if self.hnsw is None or self.hnsw_rows == 0:
+            return self._scan(queries, 0, total, k)
+        # Граф покрывает первые hnsw_rows строк, свежий хвост ищем перебором.
+        # Берем с запасом: часть найденных строк могла устареть после upsert.
+        # Граф мог собрать другой процесс уже по строкам, которых здесь еще нет:
+        # такие метки отбрасываем, их подхватит следующий refresh
+        covered = min(self.hnsw_rows, total)
+        fetch = min(self.hnsw_rows, k * 2 + 10)
+        labels, distances = self.hnsw.knn_query(queries, k=fetch)
+        tail = self._scan(queries, covered, total, k) if total > covered else [[] for _ in queries]
+        results = []
+        for q in range(len(queries)):
+            hits = [
+                (1.0 - float(d), int(r)) for r, d in zip(labels[q], distances[q])
+                if r < total and self.alive[r]
+            ]
+            results.append(sorted(hits + tail[q], reverse=True)[:k])
+        return results
+
+    def query(self, query_embeddings, n_results: int = 10, include=None) -> dict:
+        """Как Collection.query в Chroma: списки на каждый запрос, distances — квадрат L2 нормированных векторов."""
+        self.refresh()
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+        with self.lock:
+            found = self._search(queries, n_results) if len(self.ids) else [[] for _ in queries]
+            return {
+                'ids': [[self.ids[r] for _, r in hits] for hits in found],
+                'documents': [[self.documents[r] for _, r in hits] for hits in found],
+                'metadatas': [[self.metadatas[r] for _, r in hits] for hits in found],
+                'embeddings': [[self.matrix[r].astype(np.float32) for _, r in hits] for hits in found],
+                'distances': [[2 - 2 * score for score, _ in hits] for hits in found],
+            }
+
+    def get(self, include=None, limit: int | None = None, offset: int = 0) -> dict:
+        """Живые записи по порядку добавления, порциями как Collection.get (для миграции и уплотнения)."""
+        self.refresh()
+        with self.lock:
+            rows = sorted(self.latest.values())
+            rows = rows[offset:offset + limit] if limit is not None else rows[offset:]
+            return {
+                'ids': [self.ids[r] for r in rows],
+                'documents': [self.documents[r] for r in rows],
+                'metadatas': [self.metadatas[r] for r in rows],
+                'embeddings': self.matrix[rows].astype(np.float32) if rows else np.zeros((0, self.dim), np.float32),
+            }
+
+    def build_hnsw(self, m: int = 16, ef_construction: int = 200) -> int:
+        """Строит граф HNSW по всем строкам (включая устаревшие, они отсеиваются при поиске)."""
+        import hnswlib
+
+        self.refresh()
+        rows = len(self.ids)
+        index = hnswlib.Index(space="ip", dim=self.dim)
+        index.init_index(max_elements=max(rows, 1), M=m, ef_construction=ef_construction)
+        if rows:
+            index.add_items(self.matrix.astype(np.float32), np.arange(rows))
+        tmp_path = f"{self.hnsw_path}.{os.getpid()}.tmp"
+        index.save_index(tmp_path)
+        os.replace(tmp_path, self.hnsw_path)
+        logger.info(f"Граф HNSW построен: {rows} векторов -> {self.hnsw_path}")
+        return rows
+
+
+def migrate_from_chroma(chroma_path: str = "chroma_db", out: str = MEMORY_STORE_PATH,
+                        dtype: str = MEMORY_STORE_DTYPE, collection: str = "news_knowledge",
+                        batch: int = 1000) -> int:
+    """Переносит коллекцию Chroma в MmapVectorStore порциями по batch записей."""
+    import chromadb
+
+    source = chromadb.PersistentClient(path=chroma_path).get_collection(name=collection)
+    total = source.count()
+    store = None
+    moved = 0
+    for offset in range(0, total, batch):
+        page = source.get(include=["embeddings", "documents", "metadatas"], limit=batch, offset=offset)
+        if not page['ids']:
+            break
+        embeddings = np.asarray(page['embeddings'], dtype=np.float32)
+        if store is None:
+            store = MmapVectorStore(out, dim=embeddings.shape[1], dtype=dtype)
+        store.upsert(page['ids'], embeddings, page['documents'], page['metadatas'])
+        moved += len(page['ids'])
+        logger.info(f"Миграция памяти: {moved}/{total}")
+    return moved
+
+
+if __name__ == "__main__":
+    import argparse
+    from logger_config import setup_logger
+
+    setup_logger()
+    arg_parser = argparse.ArgumentParser(description="Хранилище векторов памяти на mmap: миграция из Chroma и граф HNSW.")
+    arg_parser.add_argument('--migrate', metavar='CHROMA_PATH', help="Перенести коллекцию из папки Chroma")
+    arg_parser.add_argument('--out', default=MEMORY_STORE_PATH, help="Папка хранилища")
+    arg_parser.add_argument('--dtype', default=MEMORY_STORE_DTYPE, choices=sorted(DTYPES))
+    arg_parser.add_argument('--hnsw', action='store_true', help="Построить граф HNSW (нужен hnswlib)")
+    args = arg_parser.parse_args()
+
+    if args.migrate:
+        migrate_from_chroma(args.migrate, args.out, args.dtype)
+    if args.hnsw:
+        MmapVectorStore(args.out).build_hnsw()
@@ -1,14 +1,16 @@
 import streamlit as st
 import asyncio
+import atexit
 import pandas as pd
 import page_parser as parser
-from search_client import SearchClient
-from config import API_KEY, SEARCH_ENGINE_ID
+from config import JOB_POLL_SECONDS, WEB_METRICS_PORT, JOB_WORKERS, JOB_WORKERS_EXTERNAL
 from database import DatabaseHandler
 import plotly.express as px
-from report_generator import create_pdf
+from render_service import ReportRenderer
 import digest_generator  # Убедитесь, что этот файл создан рядом
-from trends_client import TrendsClient
+from job_queue import JobQueue, start_worker_processes
+from dashboard_data import VersionedCache, load_history, rating_counts, date_counts
+import telemetry
 
 st.set_page_config(
     page_title="AI News Analyzer",
@@ -29,93 +31,117 @@ def color_rating(val):
 
 db = DatabaseHandler()
 
-async def run_search_process(query, num_results):
-    st.session_state.is_running = True
-    st.session_state.report_data = None
-
-    if 'last_cross_check' in st.session_state:
-        del st.session_state['last_cross_check']
-    if 'last_digest' in st.session_state:
-        del st.session_state['last_digest']
-
-    status_placeholder = st.empty()
-    status_placeholder.info(f"🔎 Ищу {num_results} результатов для: **{query}**...")
-
-    try:
-        client = SearchClient(API_KEY, SEARCH_ENGINE_ID)
-        results_data = client.search(query, num_results, show_logs=False)
-    except ValueError as e:
-        status_placeholder.error(f"❌ Ошибка конфигурации: {e}")
-        st.session_state.is_running = False
-        return
-
-    if not results_data or not results_data.get('items'):
-        status_placeholder.warning("⚠️ Результаты поиска не найдены.")
-        st.session_state.is_running = False
-        return
-
-    links_count = len(results_data['items'])
-    status_placeholder.info(f"🔗 Найдено {links_count} ссылок. Читаю и анализирую контент...")
-
-    final_report_data = await parser.run_parser(results_data, query, show_logs=False)
-
-    st.session_state.report_data = final_report_data
-    status_placeholder.success(f"✅ Анализ {links_count} статей завершен!")
-    st.session_state.is_running = False
-
-async def run_daily_monitor():
-    st.session_state.is_running = True
-    st.session_state.report_data = [] # Очищаем старое
-
-    # Очистка AI результатов
-    if 'last_cross_check' in st.session_state: del st.session_state['last_cross_check']
-    if 'last_digest' in st.session_state: del st.session_state['last_digest']
+@st.cache_resource
+def get_renderer():
+    return ReportRenderer()
+
+renderer = get_renderer()
+
+@st.fragment(run_every=1)
+def pdf_pending(pdf_key: str):
+    # Фрагмент опрашивает фоновый рендер, не перезапуская весь скрипт. Когда отчет
+    # готов, один полный перезапуск рисует кнопку уже без опроса; пропавшая задача
+    # (рендер перезапущен, файл вытеснен из кеша) при полном перезапуске ставится заново
+    if renderer.status(pdf_key) in ("ready", "error", "missing"):
+        st.rerun()
+    st.info("⏳ PDF готовится в фоне...")
+
+def pdf_download(pdf_key: str):
+    state = renderer.status(pdf_key)
+    if state == "ready":
+        st.download_button(
+            label="📄 Скачать PDF отчет",
+            data=renderer.fetch(pdf_key),
+            file_name="investigation_report.pdf",
+            mime="application/pdf",
+            key=f"pdf_{pdf_key}"
+        )
+    elif state == "error":
+        st.warning(f"Не удалось создать PDF: {renderer.error(pdf_key)}")
+    else:
+        pdf_pending(pdf_key)
 
-    status_box = st.empty()
-    progress_bar = st.progress(0)
+@st.cache_resource
+def get_job_queue():
+    return JobQueue()
 
-    try:
-        status_box.info("📰 Читаю заголовки Google News...")
-        # Получаем топ-3 темы (можно изменить limit в trends_client.py или передать аргумент)
-        trends = TrendsClient().get_top_trends(limit=3)
+jobs = get_job_queue()
 
-        if not trends:
-            status_box.error("Не удалось получить тренды.")
-            st.session_state.is_running = False
-            return
+@st.cache_resource
+def start_job_workers():
+    # Под голым `streamlit run web_app.py` задачи иначе так и остались бы в очереди
+    if JOB_WORKERS_EXTERNAL:
+        return []
+    workers = start_worker_processes(JOB_WORKERS)
+    atexit.register(lambda: [worker.terminate() for worker in workers])
+    return workers
 
-        all_articles = []
-        search_client = SearchClient(API_KEY, SEARCH_ENGINE_ID)
+start_job_workers()
 
-        for i, topic in enumerate(trends):
-            status_box.info(f"🕵️ Анализирую тему ({i+1}/{len(trends)}): **{topic}**")
+@st.cache_resource
+def start_metrics():
+    # Streamlit перезапускает скрипт на каждое действие: сервер поднимается один раз на процесс
+    return telemetry.start_metrics_server(WEB_METRICS_PORT)
 
-            # Ищем по 2 статьи на каждую тему
-            results = search_client.search(topic, num_results=2, show_logs=False)
+start_metrics()
 
-            if results and results.get('items'):
-                parsed = await parser.run_parser(results, topic, show_logs=False)
-                # Добавляем пометку о теме, чтобы потом было понятно
-                for item in parsed:
-                    item['query_topic'] = topic
-                all_articles.extend(parsed)
+@st.cache_resource
+def get_dashboard_cache():
+    # Один кеш на процесс: общий для всех сессий, сбрасывается при записи в базу
+    return VersionedCache()
 
-            # Обновляем прогресс
-            progress_bar.progress((i + 1) / len(trends))
+dashboard_cache = get_dashboard_cache()
+db_version = db.get_change_version()
 
-        st.session_state.report_data = all_articles
-        status_box.success(f"✅ Готово! Собрано статей: {len(all_articles)}")
+def start_job(kind, query=None, num_results=None):
+    # Сам пайплайн выполняет job_worker.py, здесь задача только ставится в очередь
+    st.session_state.report_data = None
+    st.session_state.job_message = None
+    if 'last_cross_check' in st.session_state:
+        del st.session_state['last_cross_check']
+    if 'last_digest' in st.session_state:
+        del st.session_state['last_digest']
 
-    except Exception as e:
-        status_box.error(f"Ошибка мониторинга: {e}")
+    st.session_state.job_id = jobs.submit(kind, query, num_results)
+    st.session_state.is_running = True
+    st.rerun()
 
+def finish_job(report_data=None, message=None):
+    st.session_state.job_id = None
     st.session_state.is_running = False
+    st.session_state.report_data = report_data
+    st.session_state.job_message = message
+    st.rerun()
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_status():
+    job_id = st.session_state.get('job_id')
+    if not job_id:
+        message = st.session_state.get('job_message')
+        if message and message.startswith("✅"):
+            st.success(message)
+        elif message:
+            st.warning(message)
+        return
+
+    job = jobs.get(job_id)
+    if job is None:
+        finish_job(message="⚠️ Задача не найдена.")
+    elif job['status'] == "done":
+        finish_job(job['result'], job['progress'])
+    elif job['status'] == "failed":
+        finish_job(message=f"❌ Ошибка: {job['error']}")
+    else:
+        st.info(job['progress'] or "В очереди...")
+        st.progress(job['progress_value'] / 100)
 
 # === ИНИЦИАЛИЗАЦИЯ SESSION STATE ===
 if 'is_running' not in st.session_state:
     st.session_state.is_running = False
 if 'report_data' not in st.session_state:
     st.session_state.report_data = None
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
 
 # ==========================================
 #                  SIDEBAR
@@ -132,15 +158,7 @@ with st.sidebar:
 
     if st.button("🚀 Начать Анализ", disabled=st.session_state.is_running, type="primary", use_container_width=True):
         if search_query:
-            try:
-                # Запуск асинхронной функции в Streamlit
-                asyncio.run(run_search_process(search_query, num_results))
-            except RuntimeError:
-                # Fallback для сложных event loops
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(run_search_process(search_query, num_results))
-                loop.close()
+            start_job("search", search_query, num_results)
         else:
             st.warning("Введите запрос.")
 
@@ -149,17 +167,11 @@ with st.sidebar:
     st.caption("Автоматический сбор главных новостей за 24 часа.")
 
     if st.button("🌍 Картина дня (UA)", disabled=st.session_state.is_running, use_container_width=True):
-        try:
-            asyncio.run(run_daily_monitor())
-            st.rerun()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(run_daily_monitor())
-            loop.close()
-            st.rerun()
+        start_job("monitor")
+
+    job_status()
     st.subheader("📊 Статистика Базы")
-    stats = db.get_stats()
+    stats = dashboard_cache.get('stats', db_version, db.get_stats)
     col1, col2 = st.columns(2)
     col1.metric("Всего", stats['total'])
     col2.metric("Доверенные", stats['trusted'])
@@ -229,17 +241,12 @@ if st.session_state.report_data:
                 col_pdf, _ = st.columns([1, 3])
                 with col_pdf:
                     try:
-                        pdf_bytes = create_pdf(
+                        pdf_key = renderer.submit(
                             query=search_query,
                             articles=st.session_state.get('report_data'),
                             cross_check_text=st.session_state['last_cross_check']
                         )
-                        st.download_button(
-                            label="📄 Скачать PDF отчет",
-                            data=pdf_bytes,
-                            file_name="investigation_report.pdf",
-                            mime="application/pdf"
-                        )
+                        pdf_download(pdf_key)
                     except Exception as e:
                         st.warning(f"Не удалось создать PDF: {e}")
 
@@ -269,19 +276,18 @@ if st.session_state.report_data:
                 if not current_data:
                     st.error("Нет данных.")
                 else:
-                    with st.spinner(f"🔪 Вырезаю лишнее (Цинизм: {cynicism}%)..."):
-                        try:
-                            loop = asyncio.new_event_loop()
-                            asyncio.set_event_loop(loop)
-                            digest_res = loop.run_until_complete(
-                                digest_generator.generate_cynical_digest(current_data, cynicism)
+                    st.caption(f"🔪 Вырезаю лишнее (Цинизм: {cynicism}%)...")
+                    try:
+                        with st.container(border=True):
+                            # Текст появляется по мере генерации; выжимки статей берутся из кеша
+                            digest_res = st.write_stream(
+                                digest_generator.iter_cynical_digest(current_data, cynicism)
                             )
-                            loop.close()
-                            st.session_state['last_digest'] = digest_res
-                        except Exception as e:
-                            st.error(f"Ошибка: {e}")
+                        st.session_state['last_digest'] = digest_res
+                    except Exception as e:
+                        st.error(f"Ошибка: {e}")
 
-            if 'last_digest' in st.session_state:
+            elif 'last_digest' in st.session_state:
                 st.success("Дайджест сформирован!")
                 with st.container(border=True):
                     st.markdown(st.session_state['last_digest'])
@@ -289,53 +295,53 @@ if st.session_state.report_data:
 st.divider()
 st.subheader("📚 Архив расследований")
 
-df_history = db.get_all_articles_df()
+df_history = dashboard_cache.get('history', db_version, lambda: load_history(db))
+
+def build_rating_pie():
+    return px.pie(
+        rating_counts(df_history), values='Кол-во', names='Источник',
+        title='Репутация источников в базе', hole=0.4,
+        color='Источник',
+        color_discrete_map={
+            'Высокое доверие': '#28a745',
+            'Низкое доверие / Пропаганда': '#dc3545',
+            'Платформа': '#ffc107',
+            'Неизвестен': '#6c757d'
+        }
+    )
 
-if not df_history.empty:
-    df_history['clean_rating'] = df_history['rating'].astype(str).apply(
-        lambda x: x.split('|')[0].replace('Рейтинг:', '').split('(')[0].strip()
+def build_date_bar():
+    counts = date_counts(df_history)
+    if counts.empty:
+        return None
+    return px.bar(
+        counts, x='Дата', y='Статей',
+        title='Динамика публикаций',
+        color_discrete_sequence=['#3498db']
     )
-    df_history['published_date'] = pd.to_datetime(df_history['published_date'], errors='coerce', utc=True)
-    df_history['date_parsed'] = df_history['published_date'].dt.date
 
+if not df_history.empty:
     tab_chart, tab_data = st.tabs(["📈 Визуализация", "📋 Таблица данных"])
 
     with tab_chart:
         col1, col2 = st.columns(2)
         with col1:
-            rating_counts = df_history['clean_rating'].value_counts().reset_index()
-            rating_counts.columns = ['Источник', 'Кол-во']
-            fig_pie = px.pie(
-                rating_counts, values='Кол-во', names='Источник',
-                title='Репутация источников в базе', hole=0.4,
-                color='Источник',
-                color_discrete_map={
-                    'Высокое доверие': '#28a745',
-                    'Низкое доверие / Пропаганда': '#dc3545',
-                    'Платформа': '#ffc107',
-                    'Неизвестен': '#6c757d'
-                }
-            )
+            fig_pie = dashboard_cache.get('fig_pie', db_version, build_rating_pie)
             st.plotly_chart(fig_pie, use_container_width=True)
 
         with col2:
-            valid_dates = df_history.dropna(subset=['date_parsed'])
-            if not valid_dates.empty:
-                date_counts = valid_dates['date_parsed'].value_counts().reset_index()
-                date_counts.columns = ['Дата', 'Статей']
-                date_counts = date_counts.sort_values('Дата')
-                fig_bar = px.bar(
-                    date_counts, x='Дата', y='Статей',
-                    title='Динамика публикаций',
-                    color_discrete_sequence=['#3498db']
-                )
+            fig_bar = dashboard_cache.get('fig_bar', db_version, build_date_bar)
+            if fig_bar is not None:
                 st.plotly_chart(fig_bar, use_container_width=True)
             else:
                 st.info("Недостаточно данных с датами для графика.")
 
     with tab_data:
         st.dataframe(
-            df_history.style.map(color_rating, subset=['rating']),
+            dashboard_cache.get(
+                'styled_history', db_version,
+                lambda: df_history.style.map(color_rating, subset=['rating'])
+            ),
             use_container_width=True,
             column_config={
                 "url": st.column_config.LinkColumn("URL", display_text="🔗"),